@@ -5,24 +5,52 @@ Caddyfile 可视化编辑器 - Flask后端
 """
 
 import os
+import re
+import copy
+import glob
 import json
+import gzip
+import time
+import hmac
+import hashlib
+import secrets
+import tempfile
+import threading
 import subprocess
 import yaml
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g, url_for, send_file, has_request_context
 from flask_cors import CORS
-from functools import wraps
+from functools import wraps, lru_cache
 from dotenv import load_dotenv, find_dotenv
-from caddyfile_parser import parse_caddyfile, generate_caddyfile, format_caddyfile
+from caddyfile_parser import parse_caddyfile, generate_caddyfile, format_caddyfile, splice_site_block
+from caddyfile_patch import patch_caddyfile
+from site_index import SiteIndex, SearchIndex
+from backup_store import BackupStore, parse_retention_policy, select_retained
+from caddyfile_diff import build_tree, diff_documents
+from selector import compile_query, SelectorError
+from bulk_edit import compile_operations, apply_operations, summarize as summarize_bulk_edit
+from file_watcher import FileWatcher, file_signature, has_glob_magic
+from static_assets import AssetManifest
+from caddy_fleet import Fleet
+from caddy_incremental import IncrementalApplier
+from config_reload import IMPORT_RE, ReloadCoordinator, absolutize_imports, resolve_imports, semantic_hash
+from document_manager import DocumentManager, ManagedDocument, is_valid_document_name
+from redis_storage import RedisDocumentStore, RedisBackupStore
+from redis_coordination import RedisLease, RevisionChannel, LockTimeout
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, size_class
 
-# 尝试导入Redis（可选）
+# 尝试导入Brotli（可选，未安装时仅使用gzip压缩）
 try:
-    import redis
-    REDIS_AVAILABLE = True
+    import brotli
+    BROTLI_AVAILABLE = True
 except ImportError:
-    REDIS_AVAILABLE = False
-    redis = None
+    BROTLI_AVAILABLE = False
+    brotli = None
 
 load_dotenv(find_dotenv())
 
@@ -37,6 +65,12 @@ SYSTEM_DIRECTIVES_CONFIG_FILE = os.getenv('SYSTEM_DIRECTIVES_CONFIG_FILE', 'conf
 CUSTOM_DIRECTIVES_CONFIG_FILE = os.getenv('CUSTOM_DIRECTIVES_CONFIG_FILE', 'config/custom_directives.yaml')  # 用户配置（不提交到git）
 # 注意：HTTP头配置现在从directives.yaml中的header指令读取，不再使用单独的headers.yaml文件
 
+# 多文档（如每个租户一个Caddyfile）：请求通过 ?doc=<name> 或 X-Caddyfile-Document 请求头选择文档
+DEFAULT_DOCUMENT = 'default'  # 默认文档，即 CADDYFILE_PATH
+CADDYFILE_DOCUMENTS = os.getenv('CADDYFILE_DOCUMENTS', '')  # 其他文档: name=path，逗号分隔
+CADDYFILE_DOCUMENTS_DIR = os.getenv('CADDYFILE_DOCUMENTS_DIR', None)  # <目录>/<name>/Caddyfile 按需注册为文档
+DOCUMENT_CACHE_BUDGET_MB = float(os.getenv('DOCUMENT_CACHE_BUDGET_MB', 256))  # 所有文档解析/索引缓存的内存预算（MB）
+
 # 用户配置存储方式：'local' 或 'redis'
 CUSTOM_CONFIG_STORAGE = os.getenv('CUSTOM_CONFIG_STORAGE', 'local')
 
@@ -47,19 +81,160 @@ REDIS_DB = int(os.getenv('REDIS_DB', 0))
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
 REDIS_KEY_PREFIX = os.getenv('REDIS_KEY_PREFIX', 'caddyfile:directives:')
 
+# 多副本协调：通过Redis租约锁串行化保存/恢复，并用版本计数器通知其他副本
+REDIS_COORDINATION = os.getenv('REDIS_COORDINATION', 'false').lower() == 'true'
+REDIS_COORDINATION_PREFIX = os.getenv('REDIS_COORDINATION_PREFIX', 'caddyfile:')
+SAVE_LOCK_TTL = int(os.getenv('SAVE_LOCK_TTL', 30))  # 保存锁的租约时间（秒），持有者异常退出后自动释放
+SAVE_LOCK_TIMEOUT = float(os.getenv('SAVE_LOCK_TIMEOUT', 10))  # 等待保存锁的最长时间（秒）
+
+# Caddyfile和备份的存储方式：'file'（本地文件）或 'redis'（压缩后保存在Redis中，多副本共享）
+# 使用Redis时 CADDYFILE_PATH 只在校验/重载前写出，供 caddy 命令读取
+CADDYFILE_STORAGE = os.getenv('CADDYFILE_STORAGE', 'file')
+REDIS_STORAGE_PREFIX = os.getenv('REDIS_STORAGE_PREFIX', 'caddyfile:store:')
+
 # 认证配置
 AUTH_TOKEN = os.getenv('AUTH_TOKEN', None)
 
 # 备份配置
 BACKUP_DIR = os.getenv('BACKUP_DIR', None)  # 如果未设置，使用 Caddyfile 所在目录的 backups 子目录
-MAX_BACKUPS = int(os.getenv('MAX_BACKUPS', 30))  # 最多保留的备份数量
+MAX_BACKUPS = int(os.getenv('MAX_BACKUPS')) if os.getenv('MAX_BACKUPS') else None  # 备份数量上限，未设置时只按保留策略清理
+BACKUP_SNAPSHOT_INTERVAL = int(os.getenv('BACKUP_SNAPSHOT_INTERVAL', 20))  # 每隔多少个增量版本保存一次完整快照
+# 分级保留策略：最近1小时全部保留，1天内每小时保留一个，30天内每天保留一个
+BACKUP_RETENTION = os.getenv('BACKUP_RETENTION', '1h:all,1d:1h,30d:1d')
+BACKUP_RETENTION_INTERVAL = int(os.getenv('BACKUP_RETENTION_INTERVAL', 300))  # 后台清理间隔（秒）
+
+# 文件监听配置（检测其他程序对 Caddyfile 及其 import 文件的修改）
+WATCH_CADDYFILE = os.getenv('WATCH_CADDYFILE', 'true').lower() == 'true'
+WATCH_POLL_INTERVAL = float(os.getenv('WATCH_POLL_INTERVAL', 2))  # 不支持inotify时的轮询间隔（秒）
+
+# 服务器推送（SSE）配置
+EVENT_BUFFER_SIZE = int(os.getenv('EVENT_BUFFER_SIZE', 256))  # 保留的最近事件数量（断线重连后补发）
+SSE_HEARTBEAT_INTERVAL = int(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))  # 心跳间隔（秒）
+SSE_TICKET_TTL = int(os.getenv('SSE_TICKET_TTL', 60))  # 服务器推送连接票据的有效期（秒）
+
+# 请求性能分析配置（请求头 X-Profile 或查询参数 profile 等于 PROFILE_TOKEN 时对该请求进行性能分析）
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', None)  # 未设置时不启用
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')  # 分析结果（.pstats）保存目录
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))  # 最多保留的分析结果数量
+
+# 集群配置：多个 Caddy admin 端点（逗号分隔，如 http://10.0.0.1:2019,http://10.0.0.2:2019），通过 /load 并发推送配置
+CADDY_FLEET_NODES = [node.strip() for node in os.getenv('CADDY_FLEET_NODES', '').split(',') if node.strip()]
+FLEET_TIMEOUT = float(os.getenv('FLEET_TIMEOUT', 10))  # 单个节点的超时时间（秒）
+FLEET_MAX_WORKERS = int(os.getenv('FLEET_MAX_WORKERS', 16))  # 并发推送的最大线程数
+FLEET_CANARY = int(os.getenv('FLEET_CANARY', 0))  # 默认的金丝雀节点数量（先推送，成功后再推送其余节点）
+
+# 重载配置：时间窗口内的多个重载请求合并为一次执行（秒，0 表示不合并）
+RELOAD_DEBOUNCE_SECONDS = float(os.getenv('RELOAD_DEBOUNCE_SECONDS', 0.5))
+# 设置 Caddy admin 地址（如 http://localhost:2019）后，重载时用 caddy adapt 生成JSON，只通过 admin API 写入变化的部分
+CADDY_ADMIN_URL = os.getenv('CADDY_ADMIN_URL', '').strip()
+INCREMENTAL_MAX_RATIO = float(os.getenv('INCREMENTAL_MAX_RATIO', 0.5))  # 变更的子树超过完整配置的该比例时完整加载
+
+# 静态资源指纹配置（启动时为静态文件生成带内容哈希的URL并预压缩，浏览器可永久缓存）
+ASSET_FINGERPRINT = os.getenv('ASSET_FINGERPRINT', 'true').lower() == 'true'
+ASSET_MAX_AGE = 365 * 24 * 3600  # 带指纹资源的缓存时间（秒）
+
+# 监控指标配置（Prometheus 格式，GET /metrics）
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# 响应压缩配置
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # 小于该字节数的响应不压缩
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip压缩级别（1-9）
+COMPRESS_CACHE_SIZE = int(os.getenv('COMPRESS_CACHE_SIZE', 32))  # 缓存的压缩结果数量
+COMPRESS_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+}
+
+# 监控指标
+metrics = Registry()
+http_request_duration = metrics.histogram(
+    'caddyfile_http_request_duration_seconds', '按路由统计的请求耗时', ('route', 'method', 'status'))
+document_duration = metrics.histogram(
+    'caddyfile_document_duration_seconds', 'Caddyfile 解析/生成/格式化耗时（按文档大小分级）', ('operation', 'size'))
+caddy_command_duration = metrics.histogram(
+    'caddyfile_caddy_command_duration_seconds', 'caddy 子进程耗时', ('command',), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+caddy_command_total = metrics.counter(
+    'caddyfile_caddy_command_total', 'caddy 子进程执行次数（按退出码）', ('command', 'exit_code'))
+fleet_push_duration = metrics.histogram(
+    'caddyfile_fleet_push_duration_seconds', '向集群节点推送配置的耗时', ('node', 'result'))
+backup_duration = metrics.histogram(
+    'caddyfile_backup_duration_seconds', '创建备份的耗时')
+cache_requests = metrics.counter(
+    'caddyfile_cache_requests_total', '缓存访问次数（hit/miss）', ('cache', 'result'))
+reload_requests = metrics.counter(
+    'caddyfile_reload_requests_total', '重载请求次数（reloaded/unchanged/coalesced/error）', ('result',))
+incremental_apply_total = metrics.counter(
+    'caddyfile_incremental_apply_total', '通过 admin API 应用配置的次数（unchanged/incremental/load/error）', ('mode',))
+
+def instrument_document_operation(operation: str, func):
+    """记录 Caddyfile 解析/生成函数的耗时，按文档大小分级（解析和格式化按输入大小，生成按输出大小）"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        text = result if isinstance(result, str) else (args[0] if args else '')
+        document_duration.observe(time.perf_counter() - started, operation, size_class(len(text)))
+        return result
+    return wrapper
+
+parse_caddyfile = instrument_document_operation('parse', parse_caddyfile)
+generate_caddyfile = instrument_document_operation('generate', generate_caddyfile)
+format_caddyfile = instrument_document_operation('format', format_caddyfile)
+patch_caddyfile = instrument_document_operation('patch', patch_caddyfile)
+
+def run_caddy(command: str, args, **kwargs):
+    """执行 caddy 子命令并记录耗时和退出码"""
+    started = time.perf_counter()
+    exit_code = 'error'
+    try:
+        result = subprocess.run([CADDY_BINARY, command] + list(args), **kwargs)
+        exit_code = str(result.returncode)
+        return result
+    except subprocess.TimeoutExpired:
+        exit_code = 'timeout'
+        raise
+    except FileNotFoundError:
+        exit_code = 'not_found'
+        raise
+    finally:
+        caddy_command_duration.observe(time.perf_counter() - started, command)
+        caddy_command_total.inc(command, exit_code)
+
+# 优先使用 libyaml 的C实现（未编译时退回纯Python实现）
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_yaml_cache = {}  # path -> (文件签名, 解析结果)
+_yaml_cache_lock = threading.Lock()
+
+def load_yaml_file(path: str) -> dict:
+    """
+    读取YAML文件，文件未变化时复用上次的解析结果
+    
+    返回解析结果的副本，调用方可以修改；文件不存在时返回空字典
+    """
+    signature = file_signature(path)
+    if signature is None:
+        return {}
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(path)
+    if cached is None or cached[0] != signature:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=YAML_LOADER) or {}
+        cached = (signature, data)
+        with _yaml_cache_lock:
+            _yaml_cache[path] = cached
+    return copy.deepcopy(cached[1])
 
 def load_config():
     """加载配置文件"""
     if os.path.exists(CONFIG_FILE):
         try:
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
+                return yaml.load(f, Loader=YAML_LOADER) or {}
         except Exception as e:
             print(f'加载配置文件失败: {e}')
             return {}
@@ -75,9 +250,39 @@ def save_config(config):
         print(f'保存配置文件失败: {e}')
         return False
 
+_redis_client = None
+_redis_binary_client = None
+
+def import_redis():
+    """按需导入redis（只有配置使用Redis时才导入，减少启动时间），未安装时返回 None"""
+    try:
+        import redis
+        return redis
+    except ImportError:
+        return None
+
 def get_redis_client():
-    """获取Redis客户端"""
-    if not REDIS_AVAILABLE or CUSTOM_CONFIG_STORAGE != 'redis':
+    """获取Redis客户端（复用同一个连接池）"""
+    global _redis_client
+    if CUSTOM_CONFIG_STORAGE != 'redis' and not REDIS_COORDINATION:
+        return None
+    if _redis_client is None:
+        _redis_client = create_redis_client(decode_responses=True)
+    return _redis_client
+
+def get_redis_binary_client():
+    """获取不解码响应的Redis客户端（Caddyfile存储，保存压缩后的二进制数据）"""
+    global _redis_binary_client
+    if CADDYFILE_STORAGE != 'redis':
+        return None
+    if _redis_binary_client is None:
+        _redis_binary_client = create_redis_client(decode_responses=False)
+    return _redis_binary_client
+
+def create_redis_client(decode_responses: bool):
+    """创建Redis客户端，未安装redis或连接参数错误时返回 None"""
+    redis = import_redis()
+    if redis is None:
         return None
     try:
         return redis.Redis(
@@ -85,7 +290,7 @@ def get_redis_client():
             port=REDIS_PORT,
             db=REDIS_DB,
             password=REDIS_PASSWORD,
-            decode_responses=True
+            decode_responses=decode_responses
         )
     except Exception as e:
         print(f'连接Redis失败: {e}')
@@ -100,9 +305,7 @@ def load_system_directives_config():
     
     if os.path.exists(SYSTEM_DIRECTIVES_CONFIG_FILE):
         try:
-            with open(SYSTEM_DIRECTIVES_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f) or {}
-                return data.get('directives', {})
+            return load_yaml_file(SYSTEM_DIRECTIVES_CONFIG_FILE).get('directives', {})
         except Exception as e:
             print(f'加载系统指令配置失败: {e}')
             return {}
@@ -123,9 +326,7 @@ def load_custom_directives_from_local():
         return {}
     
     try:
-        with open(CUSTOM_DIRECTIVES_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f) or {}
-            return data.get('directives', {})
+        return load_yaml_file(CUSTOM_DIRECTIVES_CONFIG_FILE).get('directives', {})
     except Exception as e:
         print(f'加载用户指令配置失败: {e}')
         return {}
@@ -149,9 +350,12 @@ def load_custom_directives_from_redis():
 def save_custom_directives_config(custom_config):
     """保存用户自定义指令配置"""
     if CUSTOM_CONFIG_STORAGE == 'redis':
-        return save_custom_directives_to_redis(custom_config)
+        saved = save_custom_directives_to_redis(custom_config)
     else:
-        return save_custom_directives_to_local(custom_config)
+        saved = save_custom_directives_to_local(custom_config)
+    # 指令配置变化后，缓存的指令接口响应失效
+    invalidate_response_cache()
+    return saved
 
 def save_custom_directives_to_local(custom_config):
     """保存用户配置到本地文件"""
@@ -177,7 +381,11 @@ def save_custom_directives_to_redis(custom_config):
     
     try:
         key = f"{REDIS_KEY_PREFIX}custom"
-        client.set(key, json.dumps(custom_config, ensure_ascii=False))
+        with client.pipeline() as pipe:
+            pipe.set(key, json.dumps(custom_config, ensure_ascii=False))
+            # 配置版本号，其他副本据此使缓存的指令接口响应失效
+            pipe.incr(f"{key}:revision")
+            pipe.execute()
         return True
     except Exception as e:
         print(f'保存用户指令配置到Redis失败: {e}')
@@ -245,13 +453,665 @@ def load_headers_config():
         print(f'加载HTTP头配置失败: {e}')
         return []
 
+# 只读接口的响应缓存：保存序列化后的JSON和ETag，配置变化时失效
+RESPONSE_CACHE_SIZE = 256
+_response_cache = OrderedDict()  # (endpoint, 路由参数) -> (版本, 响应内容, ETag)
+_response_cache_state = {'generation': 0}
+_response_cache_lock = threading.Lock()
+
+def invalidate_response_cache():
+    """使所有缓存的响应失效（保存用户指令配置后调用）"""
+    with _response_cache_lock:
+        _response_cache_state['generation'] += 1
+        _response_cache.clear()
+
+def custom_directives_redis_revision():
+    """Redis中用户指令配置的版本号（任意副本保存时递增），Redis不可用时返回 None"""
+    client = get_redis_client()
+    if not client:
+        return None
+    try:
+        return client.get(f"{REDIS_KEY_PREFIX}custom:revision")
+    except Exception as e:
+        print(f'读取Redis用户指令配置版本失败: {e}')
+        return None
+
+def directives_cache_version():
+    """
+    指令配置的版本：显式失效次数 + 系统配置文件签名 + 用户配置的版本
+    （本地存储时为配置文件签名，可以发现直接修改配置文件的情况；Redis存储时为Redis中的版本号，可以发现其他副本的修改）
+    """
+    if CUSTOM_CONFIG_STORAGE == 'redis':
+        custom_version = ('redis', custom_directives_redis_revision())
+    else:
+        custom_version = file_signature(CUSTOM_DIRECTIVES_CONFIG_FILE)
+    return (
+        _response_cache_state['generation'],
+        file_signature(SYSTEM_DIRECTIVES_CONFIG_FILE),
+        custom_version
+    )
+
+def cached_json_response(version_func=None):
+    """
+    缓存接口的JSON响应（只缓存200响应）
+    
+    version_func 返回的版本变化时重新生成；客户端携带 If-None-Match 且内容未变化时返回 304
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())))
+            version = version_func() if version_func else None
+            with _response_cache_lock:
+                entry = _response_cache.get(key)
+                if entry is not None and entry[0] == version:
+                    _response_cache.move_to_end(key)
+                    cache_requests.inc('response', 'hit')
+                else:
+                    entry = None
+            
+            if entry is None:
+                cache_requests.inc('response', 'miss')
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or not response.is_json:
+                    return response
+                body = response.get_data()
+                entry = (version, body, hashlib.sha1(body).hexdigest()[:16])
+                with _response_cache_lock:
+                    _response_cache[key] = entry
+                    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                        _response_cache.popitem(last=False)
+            
+            _, body, etag = entry
+            # no-cache: 浏览器每次都会带上 ETag 重新验证，内容未变化时只返回 304
+            # 响应之后可能被 compress_response 压缩，同一个标签对应多种编码，因此使用弱 ETag
+            headers = {'ETag': f'W/"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+            if request.if_none_match.contains_weak(etag):
+                return Response(status=304, headers=headers)
+            return Response(body, mimetype='application/json', headers=headers)
+        return decorated_function
+    return decorator
+
+# 命名文档：每个文档有自己的路径、备份目录和解析/索引/搜索缓存，所有文档的缓存共享内存预算
+document_manager = DocumentManager(int(DOCUMENT_CACHE_BUDGET_MB * 1024 * 1024))
+
+def get_backup_dir(source_path: str) -> str:
+    """获取备份目录（未设置 BACKUP_DIR 时使用源文件所在目录的 backups 子目录）"""
+    if BACKUP_DIR:
+        return BACKUP_DIR
+    return os.path.join(os.path.dirname(source_path), 'backups')
+
+def register_document(name: str, path: str) -> ManagedDocument:
+    """注册文档；设置了 BACKUP_DIR 时其他文档的备份保存在 BACKUP_DIR/<name> 中"""
+    if BACKUP_DIR and name != DEFAULT_DOCUMENT:
+        backup_dir = os.path.join(BACKUP_DIR, name)
+    else:
+        backup_dir = get_backup_dir(path)
+    return document_manager.register(name, path, backup_dir)
+
+def register_configured_documents():
+    """注册默认文档和 CADDYFILE_DOCUMENTS 中配置的文档"""
+    register_document(DEFAULT_DOCUMENT, CADDYFILE_PATH)
+    for item in CADDYFILE_DOCUMENTS.split(','):
+        name, _, path = item.strip().partition('=')
+        name, path = name.strip(), path.strip()
+        if not name or not path:
+            continue
+        if not is_valid_document_name(name):
+            print(f'忽略无效的文档名称: {name}')
+            continue
+        register_document(name, path)
+
+register_configured_documents()
+
+def resolve_document(name: str, create: bool = False) -> Optional[ManagedDocument]:
+    """
+    按名称查找文档
+    
+    设置了 CADDYFILE_DOCUMENTS_DIR 时，<目录>/<name>/Caddyfile 按需注册为文档；
+    create 为 False 时只注册已存在的文档（避免任意名称的请求不断注册新文档）
+    """
+    entry = document_manager.get(name)
+    if entry is not None or not CADDYFILE_DOCUMENTS_DIR or not is_valid_document_name(name):
+        return entry
+    path = os.path.join(CADDYFILE_DOCUMENTS_DIR, name, 'Caddyfile')
+    if not create:
+        if CADDYFILE_STORAGE == 'redis':
+            client = get_redis_binary_client()
+            exists = client is not None and RedisDocumentStore(client, document_storage_prefix(name)).revision() is not None
+        else:
+            exists = os.path.exists(path)
+        if not exists:
+            return None
+    return register_document(name, path)
+
+def default_document() -> ManagedDocument:
+    return document_manager.get(DEFAULT_DOCUMENT)
+
+def current_document_entry() -> ManagedDocument:
+    """当前请求操作的文档（由 select_document 选择，请求之外为默认文档）"""
+    if has_request_context():
+        entry = g.get('managed_document')
+        if entry is not None:
+            return entry
+        if g.get('pending_document'):
+            # 指定的文档尚未创建（creates_document 之前），不能退回默认文档
+            raise RuntimeError(f"文档不存在: {g.pending_document}")
+    return default_document()
+
+def creates_document(f):
+    """
+    保存到不存在的文档时创建该文档（放在 require_auth 之后）
+    
+    select_document 只查找已存在的文档，未认证的请求不会注册文档或创建目录
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        name = g.get('pending_document')
+        if name:
+            entry = resolve_document(name, create=True)
+            if entry is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'文档不存在: {name}'
+                }), 404
+            g.managed_document = entry
+            g.pending_document = None
+        return f(*args, **kwargs)
+    decorated_function.creates_document = True
+    return decorated_function
+
+@app.before_request
+def select_document():
+    """按 ?doc= 参数或 X-Caddyfile-Document 请求头选择要操作的文档（未指定时为默认文档）"""
+    name = request.args.get('doc') or request.headers.get('X-Caddyfile-Document')
+    if not name:
+        return None
+    entry = resolve_document(name)
+    if entry is None:
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'creates_document', False) and CADDYFILE_DOCUMENTS_DIR and is_valid_document_name(name):
+            # 由接口在认证之后创建
+            g.pending_document = name
+            return None
+        return jsonify({
+            'success': False,
+            'error': f'文档不存在: {name}'
+        }), 404
+    g.managed_document = entry
+
+def get_cached_document(entry: ManagedDocument, key):
+    """缓存的解析结果（key 不一致时返回 None）"""
+    with entry.lock:
+        document = entry.document if entry.cache_key == key else None
+    if document is None:
+        cache_requests.inc('document', 'miss')
+        return None
+    cache_requests.inc('document', 'hit')
+    document_manager.touch(entry)
+    return document
+
+def cache_document(entry: ManagedDocument, key, document):
+    """缓存解析结果，超出内存预算时清除最久未使用的其他文档的缓存"""
+    with entry.lock:
+        entry.cache_key = key
+        entry.document = document
+        entry.derived = {}
+    document_manager.account(entry)
+
+def get_derived(document, name: str, build, entry: ManagedDocument = None):
+    """
+    文档的派生数据（站点索引、哈希树等），保存在文档条目的缓存中，不修改共享的解析结果；
+    不是条目当前缓存的版本（如备份、草稿）时每次重新计算
+    """
+    entry = entry or current_document_entry()
+    with entry.lock:
+        if entry.document is document and name in entry.derived:
+            return entry.derived[name]
+    value = build(document['sites'])
+    with entry.lock:
+        cached = entry.document is document
+        if cached:
+            value = entry.derived.setdefault(name, value)
+    if cached:
+        document_manager.account(entry)
+    return value
+
+def load_document(entry: ManagedDocument = None):
+    """
+    读取并解析Caddyfile（默认为当前请求的文档），文件未变化时复用缓存
+    
+    Returns:
+        {'content', 'sites', 'unparsed', 'revision'}，文件不存在时返回 None。
+        返回的数据在多个请求间共享，调用方不能修改。
+    """
+    entry = entry or current_document_entry()
+    if entry.name == DEFAULT_DOCUMENT:
+        start_file_watcher()
+        get_revision_channel()
+    if CADDYFILE_STORAGE == 'redis':
+        return load_redis_document(entry)
+    try:
+        stat = os.stat(entry.path)
+    except FileNotFoundError:
+        return None
+    
+    key = (stat.st_mtime_ns, stat.st_size)
+    document = get_cached_document(entry, key)
+    if document is not None:
+        return document
+    
+    with open(entry.path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    document = build_document(content)
+    cache_document(entry, key, document)
+    return document
+
+def document_storage_prefix(name: str) -> str:
+    """文档在Redis中的键前缀（默认文档沿用 REDIS_STORAGE_PREFIX）"""
+    if name == DEFAULT_DOCUMENT:
+        return REDIS_STORAGE_PREFIX
+    return f'{REDIS_STORAGE_PREFIX}doc:{name}:'
+
+_document_stores = {}
+
+def get_document_store(entry: ManagedDocument = None) -> Optional[RedisDocumentStore]:
+    """Redis中的Caddyfile（未使用Redis存储时返回 None）"""
+    entry = entry or current_document_entry()
+    store = _document_stores.get(entry.name)
+    if store is None:
+        client = get_redis_binary_client()
+        if client is None:
+            return None
+        store = _document_stores.setdefault(entry.name, RedisDocumentStore(client, document_storage_prefix(entry.name)))
+    return store
+
+def load_redis_document(entry: ManagedDocument):
+    """
+    从Redis读取Caddyfile
+    
+    每次只读取版本号（一次 HGET），版本未变化时直接使用本地缓存；
+    变化时连同解析结果一起读取，不需要在本副本重新解析
+    """
+    store = get_document_store(entry)
+    if store is None:
+        raise RuntimeError('Redis不可用，无法读取Caddyfile')
+    revision = store.revision()
+    if revision is None:
+        return seed_redis_document(store, entry)
+    
+    document = get_cached_document(entry, revision)
+    if document is not None:
+        return document
+    
+    stored = store.load()
+    if stored is None:
+        return None
+    if 'sites' in stored:
+        document = stored
+    else:
+        document = build_document(stored['content'])
+        document['revision'] = stored['revision']
+    cache_document(entry, document['revision'], document)
+    return document
+
+def seed_redis_document(store: RedisDocumentStore, entry: ManagedDocument):
+    """Redis中还没有Caddyfile时，导入本地文件（首次从文件存储切换到Redis）"""
+    try:
+        with open(entry.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    document = build_document(content)
+    store.save(content, document['revision'], document['sites'], document['unparsed'])
+    print(f'已将 {entry.path} 导入Redis')
+    return document
+
+_materialize_lock = threading.Lock()
+
+def materialize_caddyfile(entry: ManagedDocument = None):
+    """
+    使用Redis存储时，将当前版本写出到文档路径（caddy validate/reload 读取该文件）
+    
+    已写出的版本相同时不重复写入；先写临时文件再替换，caddy 不会读到写了一半的文件
+    """
+    if CADDYFILE_STORAGE != 'redis':
+        return
+    entry = entry or current_document_entry()
+    document = load_document(entry)
+    if document is None:
+        return
+    with _materialize_lock:
+        if entry.materialized_revision == document['revision'] and os.path.exists(entry.path):
+            return
+        caddyfile_dir = os.path.dirname(entry.path)
+        if caddyfile_dir:
+            os.makedirs(caddyfile_dir, exist_ok=True)
+        tmp_path = f'{entry.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(document['content'])
+        os.replace(tmp_path, entry.path)
+        entry.materialized_revision = document['revision']
+
+def build_document(content: str):
+    """解析内容并计算版本号"""
+    try:
+        result = parse_caddyfile(content, preserve_unparsed=True)
+        sites = result.get('sites', [])
+        unparsed = result.get('unparsed', [])
+    except Exception as e:
+        sites = []
+        unparsed = []
+    return {
+        'content': content,
+        'sites': sites,
+        'unparsed': unparsed,
+        'revision': hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+    }
+
+def get_site_index(document, entry: ManagedDocument = None) -> SiteIndex:
+    """获取文档的站点索引（每个版本只构建一次）"""
+    return get_derived(document, 'index', SiteIndex, entry)
+
+def get_document_tree(document, entry: ManagedDocument = None):
+    """获取文档的站点/指令哈希树（每个版本只计算一次）"""
+    return get_derived(document, 'tree', build_tree, entry)
+
+def search_document(document, q: str, limit: int, entry: ManagedDocument = None):
+    """在文档中全文搜索（每个文档一个全文索引，版本变化时按站点增量更新）"""
+    entry = entry or current_document_entry()
+    with entry.search_lock:
+        with entry.lock:
+            index = entry.search_index
+            if index is None:
+                index = entry.search_index = SearchIndex()
+                entry.search_revision = None
+            stale = entry.search_revision != document['revision']
+        if stale:
+            cache_requests.inc('search_index', 'miss')
+            index.update(document['sites'])
+            with entry.lock:
+                entry.search_revision = document['revision']
+            if entry.document is document:
+                document_manager.account(entry)
+        else:
+            cache_requests.inc('search_index', 'hit')
+        return index.search(q, limit)
+
+def invalidate_document_cache(entry: ManagedDocument = None):
+    """Caddyfile被修改后清除解析缓存"""
+    entry = entry or current_document_entry()
+    with entry.lock:
+        entry.cache_key = None
+        entry.document = None
+        entry.derived = {}
+        entry.size = 0
+    document_manager.forget(entry)
+
+def write_caddyfile(content: str, entry: ManagedDocument = None):
+    """
+    写入Caddyfile（全量覆盖）并刷新解析缓存
+    
+    文件监听、多副本版本通知和客户端推送只针对默认文档
+    """
+    entry = entry or current_document_entry()
+    if entry.write_lease is not None:
+        # 租约已过期并被其他副本获取时不再写入，避免覆盖对方的修改
+        entry.write_lease.ensure()
+    is_default = entry.name == DEFAULT_DOCUMENT
+    if is_default:
+        # 记录本程序写入的版本，文件监听据此区分外部修改
+        _file_status['written_revision'] = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        if _file_status['document'] is None:
+            _file_status['document'] = load_document(entry)
+    
+    if CADDYFILE_STORAGE == 'redis':
+        # 内容和解析结果一次写入Redis，其他副本读取时无需重新解析
+        store = get_document_store(entry)
+        if store is None:
+            raise RuntimeError('Redis不可用，无法保存Caddyfile')
+        document = build_document(content)
+        store.save(content, document['revision'], document['sites'], document['unparsed'])
+        cache_document(entry, document['revision'], document)
+    else:
+        caddyfile_dir = os.path.dirname(entry.path)
+        if caddyfile_dir and not os.path.exists(caddyfile_dir):
+            os.makedirs(caddyfile_dir, exist_ok=True)
+        with open(entry.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        invalidate_document_cache(entry)
+    
+    if not is_default:
+        return
+    
+    # 通知其他副本
+    channel = get_revision_channel()
+    if channel is not None:
+        try:
+            _file_status['revision_seq'] = channel.publish(_file_status['written_revision'])
+        except Exception as e:
+            print(f'发布版本通知失败: {e}')
+    
+    # 未启用文件监听时，直接在后台通知客户端
+    if _file_watcher is None:
+        threading.Thread(target=on_caddyfile_changed, args=([CADDYFILE_PATH],), daemon=True).start()
+
+# 文件监听状态
+_file_status = {
+    'written_revision': None,
+    'last_external_change': None,
+    'document': None,  # 最近一次通知客户端时的文档，用于计算变化的站点
+    'revision_seq': None  # 多副本协调时的全局版本号
+}
+_file_watcher = None
+_file_watcher_lock = threading.Lock()
+
+_revision_channel = None
+
+def get_revision_channel() -> Optional[RevisionChannel]:
+    """多副本协调的版本通道（未启用时返回 None），首次获取时开始订阅"""
+    global _revision_channel
+    if not REDIS_COORDINATION:
+        return None
+    if _revision_channel is None:
+        client = get_redis_client()
+        if client is None:
+            return None
+        with _file_watcher_lock:
+            if _revision_channel is None:
+                channel = RevisionChannel(client, REDIS_COORDINATION_PREFIX, on_revision=on_remote_revision)
+                _file_status['revision_seq'] = channel.current()
+                channel.start()
+                _revision_channel = channel
+    return _revision_channel
+
+def on_remote_revision(message):
+    """其他副本保存了新版本：立即丢弃本地缓存并预热、通知客户端，后续请求无需再检查文件"""
+    _file_status['revision_seq'] = message['seq']
+    previous = _file_status['document']
+    if previous is not None and previous.get('revision') == message['revision']:
+        return
+    invalidate_document_cache(default_document())
+    on_caddyfile_changed([CADDYFILE_PATH])
+
+@contextmanager
+def caddyfile_write_lock():
+    """
+    保存/恢复Caddyfile时持有的锁
+    
+    本进程内使用线程锁；启用多副本协调时再获取Redis租约锁，等待锁释放的消息而不是轮询。
+    租约在持有期间自动续约，写入前再确认锁仍属于本副本（write_caddyfile）。
+    每个文档有各自的锁，不同文档的保存互不阻塞
+    """
+    entry = current_document_entry()
+    with entry.write_lock:
+        client = get_redis_client() if REDIS_COORDINATION else None
+        if client is None:
+            yield
+            return
+        lock_name = f'{REDIS_COORDINATION_PREFIX}lock:caddyfile'
+        if entry.name != DEFAULT_DOCUMENT:
+            lock_name = f'{lock_name}:{entry.name}'
+        lease = RedisLease(client, lock_name, SAVE_LOCK_TTL * 1000)
+        if not lease.acquire(SAVE_LOCK_TIMEOUT):
+            raise LockTimeout('其他副本正在保存Caddyfile，请稍后重试')
+        entry.write_lease = lease
+        try:
+            # 持有锁期间读取的文档必须是最新的（其他副本可能刚刚写入）
+            channel = get_revision_channel()
+            if channel is not None and channel.latest and channel.latest.get('replica') != channel.replica_id:
+                invalidate_document_cache(entry)
+            yield
+        finally:
+            entry.write_lease = None
+            lease.release()
+
+def serialize_writes(f):
+    """在保存锁内执行接口（读取-修改-写入整体串行）"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            with caddyfile_write_lock():
+                return f(*args, **kwargs)
+        except LockTimeout as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 503
+    return decorated_function
+
+def get_watch_patterns():
+    """需要监听的文件：Caddyfile 及其 import 的文件（支持通配符）"""
+    patterns = [CADDYFILE_PATH]
+    document = load_document(default_document())
+    if document:
+        base_dir = os.path.dirname(os.path.abspath(CADDYFILE_PATH))
+        for target in IMPORT_RE.findall(document['content']):
+            path = os.path.join(base_dir, target)
+            # import 的也可能是代码片段名称，只监听存在的文件或通配符
+            if os.path.isfile(path) or has_glob_magic(path):
+                patterns.append(path)
+    return patterns
+
+def on_caddyfile_changed(paths):
+    """文件被修改后在后台重新解析并预热缓存，下一个请求直接命中缓存，并通知已连接的客户端"""
+    entry = default_document()
+    document = load_document(entry)
+    if document:
+        get_site_index(document, entry)
+        get_document_tree(document, entry)
+        search_document(document, '', 0, entry)
+    
+    revision = document['revision'] if document else None
+    external = revision != _file_status['written_revision'] or paths != [CADDYFILE_PATH]
+    if external:
+        _file_status['last_external_change'] = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'paths': paths,
+            'revision': revision
+        }
+        print(f'检测到文件被外部修改: {", ".join(paths)}')
+        event_bus.publish('external_change', _file_status['last_external_change'])
+    
+    previous = _file_status['document']
+    _file_status['document'] = document
+    if previous is not None and previous.get('revision') == revision:
+        return
+    
+    # 只推送变化的站点地址，客户端按需获取站点详情
+    old = previous or build_document('')
+    new = document or build_document('')
+    delta = diff_documents(old, new, get_document_tree(old, entry), get_document_tree(new, entry))
+    event_bus.publish('revision', {
+        'revision': revision,
+        'previous_revision': old['revision'] if previous else None,
+        'external': external,
+        'summary': delta['summary'],
+        'sites': [{'address': site['address'], 'status': site['status']} for site in delta['sites']],
+        'unparsed_changed': delta['unparsed_changed']
+    })
+
+def start_file_watcher():
+    """启动文件监听线程（只启动一次）"""
+    global _file_watcher
+    if _file_watcher is not None or not WATCH_CADDYFILE or CADDYFILE_STORAGE == 'redis':
+        return
+    with _file_watcher_lock:
+        if _file_watcher is not None:
+            return
+        _file_watcher = FileWatcher(get_watch_patterns, on_caddyfile_changed, WATCH_POLL_INTERVAL)
+    _file_status['document'] = load_document(default_document())
+    _file_watcher.start()
+
+class EventBus:
+    """进程内事件总线，保留最近的事件以便SSE客户端断线重连后补发"""
+    
+    def __init__(self, size: int):
+        self._events = deque(maxlen=size)
+        self._next_id = 1
+        self._cond = threading.Condition()
+    
+    def publish(self, event_type: str, data) -> int:
+        """发布事件，返回事件ID"""
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append({'id': event_id, 'type': event_type, 'data': data})
+            self._cond.notify_all()
+        return event_id
+    
+    def last_id(self) -> int:
+        """最近一个事件的ID"""
+        with self._cond:
+            return self._next_id - 1
+    
+    def wait(self, last_id: int, timeout: float):
+        """等待并返回 last_id 之后的事件，超时返回空列表"""
+        with self._cond:
+            if self._next_id - 1 <= last_id:
+                self._cond.wait(timeout)
+            return [event for event in self._events if event['id'] > last_id]
+
+event_bus = EventBus(EVENT_BUFFER_SIZE)
+
+def publish_result(event_type: str):
+    """将接口的JSON结果作为事件推送给客户端（用于重载等任务，只用于需要认证的接口）"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = app.make_response(f(*args, **kwargs))
+            if response.is_json:
+                event_bus.publish(event_type, response.get_json())
+            return response
+        return decorated_function
+    return decorator
+
+def create_event_ticket() -> str:
+    """
+    生成服务器推送连接票据：到期时间.随机数.签名（以 AUTH_TOKEN 为密钥）
+    EventSource 无法设置请求头，用短期票据代替 token 放在URL中，票据不需要保存，任意副本都可以验证
+    """
+    payload = f'{int(time.time()) + SSE_TICKET_TTL}.{secrets.token_urlsafe(12)}'
+    signature = hmac.new(AUTH_TOKEN.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'{payload}.{signature}'
+
+def verify_event_ticket(ticket: str) -> bool:
+    """验证服务器推送连接票据的签名和有效期"""
+    try:
+        expires, nonce, signature = ticket.split('.')
+        expires = int(expires)
+    except ValueError:
+        return False
+    expected = hmac.new(AUTH_TOKEN.encode('utf-8'), f'{expires}.{nonce}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected) and time.time() <= expires
+
 def require_auth(f):
     """Token认证装饰器"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # 如果未设置AUTH_TOKEN，则不启用认证
         if not AUTH_TOKEN:
-            return f(*args, **kwargs)
+            return call_with_optional_profile(f, args, kwargs)
         
         # 从请求头获取token
         token = request.headers.get('Authorization', '')
@@ -267,38 +1127,179 @@ def require_auth(f):
                 'error': '未授权：需要有效的认证token'
             }), 401
         
-        return f(*args, **kwargs)
+        return call_with_optional_profile(f, args, kwargs)
     return decorated_function
 
-@app.route('/')
-def index():
-    """主页面"""
-    return render_template('index.html')
+PROFILE_ENDPOINTS = {'list_profiles', 'get_profile'}  # 查看分析结果的接口本身不做分析
+_profile_lock = threading.Lock()
 
-@app.route('/api/login', methods=['POST'])
-def login():
-    """登录接口，验证token"""
+def is_profile_admin() -> bool:
+    """请求是否携带了性能分析管理令牌"""
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(PROFILE_TOKEN) and value == PROFILE_TOKEN
+
+def call_with_optional_profile(f, args, kwargs):
+    """管理员请求开启分析时，使用 cProfile 运行接口并保存结果，否则直接调用"""
+    if not is_profile_admin() or request.endpoint in PROFILE_ENDPOINTS:
+        return f(*args, **kwargs)
+    # 同一时间只分析一个请求，避免多个分析器互相干扰
+    if not _profile_lock.acquire(blocking=False):
+        response = app.make_response(f(*args, **kwargs))
+        response.headers['X-Profile-Status'] = 'busy'
+        return response
+    
+    import cProfile
     try:
-        # 如果未设置AUTH_TOKEN，则不需要登录
-        if not AUTH_TOKEN:
-            return jsonify({
-                'success': True,
-                'message': '未启用认证'
-            })
-        
-        data = request.get_json()
-        token = data.get('token', '').strip()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        finally:
+            profiler.disable()
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
         
-        # 验证token
-        if not token or token != AUTH_TOKEN:
-            return jsonify({
-                'success': False,
-                'error': '无效的token'
-            }), 401
+        now = datetime.now()
+        name = f"{now.strftime('%Y%m%d_%H%M%S_%f')}_{request.endpoint}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f'{name}.pstats'))
+        with open(os.path.join(PROFILE_DIR, f'{name}.json'), 'w', encoding='utf-8') as meta:
+            json.dump({
+                'name': name,
+                'time': now.strftime('%Y-%m-%d %H:%M:%S'),
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': duration_ms
+            }, meta, ensure_ascii=False)
+        cleanup_old_profiles()
+        response.headers['X-Profile-Id'] = name
+        return response
+    finally:
+        _profile_lock.release()
+
+def list_profile_names():
+    """已保存的分析结果名称（从新到旧）"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((entry[:-len('.pstats')] for entry in os.listdir(PROFILE_DIR) if entry.endswith('.pstats')),
+                  reverse=True)
+
+def cleanup_old_profiles():
+    """只保留最近的 PROFILE_MAX_FILES 个分析结果"""
+    for name in list_profile_names()[PROFILE_MAX_FILES:]:
+        for ext in ('.pstats', '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name + ext))
+            except FileNotFoundError:
+                pass
+
+# 压缩结果缓存：键为（响应内容哈希, 编码），同一版本的内容只压缩一次
+_compress_cache = OrderedDict()
+_compress_cache_lock = threading.Lock()
+
+def compress_payload(data: bytes, encoding: str) -> bytes:
+    """
+    压缩响应内容，相同内容直接复用缓存的压缩结果
+    
+    Args:
+        data: 原始响应内容
+        encoding: 'gzip' 或 'br'
         
+    Returns:
+        压缩后的内容
+    """
+    key = (hashlib.sha1(data).hexdigest(), encoding)
+    with _compress_cache_lock:
+        cached = _compress_cache.get(key)
+        if cached is not None:
+            _compress_cache.move_to_end(key)
+            cache_requests.inc('compress', 'hit')
+            return cached
+    cache_requests.inc('compress', 'miss')
+    
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=5)
+    else:
+        # mtime=0 保证相同内容的压缩结果完全一致
+        compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+    
+    with _compress_cache_lock:
+        _compress_cache[key] = compressed
+        while len(_compress_cache) > COMPRESS_CACHE_SIZE:
+            _compress_cache.popitem(last=False)
+    return compressed
+
+def choose_response_encoding() -> Optional[str]:
+    """根据 Accept-Encoding 选择压缩编码，优先使用brotli"""
+    accept = request.accept_encodings
+    if BROTLI_AVAILABLE and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由记录请求耗时（流式响应只统计到开始输出）"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_duration.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    return response
+
+@app.after_request
+def compress_response(response):
+    """对较大的文本/JSON响应进行压缩（带强 ETag 的响应由生成方按编码处理，不再压缩）"""
+    etag, weak = response.get_etag()
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'Content-Encoding' in response.headers
+            or (etag and not weak)):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = choose_response_encoding()
+    if not encoding:
+        return response
+    
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.set_data(compress_payload(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/api/profiles', methods=['GET'])
+@require_auth
+def list_profiles():
+    """列出已保存的请求性能分析结果（需要性能分析管理令牌）"""
+    if not is_profile_admin():
+        return jsonify({
+            'success': False,
+            'error': '需要性能分析管理令牌'
+        }), 403
+    try:
+        profiles = []
+        for name in list_profile_names():
+            try:
+                with open(os.path.join(PROFILE_DIR, f'{name}.json'), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {'name': name}
+            meta['size'] = os.path.getsize(os.path.join(PROFILE_DIR, f'{name}.pstats'))
+            profiles.append(meta)
         return jsonify({
             'success': True,
-            'message': '登录成功'
+            'profiles': profiles
         })
     except Exception as e:
         return jsonify({
@@ -306,40 +1307,155 @@ def login():
             'error': str(e)
         }), 500
 
-@app.route('/api/caddyfile', methods=['GET'])
+@app.route('/api/profiles/<name>', methods=['GET'])
 @require_auth
-def get_caddyfile():
-    """获取当前Caddyfile内容"""
-    try:
-        format_mode = request.args.get('format', 'false').lower() == 'true'
-        
-        if os.path.exists(CADDYFILE_PATH):
-            with open(CADDYFILE_PATH, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 如果请求格式化版本，解析后重新生成
-            if format_mode:
-                try:
-                    content = format_caddyfile(content)
-                except Exception as e:
+def get_profile(name):
+    """
+    获取单个分析结果
+    
+    默认下载 .pstats 文件；?format=text 返回按累计耗时排序的前 limit 个函数（默认30）
+    """
+    if not is_profile_admin():
+        return jsonify({
+            'success': False,
+            'error': '需要性能分析管理令牌'
+        }), 403
+    if name not in list_profile_names():
+        return jsonify({
+            'success': False,
+            'error': '分析结果不存在'
+        }), 404
+    
+    path = os.path.join(PROFILE_DIR, f'{name}.pstats')
+    if request.args.get('format') != 'text':
+        return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'{name}.pstats')
+    
+    import io
+    import pstats
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.sort_stats('cumulative').print_stats(request.args.get('limit', 30, type=int))
+    return Response(output.getvalue(), mimetype='text/plain')
+
+@app.route('/metrics', methods=['GET'])
+@require_auth
+def export_metrics():
+    """Prometheus 指标"""
+    if not METRICS_ENABLED:
+        return jsonify({
+            'success': False,
+            'error': '未启用监控指标'
+        }), 404
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+asset_manifest = AssetManifest(app.static_folder)
+
+@app.context_processor
+def inject_asset_url():
+    """模板中使用 asset_url('js/app.js') 获取带指纹的静态资源URL"""
+    return {'asset_url': asset_url}
+
+def asset_url(filename: str) -> str:
+    """静态资源URL：启用指纹时返回 /assets/<带哈希的文件名>，否则使用普通静态路径"""
+    if ASSET_FINGERPRINT:
+        url_path = asset_manifest.url_for(filename)
+        if url_path:
+            return url_for('serve_asset', filename=url_path)
+    return url_for('static', filename=filename)
+
+@app.route('/assets/<path:filename>', methods=['GET'])
+def serve_asset(filename):
+    """带指纹的静态资源：内容不可变，返回压缩版本（每个文件第一次请求时压缩并缓存）并设置永久缓存"""
+    asset = asset_manifest.get(filename) if ASSET_FINGERPRINT else None
+    if asset is None:
+        return jsonify({
+            'success': False,
+            'error': '资源不存在'
+        }), 404
+    
+    accept = request.accept_encodings
+    data, content_encoding = asset.data, None
+    for encoding in ('br', 'gzip'):
+        if accept[encoding]:
+            compressed = asset.encoded(encoding)
+            if compressed is not None:
+                data, content_encoding = compressed, encoding
+                break
+    
+    # 每种编码使用不同的 ETag（指纹加编码后缀）
+    etag = asset.etag_for(content_encoding)
+    headers = {
+        'Cache-Control': f'public, max-age={ASSET_MAX_AGE}, immutable',
+        'ETag': f'"{etag}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    return Response(data, mimetype=asset.mimetype, headers=headers)
+
+@app.route('/')
+def index():
+    """主页面"""
+    return render_template('index.html')
+
+@app.route('/api/login', methods=['POST'])
+def login():
+    """登录接口，验证token"""
+    try:
+        # 如果未设置AUTH_TOKEN，则不需要登录
+        if not AUTH_TOKEN:
+            return jsonify({
+                'success': True,
+                'message': '未启用认证'
+            })
+        
+        data = request.get_json()
+        token = data.get('token', '').strip()
+        
+        # 验证token
+        if not token or token != AUTH_TOKEN:
+            return jsonify({
+                'success': False,
+                'error': '无效的token'
+            }), 401
+        
+        return jsonify({
+            'success': True,
+            'message': '登录成功'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/caddyfile', methods=['GET'])
+@require_auth
+def get_caddyfile():
+    """获取当前Caddyfile内容"""
+    try:
+        format_mode = request.args.get('format', 'false').lower() == 'true'
+        
+        document = load_document()
+        if document:
+            # 如果请求格式化版本，解析后重新生成
+            if format_mode:
+                try:
+                    document = build_document(format_caddyfile(document['content']))
+                except Exception as e:
                     # 如果解析失败，返回原始内容
                     pass
             
-            # 解析为结构化数据
-            try:
-                result = parse_caddyfile(content, preserve_unparsed=True)
-                sites = result.get("sites", [])
-                unparsed = result.get("unparsed", [])
-            except Exception as e:
-                sites = []
-                unparsed = []
-            
             return jsonify({
                 'success': True,
-                'content': content,
-                'sites': sites,
-                'unparsed': unparsed,
-                'path': CADDYFILE_PATH,
+                'content': document['content'],
+                'sites': document['sites'],
+                'unparsed': document['unparsed'],
+                'revision': document['revision'],
+                'path': current_document_entry().path,
                 'formatted': format_mode
             })
         else:
@@ -348,7 +1464,7 @@ def get_caddyfile():
                 'content': '',
                 'sites': [],
                 'unparsed': [],
-                'path': CADDYFILE_PATH,
+                'path': current_document_entry().path,
                 'message': 'Caddyfile不存在，将创建新文件'
             })
     except Exception as e:
@@ -357,6 +1473,102 @@ def get_caddyfile():
             'error': str(e)
         }), 500
 
+@app.route('/api/caddyfile/status', methods=['GET'])
+@require_auth
+def get_caddyfile_status():
+    """获取当前Caddyfile版本和最近一次外部修改（用于判断是否需要重新加载）"""
+    try:
+        document = load_document()
+        entry = current_document_entry()
+        # 文件监听和多副本版本通知只针对默认文档
+        is_default = entry.name == DEFAULT_DOCUMENT
+        return jsonify({
+            'success': True,
+            'document': entry.name,
+            'path': entry.path,
+            'revision': document['revision'] if document else None,
+            'watcher': _file_watcher.backend if _file_watcher and is_default else None,
+            'revision_seq': _file_status['revision_seq'] if is_default else None,
+            'last_external_change': _file_status['last_external_change'] if is_default else None,
+            'last_reload': get_reload_coordinator(entry).last_result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/documents', methods=['GET'])
+@require_auth
+def list_documents():
+    """列出已注册的文档及其缓存占用（CADDYFILE_DOCUMENTS_DIR 中尚未访问的文档不在列表中）"""
+    try:
+        return jsonify({
+            'success': True,
+            'default': DEFAULT_DOCUMENT,
+            'documents': [entry.info() for entry in document_manager.documents()],
+            'cache': document_manager.stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/events/ticket', methods=['POST'])
+@require_auth
+def create_events_ticket():
+    """获取服务器推送连接票据（EventSource 通过 ticket 查询参数认证，不在URL中传递 token）"""
+    if not AUTH_TOKEN:
+        return jsonify({
+            'success': True,
+            'ticket': None
+        })
+    return jsonify({
+        'success': True,
+        'ticket': create_event_ticket(),
+        'expires_in': SSE_TICKET_TTL
+    })
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    服务器推送事件（SSE）
+    
+    事件类型: hello（连接时的当前版本）、revision（新版本及变化的站点）、
+    external_change（外部修改）、reload / fleet_reload（重载结果）
+    """
+    if AUTH_TOKEN and not verify_event_ticket(request.args.get('ticket', '')):
+        return jsonify({
+            'success': False,
+            'error': '未授权：需要有效的连接票据'
+        }), 401
+    
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+    if last_id is None:
+        last_id = event_bus.last_id()
+    document = load_document()
+    hello = {'revision': document['revision'] if document else None, 'last_event_id': last_id}
+    
+    def generate(last_id):
+        yield f"retry: 3000\nevent: hello\ndata: {json.dumps(hello)}\n\n"
+        while True:
+            events = event_bus.wait(last_id, SSE_HEARTBEAT_INTERVAL)
+            if not events:
+                # 心跳，防止代理断开空闲连接
+                yield ': ping\n\n'
+                continue
+            for event in events:
+                last_id = event['id']
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    
+    return Response(generate(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 def check_duplicate_addresses(sites):
     """检查是否有重复的站点地址"""
     address_count = {}
@@ -382,82 +1594,219 @@ def check_duplicate_addresses(sites):
     
     return duplicates
 
-def create_backup(source_path: str) -> Optional[str]:
+_backup_stores = {}
+_backup_stores_lock = threading.Lock()
+
+def get_backup_store(entry: ManagedDocument = None) -> BackupStore:
+    """获取文档（默认为当前请求的文档）的备份存储（每个存储目录只创建一个实例）"""
+    entry = entry or current_document_entry()
+    if CADDYFILE_STORAGE == 'redis':
+        return get_redis_backup_store(entry)
+    backup_dir = entry.backup_dir
+    source_filename = os.path.basename(entry.path)
+    root = os.path.join(backup_dir, f"{source_filename}.store")
+    
+    with _backup_stores_lock:
+        store = _backup_stores.get(root)
+        if store is None:
+            store = BackupStore(root, BACKUP_SNAPSHOT_INTERVAL)
+            if not store.exists():
+                import_legacy_backups(store, backup_dir, source_filename)
+            _backup_stores[root] = store
+    start_retention_worker()
+    return store
+
+def get_redis_backup_store(entry: ManagedDocument) -> RedisBackupStore:
+    """Redis中的备份存储（所有副本共享）"""
+    prefix = f'{document_storage_prefix(entry.name)}backups:'
+    key = ('redis', prefix)
+    with _backup_stores_lock:
+        store = _backup_stores.get(key)
+        if store is None:
+            client = get_redis_binary_client()
+            if client is None:
+                raise RuntimeError('Redis不可用，无法访问备份')
+            store = RedisBackupStore(client, prefix, BACKUP_SNAPSHOT_INTERVAL)
+            _backup_stores[key] = store
+    start_retention_worker()
+    return store
+
+def import_legacy_backups(store: BackupStore, backup_dir: str, source_filename: str):
+    """将旧版的完整备份文件（Caddyfile.YYYYMMDD_HHMMSS.bak）导入备份存储，原文件保留不动"""
+    backup_files = glob.glob(os.path.join(backup_dir, f"{source_filename}.*.bak"))
+    backup_files.sort(key=lambda x: os.path.getmtime(x))
+    for backup_file in backup_files:
+        try:
+            with open(backup_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            store.add(content, timestamp=os.path.getmtime(backup_file),
+                      site_count=len(build_document(content)['sites']))
+        except Exception as e:
+            print(f'导入旧备份失败 {backup_file}: {e}')
+
+def create_backup(entry: ManagedDocument = None) -> Optional[dict]:
     """
     创建 Caddyfile 备份
     
     Args:
-        source_path: 源文件路径
+        entry: 要备份的文档（默认为当前请求的文档）
         
     Returns:
-        备份文件路径，如果失败返回 None
+        备份版本信息（包含 seq、time、hash、size），如果失败返回 None
     """
     try:
+        entry = entry or current_document_entry()
+        # 直接使用解析缓存，避免重复读取和解析
+        document = load_document(entry)
         # 如果源文件不存在，不需要备份
-        if not os.path.exists(source_path):
+        if document is None:
             return None
         
-        # 确定备份目录
-        if BACKUP_DIR:
-            backup_dir = BACKUP_DIR
-        else:
-            # 使用源文件所在目录的 backups 子目录
-            source_dir = os.path.dirname(source_path)
-            backup_dir = os.path.join(source_dir, 'backups')
-        
-        # 创建备份目录
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # 生成备份文件名（使用时间戳）
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        source_filename = os.path.basename(source_path)
-        backup_filename = f"{source_filename}.{timestamp}.bak"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # 复制文件
-        import shutil
-        shutil.copy2(source_path, backup_path)
-        
-        # 清理旧备份，只保留最近 MAX_BACKUPS 个
-        cleanup_old_backups(backup_dir, source_filename, MAX_BACKUPS)
-        
-        return backup_path
+        # 旧备份由后台线程按保留策略清理，不影响保存速度
+        store = get_backup_store(entry)
+        with backup_duration.time():
+            return store.add(document['content'], site_count=len(document['sites']))
     except Exception as e:
         print(f'创建备份失败: {e}')
         return None
 
-def cleanup_old_backups(backup_dir: str, source_filename: str, max_backups: int):
+def cleanup_old_backups(store: BackupStore) -> int:
     """
-    清理旧的备份文件，只保留最近 max_backups 个
+    按分级保留策略（BACKUP_RETENTION）清理旧的备份版本；设置了 MAX_BACKUPS 时总数不超过该值
     
     Args:
-        backup_dir: 备份目录
-        source_filename: 源文件名（用于匹配备份文件）
-        max_backups: 最多保留的备份数量
-    """
-    try:
-        # 获取所有匹配的备份文件
-        backup_pattern = f"{source_filename}.*.bak"
-        import glob
-        backup_files = glob.glob(os.path.join(backup_dir, backup_pattern))
-        
-        # 按修改时间排序（最新的在前）
-        backup_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+        store: 备份存储
         
-        # 删除超出数量的旧备份
-        if len(backup_files) > max_backups:
-            for old_backup in backup_files[max_backups:]:
-                try:
-                    os.remove(old_backup)
-                    print(f'已删除旧备份: {old_backup}')
-                except Exception as e:
-                    print(f'删除旧备份失败 {old_backup}: {e}')
-    except Exception as e:
-        print(f'清理旧备份失败: {e}')
+    Returns:
+        删除的版本数量
+    """
+    versions = store.versions()
+    if not versions:
+        return 0
+    keep = select_retained(versions, parse_retention_policy(BACKUP_RETENTION), max_versions=MAX_BACKUPS)
+    # 计算保留集合之后新增的版本不参与本次清理
+    return store.prune(keep, max_seq=versions[-1]['seq'])
+
+# 后台备份清理线程状态
+_retention_status = {
+    'running': False,
+    'runs': 0,
+    'last_run': None,
+    'last_duration_ms': None,
+    'last_removed': 0,
+    'total_removed': 0,
+    'last_error': None
+}
+_retention_lock = threading.Lock()
+
+def start_retention_worker():
+    """启动后台备份清理线程（只启动一次）"""
+    with _retention_lock:
+        if _retention_status['running'] or BACKUP_RETENTION_INTERVAL <= 0:
+            return
+        _retention_status['running'] = True
+    thread = threading.Thread(target=retention_worker, name='backup-retention', daemon=True)
+    thread.start()
+
+def retention_worker():
+    """定期对所有备份存储执行保留策略"""
+    while True:
+        time.sleep(BACKUP_RETENTION_INTERVAL)
+        run_backup_retention()
+
+_retention_leases = {}  # Redis备份存储前缀 -> 清理租约（只在清理线程中访问）
+
+def is_retention_leader(store: BackupStore) -> bool:
+    """
+    多个副本共享的Redis备份存储只由一个副本清理：持有清理租约的副本执行清理，租约在持有期间自动续约，
+    该副本退出后租约过期，由其他副本接替；本地备份存储总是由本进程清理
+    """
+    if not isinstance(store, RedisBackupStore):
+        return True
+    lease = _retention_leases.get(store.root)
+    if lease is None:
+        ttl = max(BACKUP_RETENTION_INTERVAL * 3, 30)
+        lease = _retention_leases[store.root] = RedisLease(store.client, f'{store.root}retention', ttl * 1000)
+    if lease.token is not None and not lease.lost:
+        return True
+    # 未持有或已失去租约：尝试（不等待）获取
+    lease.release()
+    return lease.acquire(0)
+
+def run_backup_retention():
+    """执行一次备份清理并记录耗时"""
+    started = time.perf_counter()
+    removed = 0
+    error = None
+    with _backup_stores_lock:
+        stores = list(_backup_stores.values())
+    for store in stores:
+        try:
+            if not is_retention_leader(store):
+                continue
+            removed += cleanup_old_backups(store)
+        except Exception as e:
+            error = str(e)
+            print(f'清理旧备份失败: {e}')
+    
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    with _retention_lock:
+        _retention_status['runs'] += 1
+        _retention_status['last_run'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _retention_status['last_duration_ms'] = duration_ms
+        _retention_status['last_removed'] = removed
+        _retention_status['total_removed'] += removed
+        _retention_status['last_error'] = error
+    if removed:
+        print(f'已删除 {removed} 个旧备份，耗时 {duration_ms}ms')
+
+# 兼容旧版的备份文件名：Caddyfile.YYYYMMDD_HHMMSS.<序号>.bak
+BACKUP_NAME_RE = re.compile(r'\.(\d{8}_\d{6})\.(\d+)\.bak$')
+
+def backup_path(version: dict, entry: ManagedDocument = None) -> str:
+    """备份版本对应的兼容路径（旧版客户端使用 backup_path 引用备份，恢复时映射回版本序号）"""
+    entry = entry or current_document_entry()
+    timestamp = datetime.fromtimestamp(version['time']).strftime('%Y%m%d_%H%M%S')
+    return os.path.join(entry.backup_dir, f"{os.path.basename(entry.path)}.{timestamp}.{version['seq']}.bak")
+
+def backup_fields(backup: Optional[dict]) -> dict:
+    """写入接口返回的备份信息：backup_id 为版本序号，同时保留旧版的 backup_path 字段"""
+    return {
+        'backup_id': backup['seq'] if backup else None,
+        'backup_path': backup_path(backup) if backup else None
+    }
+
+def format_backup(version: dict) -> dict:
+    """将备份版本转换为API返回格式"""
+    backup_time = datetime.fromtimestamp(version['time'])
+    path = backup_path(version)
+    return {
+        'id': version['seq'],
+        'filename': os.path.basename(path),
+        'path': path,
+        'hash': version['hash'],
+        'timestamp': backup_time.strftime('%Y%m%d_%H%M%S'),
+        'time': backup_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'size': version['size'],
+        'site_count': version.get('site_count')
+    }
+
+def render_sites(sites, unparsed):
+    """
+    将结构化的站点写回文本：在当前文件上只改写变化的行，保留注释、空行和大括号位置；
+    未解析内容变化或无法按行修改时完整生成
+    """
+    document = load_document()
+    if document is not None:
+        patched = patch_caddyfile(document['content'], sites, unparsed)
+        if patched is not None:
+            return patched
+    return generate_caddyfile(sites, unparsed)
 
 @app.route('/api/caddyfile', methods=['POST'])
 @require_auth
+@creates_document
+@serialize_writes
 def save_caddyfile():
     """保存Caddyfile"""
     try:
@@ -485,7 +1834,7 @@ def save_caddyfile():
                     'duplicates': duplicates
                 }), 400
             
-            content = generate_caddyfile(sites, unparsed)
+            content = render_sites(sites, unparsed)
         elif 'content' in data:
             # 直接使用文本内容，但会格式化
             content = data.get('content', '')
@@ -516,26 +1865,22 @@ def save_caddyfile():
                 'error': '缺少content或sites字段'
             }), 400
         
-        # 确保目录存在
-        caddyfile_dir = os.path.dirname(CADDYFILE_PATH)
-        if caddyfile_dir and not os.path.exists(caddyfile_dir):
-            os.makedirs(caddyfile_dir, exist_ok=True)
-        
         # 在保存之前创建备份
-        backup_path = create_backup(CADDYFILE_PATH)
+        backup = create_backup()
         backup_info = ''
-        if backup_path:
+        if backup:
             backup_info = f'（已创建备份）'
         
         # 保存文件（统一格式，全量覆盖）
-        with open(CADDYFILE_PATH, 'w', encoding='utf-8') as f:
-            f.write(content)
+        write_caddyfile(content)
         
         return jsonify({
             'success': True,
             'message': f'Caddyfile已保存（已格式化）{backup_info}',
             'content': content,
-            'backup_path': backup_path
+            'revision': hashlib.sha1(content.encode('utf-8')).hexdigest()[:12],
+            'revision_seq': _file_status['revision_seq'],
+            **backup_fields(backup)
         })
     except Exception as e:
         return jsonify({
@@ -543,45 +1888,421 @@ def save_caddyfile():
             'error': str(e)
         }), 500
 
+SITES_PAGE_SIZE = 50  # 站点列表默认分页大小
+SITES_MAX_PAGE_SIZE = 500  # 站点列表最大分页大小
+
+@app.route('/api/sites', methods=['GET'])
+@require_auth
+def list_sites():
+    """分页获取站点摘要（地址、备注、行号和顶层指令名，不包含完整指令树）"""
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', SITES_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), SITES_MAX_PAGE_SIZE)
+        q = request.args.get('q', '').strip()
+        directive = request.args.get('directive', '').strip()
+        nested = request.args.get('nested', 'false').lower() == 'true'
+        
+        document = load_document()
+        if not document:
+            return jsonify({
+                'success': True,
+                'sites': [],
+                'total': 0,
+                'offset': offset,
+                'limit': limit
+            })
+        
+        result = get_site_index(document).query(q, directive, offset, limit, nested)
+        return jsonify({
+            'success': True,
+            'sites': result['sites'],
+            'total': result['total'],
+            'offset': offset,
+            'limit': limit,
+            'revision': document['revision']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/sites/<path:address>', methods=['GET'])
+@require_auth
+def get_site(address):
+    """获取单个站点的完整配置"""
+    try:
+        document = load_document()
+        site = get_site_index(document).get(address) if document else None
+        if not site:
+            return jsonify({
+                'success': False,
+                'error': f'未找到站点: {address}'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'site': site,
+            'revision': document['revision']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/search', methods=['GET'])
+@require_auth
+def search_sites():
+    """全文搜索站点地址、备注、指令名和参数，按相关度排序并返回高亮位置"""
+    try:
+        q = request.args.get('q', '').strip()
+        limit = request.args.get('limit', SITES_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), SITES_MAX_PAGE_SIZE)
+        
+        document = load_document()
+        if not document or not q:
+            return jsonify({
+                'success': True,
+                'results': [],
+                'total': 0
+            })
+        
+        result = search_document(document, q, limit)
+        return jsonify({
+            'success': True,
+            'results': result['results'],
+            'total': result['total'],
+            'revision': document['revision']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def query_document(document, q: str, limit: Optional[int] = None):
+    """在文档上执行选择器查询（语法见 selector.py），使用站点索引预筛选候选站点"""
+    return compile_query(q).run(document['sites'], get_site_index(document).by_directive, limit)
+
+@app.route('/api/query', methods=['GET', 'POST'])
+@require_auth
+def query_sites():
+    """
+    选择器查询，例如 site:has(encode[arg=gzip]):not(:has(file_server)) 或 handle_path reverse_proxy
+    
+    返回匹配的站点或指令（含所在站点和父指令路径）
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+        else:
+            data = request.args
+        q = str(data.get('q', '')).strip()
+        try:
+            limit = int(data.get('limit', SITES_MAX_PAGE_SIZE))
+        except (TypeError, ValueError):
+            limit = SITES_MAX_PAGE_SIZE
+        limit = min(max(limit, 1), SITES_MAX_PAGE_SIZE)
+        
+        document = load_document()
+        if not document:
+            compile_query(q)
+            return jsonify({
+                'success': True,
+                'matches': [],
+                'total': 0
+            })
+        
+        result = query_document(document, q, limit)
+        return jsonify({
+            'success': True,
+            'query': q,
+            'matches': result['matches'],
+            'count': len(result['matches']),
+            'total': result['total'],
+            'sites_scanned': result['sites_scanned'],
+            'revision': document['revision']
+        })
+    except SelectorError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def find_site(sites, address):
+    """按地址查找站点，返回 (索引, 站点)，未找到返回 (-1, None)"""
+    for i, site in enumerate(sites):
+        if (site.get('address') or '').strip() == address:
+            return i, site
+    return -1, None
+
+def save_site_change(document, site, new_site):
+    """
+    将单个站点的修改写回Caddyfile，只替换该站点所在的文本块
+    
+    Args:
+        document: load_document() 返回的当前文档
+        site: 被修改的原站点（为 None 表示新增）
+        new_site: 修改后的站点（为 None 表示删除）
+        
+    Returns:
+        Flask响应
+    """
+    sites = list(document['sites']) if document else []
+    index, _ = find_site(sites, site['address']) if site else (-1, None)
+    if new_site is not None:
+        if index >= 0:
+            sites[index] = new_site
+        else:
+            sites.append(new_site)
+    elif index >= 0:
+        del sites[index]
+    
+    # 检查重复的站点地址
+    duplicates = check_duplicate_addresses(sites)
+    if duplicates:
+        duplicate_info = []
+        for dup in duplicates:
+            duplicate_info.append(f"地址 '{dup['address']}' 出现了 {dup['count']} 次")
+        
+        return jsonify({
+            'success': False,
+            'error': '检测到重复的站点地址，无法保存',
+            'details': '\n'.join(duplicate_info),
+            'duplicates': duplicates
+        }), 400
+    
+    content = document['content'] if document else ''
+    # 优先只改写变化的行，保留站点内的注释和格式；无法按行修改时替换整个站点块
+    patched = patch_caddyfile(content, sites) if document else None
+    site_text = generate_caddyfile([new_site]) if new_site is not None and patched is None else None
+    if patched is not None:
+        content = patched
+    elif site is not None:
+        content = splice_site_block(content, site, site_text)
+    elif content.strip():
+        content = content.rstrip('\n') + '\n\n' + site_text
+    else:
+        content = site_text
+    
+    # 在保存之前创建备份
+    backup = create_backup()
+    write_caddyfile(content)
+    
+    document = load_document()
+    _, saved_site = find_site(document['sites'], new_site['address'].strip()) if new_site is not None else (-1, None)
+    return jsonify({
+        'success': True,
+        'message': '站点已删除' if new_site is None else '站点已保存',
+        'site': saved_site,
+        'revision': document['revision'],
+        **backup_fields(backup)
+    }), 201 if site is None else 200
+
+def build_site(data, base=None):
+    """根据请求数据构造站点，base 为 PATCH 时的原站点"""
+    base = base or {}
+    return {
+        'address': (data.get('address', base.get('address')) or '').strip(),
+        'notes': data.get('notes', base.get('notes', '')) or '',
+        'directives': data.get('directives', base.get('directives', []))
+    }
+
+@app.route('/api/sites/<path:address>', methods=['PUT'])
+@require_auth
+@creates_document
+@serialize_writes
+def put_site(address):
+    """替换（或新建）单个站点，只改写该站点所在的文本块"""
+    try:
+        data = request.get_json() or {}
+        data.setdefault('address', address)
+        new_site = build_site(data)
+        if not new_site['address']:
+            return jsonify({
+                'success': False,
+                'error': '站点地址不能为空'
+            }), 400
+        
+        document = load_document()
+        _, site = find_site(document['sites'], address) if document else (-1, None)
+        return save_site_change(document, site, new_site)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/sites/<path:address>', methods=['PATCH'])
+@require_auth
+@serialize_writes
+def patch_site(address):
+    """修改单个站点的部分字段（address、notes、directives）"""
+    try:
+        data = request.get_json() or {}
+        document = load_document()
+        _, site = find_site(document['sites'], address) if document else (-1, None)
+        if not site:
+            return jsonify({
+                'success': False,
+                'error': f'未找到站点: {address}'
+            }), 404
+        
+        new_site = build_site(data, site)
+        if not new_site['address']:
+            return jsonify({
+                'success': False,
+                'error': '站点地址不能为空'
+            }), 400
+        
+        return save_site_change(document, site, new_site)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/sites/<path:address>', methods=['DELETE'])
+@require_auth
+@serialize_writes
+def delete_site(address):
+    """删除单个站点"""
+    try:
+        document = load_document()
+        _, site = find_site(document['sites'], address) if document else (-1, None)
+        if not site:
+            return jsonify({
+                'success': False,
+                'error': f'未找到站点: {address}'
+            }), 404
+        
+        return save_site_change(document, site, None)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/sites/bulk', methods=['POST'])
+@require_auth
+@serialize_writes
+def bulk_edit_sites():
+    """
+    批量修改站点（操作格式见 bulk_edit.py）
+    
+    一次遍历执行所有操作，只改写被修改的站点文本块，只创建一个备份；
+    返回变更摘要、每处变更和预览差异，dry_run 为 true 时不保存
+    """
+    try:
+        data = request.get_json() or {}
+        dry_run = bool(data.get('dry_run', False))
+        operations = compile_operations(data.get('operations'))
+        
+        document = load_document()
+        if document is None:
+            return jsonify({
+                'success': False,
+                'error': 'Caddyfile不存在'
+            }), 404
+        
+        sites, changed, changes = apply_operations(document['sites'], operations)
+        
+        # 只改写变化的行；无法按行修改时从后往前替换被修改的站点块，前面站点的行号保持不变
+        content = patch_caddyfile(document['content'], sites) if changed else document['content']
+        if content is None:
+            content = document['content']
+            for index in sorted(changed, key=lambda i: document['sites'][i]['line_number'], reverse=True):
+                content = splice_site_block(content, document['sites'][index], generate_caddyfile([sites[index]]))
+        new_document = build_document(content)
+        preview = diff_documents(document, new_document, get_document_tree(document), get_document_tree(new_document))
+        
+        backup = None
+        if changed and not dry_run:
+            backup = create_backup()
+            write_caddyfile(content)
+        
+        return jsonify({
+            'success': True,
+            'dry_run': dry_run,
+            'saved': bool(changed) and not dry_run,
+            'summary': summarize_bulk_edit(operations, changed, changes),
+            'changes': changes,
+            'diff': preview,
+            'revision': new_document['revision'] if changed and not dry_run else document['revision'],
+            **backup_fields(backup)
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def run_caddy_validate(content: str):
+    """
+    使用 caddy validate 验证配置内容
+    
+    返回: (是否通过, 消息)
+    """
+    # 验证文件写在临时目录，不在文档目录中创建文件（验证接口不需要认证）；
+    # import 的相对路径改为基于 Caddyfile 所在目录的绝对路径，解析结果与在原目录中验证相同
+    caddyfile_dir = os.path.dirname(os.path.abspath(current_document_entry().path))
+    fd, validate_file_path = tempfile.mkstemp(prefix='Caddyfile.', suffix='.validate')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(absolutize_imports(content, caddyfile_dir))
+        
+        result = run_caddy(
+            'validate', ['--config', validate_file_path, '--adapter', 'caddyfile'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=10,
+            # 工作目录为 Caddyfile 所在目录（存在时），其他相对路径与原位置一致
+            cwd=caddyfile_dir if os.path.isdir(caddyfile_dir) else None
+        )
+    finally:
+        os.unlink(validate_file_path)
+    
+    if result.returncode == 0:
+        return True, '配置验证通过'
+    # 合并 stdout 和 stderr，Caddy 的错误信息可能在 stderr 中
+    error_output = (result.stderr or '') + (result.stdout or '')
+    if not error_output.strip():
+        error_output = '配置验证失败（未知错误）'
+    return False, error_output.strip()
+
 @app.route('/api/validate', methods=['POST'])
 def validate_caddyfile():
     """验证Caddyfile配置"""
     try:
         data = request.get_json() or {}
         
-        # 如果没有提供内容，直接验证已保存的 Caddyfile 文件
+        # 如果没有提供内容，直接验证已保存的 Caddyfile（验证其内容，不写出文档文件）
         if 'sites' not in data and 'content' not in data:
-            if os.path.exists(CADDYFILE_PATH):
-                # 直接验证实际文件
-                result = subprocess.run(
-                    [CADDY_BINARY, 'validate', '--config', CADDYFILE_PATH],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    timeout=10
-                )
-                
-                if result.returncode == 0:
-                    return jsonify({
-                        'success': True,
-                        'valid': True,
-                        'message': '配置验证通过'
-                    })
-                else:
-                    error_output = (result.stderr or '') + (result.stdout or '')
-                    if not error_output.strip():
-                        error_output = '配置验证失败（未知错误）'
-                    
-                    return jsonify({
-                        'success': True,
-                        'valid': False,
-                        'message': error_output.strip()
-                    })
-            else:
+            document = load_document()
+            if document is None:
                 return jsonify({
                     'success': False,
                     'error': 'Caddyfile 文件不存在'
                 }), 400
+            valid, message = run_caddy_validate(document['content'])
+            return jsonify({
+                'success': True,
+                'valid': valid,
+                'message': message
+            })
         
         # 支持两种验证方式
         if 'sites' in data:
@@ -603,7 +2324,7 @@ def validate_caddyfile():
                     'duplicates': duplicates
                 })
             
-            content = generate_caddyfile(sites, unparsed)
+            content = render_sites(sites, unparsed)
         elif 'content' in data:
             content = data.get('content', '')
             # 格式化后再验证
@@ -632,55 +2353,12 @@ def validate_caddyfile():
                 'error': '缺少content或sites字段'
             }), 400
         
-        # 使用固定文件路径进行验证（在 Caddyfile 所在目录）
-        # 重要：验证文件必须创建在与 Caddyfile 相同的目录中，这样 import 路径才能正确解析
-        caddyfile_dir = os.path.dirname(CADDYFILE_PATH)
-        if not caddyfile_dir:
-            caddyfile_dir = os.getcwd()
-        
-        # 确保目录存在
-        os.makedirs(caddyfile_dir, exist_ok=True)
-        
-        # 使用固定的验证文件路径
-        validate_file_path = os.path.join(caddyfile_dir, '.Caddyfile.validate')
-        
-        try:
-            # 写入内容到固定文件
-            with open(validate_file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            # 使用caddy validate命令验证（使用与 Caddyfile 相同的目录，确保 import 路径正确）
-            result = subprocess.run(
-                [CADDY_BINARY, 'validate', '--config', validate_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=10,
-                cwd=caddyfile_dir  # 设置工作目录，确保相对路径正确
-            )
-            
-            if result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'valid': True,
-                    'message': '配置验证通过'
-                })
-            else:
-                # 合并 stdout 和 stderr，Caddy 的错误信息可能在 stderr 中
-                error_output = (result.stderr or '') + (result.stdout or '')
-                if not error_output.strip():
-                    error_output = '配置验证失败（未知错误）'
-                
-                return jsonify({
-                    'success': True,
-                    'valid': False,
-                    'message': error_output.strip()
-                })
-        finally:
-            # 验证完成后可以选择保留或删除验证文件
-            # 这里保留文件，方便调试（如果需要可以删除）
-            pass
-                
+        valid, message = run_caddy_validate(content)
+        return jsonify({
+            'success': True,
+            'valid': valid,
+            'message': message
+        })
     except subprocess.TimeoutExpired:
         return jsonify({
             'success': False,
@@ -698,57 +2376,149 @@ def validate_caddyfile():
             'error': str(e)
         }), 500
 
-@app.route('/api/backups', methods=['GET'])
+@lru_cache(maxsize=8)
+def load_backup_document(obj_hash: str):
+    """读取并解析备份内容（备份内容不可变，按内容哈希缓存）"""
+    return build_document(get_backup_store().read_object(obj_hash))
+
+def backup_document_cache_stats():
+    info = load_backup_document.cache_info()
+    selector_info = compile_query.cache_info()
+    adapt_info = adapt_caddyfile_cached.cache_info()
+    return {('backup_document', 'hit'): info.hits, ('backup_document', 'miss'): info.misses,
+            ('selector', 'hit'): selector_info.hits, ('selector', 'miss'): selector_info.misses,
+            ('adapt', 'hit'): adapt_info.hits, ('adapt', 'miss'): adapt_info.misses}
+
+metrics.callback('caddyfile_document_cache_bytes', '所有文档解析/索引缓存的估算内存占用', (),
+                 lambda: {(): document_manager.stats()['cache_bytes']}, kind='gauge')
+metrics.callback('caddyfile_document_cache_evictions_total', '超出内存预算而被清除缓存的文档次数', (),
+                 lambda: {(): document_manager.evictions})
+
+metrics.callback('caddyfile_lru_cache_requests_total', '函数缓存访问次数（hit/miss）', ('cache', 'result'),
+                 backup_document_cache_stats)
+
+def resolve_diff_source(spec):
+    """
+    解析差异比较的一侧
+    
+    支持: 'live'（当前文件）、'backup:<id>'、{'backup': id}、
+    {'content': '...'}（未保存的草稿文本）、{'sites': [...], 'unparsed': [...]}（未保存的结构化草稿）
+    """
+    if spec is None or spec == 'live':
+        return load_document() or build_document('')
+    if isinstance(spec, str) and spec.startswith('backup:'):
+        spec = {'backup': spec.split(':', 1)[1]}
+    if isinstance(spec, dict):
+        if 'backup' in spec:
+            version = get_backup_store().get(int(spec['backup']))
+            if not version:
+                raise LookupError(f"备份不存在: {spec['backup']}")
+            return load_backup_document(version['hash'])
+        if 'content' in spec:
+            return build_document(spec['content'] or '')
+        if 'sites' in spec:
+            return {'sites': spec.get('sites') or [], 'unparsed': spec.get('unparsed') or []}
+    raise ValueError(f'无法识别的比较对象: {spec}')
+
+@app.route('/api/diff', methods=['GET', 'POST'])
 @require_auth
-def list_backups():
-    """获取备份列表"""
+def diff_caddyfile():
+    """按站点和指令比较两个版本（当前文件、备份或未保存的草稿）"""
     try:
-        # 确定备份目录
-        if BACKUP_DIR:
-            backup_dir = BACKUP_DIR
+        if request.method == 'POST':
+            data = request.get_json() or {}
         else:
-            source_dir = os.path.dirname(CADDYFILE_PATH)
-            backup_dir = os.path.join(source_dir, 'backups')
+            data = request.args
+        old = resolve_diff_source(data.get('from'))
+        new = resolve_diff_source(data.get('to', 'live'))
         
-        if not os.path.exists(backup_dir):
-            return jsonify({
-                'success': True,
-                'backups': []
-            })
+        result = diff_documents(
+            old, new,
+            old_tree=get_document_tree(old) if 'revision' in old else None,
+            new_tree=get_document_tree(new) if 'revision' in new else None
+        )
+        return jsonify({
+            'success': True,
+            'from_revision': old.get('revision'),
+            'to_revision': new.get('revision'),
+            **result
+        })
+    except LookupError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+BACKUPS_PAGE_SIZE = 50  # 备份列表默认分页大小
+BACKUPS_MAX_PAGE_SIZE = 500  # 备份列表最大分页大小
+
+@app.route('/api/backups', methods=['GET'])
+@require_auth
+def list_backups():
+    """分页获取备份列表（从新到旧，直接查询备份清单，不扫描目录）"""
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', BACKUPS_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), BACKUPS_MAX_PAGE_SIZE)
         
-        # 获取所有备份文件
-        source_filename = os.path.basename(CADDYFILE_PATH)
-        backup_pattern = f"{source_filename}.*.bak"
-        import glob
-        backup_files = glob.glob(os.path.join(backup_dir, backup_pattern))
-        
-        # 按修改时间排序（最新的在前）
-        backup_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-        
-        # 构建备份信息列表
-        backups = []
-        for backup_path in backup_files:
-            backup_filename = os.path.basename(backup_path)
-            mtime = os.path.getmtime(backup_path)
-            from datetime import datetime
-            backup_time = datetime.fromtimestamp(mtime)
-            
-            # 从文件名提取时间戳
-            # 格式：Caddyfile.YYYYMMDD_HHMMSS.bak
-            timestamp_str = backup_filename.replace(f"{source_filename}.", "").replace(".bak", "")
-            
-            backups.append({
-                'filename': backup_filename,
-                'path': backup_path,
-                'timestamp': timestamp_str,
-                'time': backup_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'size': os.path.getsize(backup_path)
-            })
+        store = get_backup_store()
+        backups = [format_backup(v) for v in store.page(offset, limit)]
         
         return jsonify({
             'success': True,
             'backups': backups,
-            'count': len(backups)
+            'count': len(backups),
+            'total': store.count(),
+            'offset': offset,
+            'limit': limit
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/backups/retention', methods=['GET'])
+@require_auth
+def get_backup_retention():
+    """获取后台备份清理的策略和运行状态"""
+    with _retention_lock:
+        status = dict(_retention_status)
+    return jsonify({
+        'success': True,
+        'policy': BACKUP_RETENTION,
+        'max_backups': MAX_BACKUPS,
+        'interval': BACKUP_RETENTION_INTERVAL,
+        'status': status
+    })
+
+@app.route('/api/backups/<int:backup_id>', methods=['GET'])
+@require_auth
+def get_backup(backup_id):
+    """获取指定备份的内容"""
+    try:
+        store = get_backup_store()
+        version = store.get(backup_id)
+        if not version:
+            return jsonify({
+                'success': False,
+                'error': f'备份不存在: {backup_id}'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'backup': format_backup(version),
+            'content': store.read_object(version['hash'])
         })
     except Exception as e:
         return jsonify({
@@ -758,37 +2528,77 @@ def list_backups():
 
 @app.route('/api/backups/restore', methods=['POST'])
 @require_auth
+@serialize_writes
 def restore_backup():
     """恢复备份"""
     try:
         data = request.get_json()
-        backup_path = data.get('backup_path') or data.get('path')
+        backup_id = data.get('backup_id', data.get('id'))
+        requested_path = data.get('backup_path') or data.get('path')
+        entry = current_document_entry()
+        content = None
         
-        if not backup_path:
-            return jsonify({
-                'success': False,
-                'error': '缺少 backup_path 参数'
-            }), 400
+        if backup_id is None and requested_path:
+            # 旧版客户端按路径引用备份：只接受当前文档备份目录中的备份文件名
+            backup_dir = os.path.realpath(entry.backup_dir)
+            real_path = os.path.realpath(requested_path)
+            filename = os.path.basename(real_path)
+            if (os.path.dirname(real_path) != backup_dir
+                    or not filename.startswith(f"{os.path.basename(entry.path)}.")
+                    or not filename.endswith('.bak')):
+                return jsonify({
+                    'success': False,
+                    'error': '备份路径无效'
+                }), 400
+            match = BACKUP_NAME_RE.search(filename)
+            if match:
+                backup_id = int(match.group(2))
+            elif os.path.isfile(real_path):
+                # 未导入备份存储的旧版完整备份文件
+                with open(real_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': f'备份文件不存在: {requested_path}'
+                }), 404
         
-        # 检查备份文件是否存在
-        if not os.path.exists(backup_path):
+        if backup_id is not None:
+            try:
+                backup_id = int(backup_id)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': 'backup_id 必须为整数'
+                }), 400
+            store = get_backup_store(entry)
+            version = store.get(backup_id)
+            content = store.read(backup_id) if version else None
+            if content is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'备份不存在: {backup_id}'
+                }), 404
+            requested_path = backup_path(version, entry)
+        elif content is None:
             return jsonify({
                 'success': False,
-                'error': f'备份文件不存在: {backup_path}'
-            }), 404
+                'error': '缺少 backup_id 参数'
+            }), 400
         
         # 在恢复之前创建当前文件的备份
-        current_backup = create_backup(CADDYFILE_PATH)
+        current_backup = create_backup(entry)
         
-        # 复制备份文件到 Caddyfile
-        import shutil
-        shutil.copy2(backup_path, CADDYFILE_PATH)
+        write_caddyfile(content)
         
+        current = backup_fields(current_backup)
         return jsonify({
             'success': True,
             'message': '备份已恢复',
-            'backup_path': backup_path,
-            'current_backup': current_backup  # 恢复前创建的备份
+            'backup_id': backup_id,
+            'backup_path': requested_path,
+            'current_backup_id': current['backup_id'],  # 恢复前创建的备份
+            'current_backup': current['backup_path']
         })
     except Exception as e:
         return jsonify({
@@ -796,62 +2606,250 @@ def restore_backup():
             'error': str(e)
         }), 500
 
+_reload_coordinators = {}  # 文档名称 -> ReloadCoordinator
+_reload_coordinators_lock = threading.Lock()
+
+def get_reload_coordinator(entry: ManagedDocument) -> ReloadCoordinator:
+    """获取文档的重载协调器（保存上次成功加载的语义哈希）"""
+    with _reload_coordinators_lock:
+        coordinator = _reload_coordinators.get(entry.name)
+        if coordinator is None:
+            coordinator = _reload_coordinators[entry.name] = ReloadCoordinator(RELOAD_DEBOUNCE_SECONDS)
+        return coordinator
+
+def document_semantic_hash(entry: ManagedDocument) -> Optional[str]:
+    """文档的语义哈希（规范化的站点树、未解析内容和 import 的文件），文档不存在时返回 None"""
+    document = load_document(entry)
+    if document is None:
+        return None
+    imports = resolve_imports(document['content'], os.path.dirname(os.path.abspath(entry.path)))
+    return semantic_hash(document['sites'], document['unparsed'], imports)
+
+@lru_cache(maxsize=8)
+def adapt_caddyfile_cached(content_key: str, path: str) -> dict:
+    """caddy adapt 的JSON输出（content_key 为内容和 import 文件的哈希，内容不变时复用）"""
+    result = run_caddy(
+        'adapt', ['--config', path, '--adapter', 'caddyfile'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=10
+    )
+    if result.returncode != 0:
+        raise ValueError(f'caddy adapt 失败: {result.stderr or result.stdout or "未知错误"}')
+    return json.loads(result.stdout)
+
+def adapt_caddyfile(entry: ManagedDocument) -> dict:
+    """将文档转换为Caddy的JSON配置"""
+    document = load_document(entry)
+    imports = resolve_imports(document['content'], os.path.dirname(os.path.abspath(entry.path)))
+    content_key = hashlib.sha256((document['content'] + json.dumps(imports)).encode('utf-8')).hexdigest()
+    return adapt_caddyfile_cached(content_key, entry.path)
+
+_incremental_applier = None
+_incremental_applier_lock = threading.Lock()
+
+def get_incremental_applier() -> IncrementalApplier:
+    global _incremental_applier
+    with _incremental_applier_lock:
+        if _incremental_applier is None:
+            _incremental_applier = IncrementalApplier(CADDY_ADMIN_URL, FLEET_TIMEOUT, INCREMENTAL_MAX_RATIO)
+        return _incremental_applier
+
+def apply_config_incrementally(entry: ManagedDocument):
+    """通过 admin API 只写入变化的配置，返回 (结果, HTTP状态码)"""
+    try:
+        config = adapt_caddyfile(entry)
+    except ValueError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 400
+    result = get_incremental_applier().apply(config)
+    incremental_apply_total.inc(result['mode'] if result['ok'] else 'error')
+    if not result['ok']:
+        return {
+            'success': False,
+            'error': f"应用配置失败: {result['error']}",
+            'apply': result
+        }, 502
+    messages = {
+        'unchanged': '运行中的配置与新配置相同',
+        'incremental': f"已通过 PATCH {result['patch_path']} 应用 {result['operations']} 处变更",
+        'load': '配置已完整加载'
+    }
+    return {
+        'success': True,
+        'message': messages[result['mode']],
+        'apply': result
+    }, 200
+
+def run_caddy_reload(entry: ManagedDocument):
+    """执行 caddy reload（配置了 CADDY_ADMIN_URL 时通过 admin API 增量应用），返回 (结果, HTTP状态码)"""
+    # 检查Caddyfile是否存在（使用Redis存储时先写出当前版本）
+    materialize_caddyfile(entry)
+    caddyfile_path = entry.path
+    if not os.path.exists(caddyfile_path):
+        return {
+            'success': False,
+            'error': f'Caddyfile不存在: {caddyfile_path}'
+        }, 400
+    
+    # 使用caddy reload命令
+    # 注意：在Windows上，caddy reload可能不可用，需要先检查
+    try:
+        if CADDY_ADMIN_URL:
+            return apply_config_incrementally(entry)
+        result = run_caddy(
+            'reload', ['--config', caddyfile_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=10
+        )
+    except FileNotFoundError:
+        return {
+            'success': False,
+            'error': f'未找到caddy命令: {CADDY_BINARY}。请确保已安装Caddy并配置了CADDY_BINARY环境变量。'
+        }, 500
+    except subprocess.TimeoutExpired:
+        return {
+            'success': False,
+            'error': '重新加载超时（超过10秒）'
+        }, 500
+    
+    if result.returncode == 0:
+        return {
+            'success': True,
+            'message': '配置已重新加载'
+        }, 200
+    error_msg = result.stderr or result.stdout or '未知错误'
+    # 提供更友好的错误信息
+    if 'not found' in error_msg.lower() or 'command not found' in error_msg.lower():
+        return {
+            'success': False,
+            'error': f'未找到caddy命令。请确保已安装Caddy并配置了CADDY_BINARY环境变量。当前值: {CADDY_BINARY}'
+        }, 500
+    return {
+        'success': False,
+        'error': f'重新加载失败: {error_msg}'
+    }, 500
+
 @app.route('/api/reload', methods=['POST'])
 @require_auth
+@publish_result('reload')
 def reload_caddy():
-    """重新加载Caddy配置"""
+    """
+    重新加载Caddy配置
+    
+    配置的语义哈希与上次成功加载的相同时直接返回（请求体 {"force": true} 时总是重载）；
+    RELOAD_DEBOUNCE_SECONDS 内的多个请求合并为一次重载。
+    返回 reloaded（是否实际执行了重载）、duration_ms、semantic_hash、requests（合并的请求数）和 coalesced
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        entry = current_document_entry()
+        payload, status = get_reload_coordinator(entry).request(
+            lambda: document_semantic_hash(entry),
+            lambda: run_caddy_reload(entry),
+            force=bool(data.get('force', False))
+        )
+        if payload.get('coalesced'):
+            reload_requests.inc('coalesced')
+        elif status != 200:
+            reload_requests.inc('error')
+        else:
+            reload_requests.inc('reloaded' if payload['reloaded'] else 'unchanged')
+        return jsonify(payload), status
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'重新加载时发生错误: {str(e)}'
+        }), 500
+
+_fleet = None
+_fleet_lock = threading.Lock()
+
+def get_fleet() -> Optional[Fleet]:
+    """获取集群（未配置节点时返回 None）"""
+    global _fleet
+    if not CADDY_FLEET_NODES:
+        return None
+    with _fleet_lock:
+        if _fleet is None:
+            _fleet = Fleet(CADDY_FLEET_NODES, FLEET_MAX_WORKERS, FLEET_TIMEOUT)
+        return _fleet
+
+@app.route('/api/fleet', methods=['GET'])
+@require_auth
+def get_fleet_status():
+    """获取集群节点列表和最近一次推送结果"""
+    fleet = get_fleet()
+    return jsonify({
+        'success': True,
+        'enabled': fleet is not None,
+        'nodes': [node.url for node in fleet.nodes] if fleet else [],
+        'canary': FLEET_CANARY,
+        'last_result': fleet.last_result if fleet else None
+    })
+
+@app.route('/api/fleet/reload', methods=['POST'])
+@require_auth
+@publish_result('fleet_reload')
+def reload_fleet():
+    """
+    将当前Caddyfile并发推送到集群中的所有节点
+    
+    请求体（可选）: {"canary": 金丝雀节点数量, "nodes": [只推送这些节点]}
+    返回每个节点的状态码、耗时和错误信息
+    """
     try:
-        # 检查Caddyfile是否存在
-        if not os.path.exists(CADDYFILE_PATH):
+        fleet = get_fleet()
+        if fleet is None:
             return jsonify({
                 'success': False,
-                'error': f'Caddyfile不存在: {CADDYFILE_PATH}'
+                'error': '未配置集群节点（CADDY_FLEET_NODES）'
             }), 400
         
-        # 使用caddy reload命令
-        # 注意：在Windows上，caddy reload可能不可用，需要先检查
-        try:
-            result = subprocess.run(
-                [CADDY_BINARY, 'reload', '--config', CADDYFILE_PATH],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                return jsonify({
-                    'success': True,
-                    'message': '配置已重新加载'
-                })
-            else:
-                error_msg = result.stderr or result.stdout or '未知错误'
-                # 提供更友好的错误信息
-                if 'not found' in error_msg.lower() or 'command not found' in error_msg.lower():
-                    return jsonify({
-                        'success': False,
-                        'error': f'未找到caddy命令。请确保已安装Caddy并配置了CADDY_BINARY环境变量。当前值: {CADDY_BINARY}'
-                    }), 500
-                else:
-                    return jsonify({
-                        'success': False,
-                        'error': f'重新加载失败: {error_msg}'
-                    }), 500
-        except FileNotFoundError:
+        document = load_document()
+        if document is None:
             return jsonify({
                 'success': False,
-                'error': f'未找到caddy命令: {CADDY_BINARY}。请确保已安装Caddy并配置了CADDY_BINARY环境变量。'
-            }), 500
-            
-    except subprocess.TimeoutExpired:
+                'error': f'Caddyfile不存在: {current_document_entry().path}'
+            }), 400
+        
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'error': '请求体必须是JSON对象'
+            }), 400
+        canary = data.get('canary', FLEET_CANARY)
+        if isinstance(canary, bool) or not isinstance(canary, int) or canary < 0:
+            return jsonify({
+                'success': False,
+                'error': 'canary 必须是非负整数'
+            }), 400
+        nodes = data.get('nodes')
+        if nodes is not None and not (isinstance(nodes, list) and all(isinstance(node, str) for node in nodes)):
+            return jsonify({
+                'success': False,
+                'error': 'nodes 必须是节点地址（字符串）的数组'
+            }), 400
+        summary = fleet.push(document['content'], canary=canary, nodes=nodes)
+        for result in summary['results']:
+            if not result.get('skipped'):
+                fleet_push_duration.observe(result['duration_ms'] / 1000, result['node'], 'ok' if result['ok'] else 'error')
+        
         return jsonify({
-            'success': False,
-            'error': '重新加载超时（超过10秒）'
-        }), 500
+            'message': f"已推送到 {summary['ok']}/{len(summary['results'])} 个节点",
+            'revision': document['revision'],
+            **summary
+        }), 200 if summary['success'] else 502
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f'重新加载时发生错误: {str(e)}'
+            'error': f'推送到集群时发生错误: {str(e)}'
         }), 500
 
 @app.route('/api/parse', methods=['POST'])
@@ -896,7 +2894,166 @@ def generate_caddyfile_api():
             'error': str(e)
         }), 500
 
+PIPELINE_STAGES = ('parse', 'dedupe', 'generate', 'validate', 'save')
+
+class PipelineDocument:
+    """
+    流水线中的内存文档
+    
+    文本和结构化数据按需相互转换并缓存，后续阶段直接复用前面阶段的结果
+    """
+    
+    def __init__(self, content=None, sites=None, unparsed=None):
+        self.content = content
+        self.sites = sites
+        self.unparsed = unparsed if unparsed is not None else []
+        self.from_sites = sites is not None  # 输入为结构化数据（否则为文本）
+        self.generated = False  # content 是否已转换为要保存的文本
+    
+    def get_sites(self):
+        if self.sites is None:
+            parsed = parse_caddyfile(self.content or '', preserve_unparsed=True)
+            self.sites = parsed.get('sites', [])
+            self.unparsed = parsed.get('unparsed', [])
+        return self.sites
+    
+    def get_content(self):
+        """要验证和保存的文本，与编辑器保存（POST /api/caddyfile）的结果相同"""
+        if not self.generated:
+            if self.from_sites:
+                # 在当前文件上只改写变化的行
+                self.content = render_sites(self.sites, self.unparsed)
+            else:
+                try:
+                    self.content = format_caddyfile(self.content or '')
+                except Exception:
+                    # 解析失败时使用原始内容
+                    pass
+            self.generated = True
+        return self.content
+
+def pipeline_duplicates_result(sites) -> Optional[dict]:
+    """重复站点地址的失败结果，没有重复时返回 None"""
+    duplicates = check_duplicate_addresses(sites)
+    if not duplicates:
+        return None
+    return {
+        'ok': False,
+        'message': '检测到重复的站点地址\n' + '\n'.join(
+            f"地址 '{dup['address']}' 出现了 {dup['count']} 次" for dup in duplicates),
+        'duplicates': duplicates
+    }
+
+def run_pipeline_stage(stage: str, document: PipelineDocument, output: dict, saving: bool = False) -> dict:
+    """
+    执行单个流水线阶段，返回阶段结果（ok 为 False 时流水线停止）
+    
+    saving: 之后还有 save 阶段；此时没有caddy命令无法验证视为验证失败，不保存未经验证的配置
+    """
+    if stage == 'parse':
+        sites = document.get_sites()
+        output['sites'] = sites
+        output['unparsed'] = document.unparsed
+        return {'ok': True, 'site_count': len(sites), 'unparsed_count': len(document.unparsed)}
+    
+    if stage == 'dedupe':
+        return pipeline_duplicates_result(document.get_sites()) or {'ok': True}
+    
+    if stage == 'generate':
+        output['content'] = document.get_content()
+        return {'ok': True, 'size': len(output['content'].encode('utf-8'))}
+    
+    if stage == 'validate':
+        try:
+            valid, message = run_caddy_validate(document.get_content())
+        except subprocess.TimeoutExpired:
+            valid, message = False, '验证超时'
+        except FileNotFoundError:
+            if saving:
+                return {'ok': False, 'valid': None, 'message': '未找到caddy命令，无法验证，已取消保存'}
+            # 只验证不保存时跳过验证，不阻止后续阶段
+            return {'ok': True, 'valid': None, 'skipped': True, 'message': '未找到caddy命令，跳过验证'}
+        return {'ok': valid, 'valid': valid, 'message': message}
+    
+    if stage == 'save':
+        # 无论是否执行过 dedupe 阶段，都不保存有重复地址的配置
+        duplicates = pipeline_duplicates_result(document.get_sites())
+        if duplicates:
+            return duplicates
+        content = document.get_content()
+        with caddyfile_write_lock():
+            backup = create_backup()
+            write_caddyfile(content)
+        output['content'] = content
+        output['revision'] = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        output.update(backup_fields(backup))
+        return {'ok': True, 'revision': output['revision']}
+    
+    raise ValueError(f'未知的阶段: {stage}')
+
+@app.route('/api/pipeline', methods=['POST'])
+@require_auth
+def run_pipeline():
+    """
+    在同一个内存文档上依次执行多个阶段，减少请求次数和重复解析
+    
+    请求体: {"content": "..."} 或 {"sites": [...], "unparsed": [...]}，
+    以及 "stages": ["parse", "dedupe", "generate", "validate", "save"] 中的若干项（按给定顺序执行）
+    
+    返回每个阶段的结果和耗时；某个阶段失败（重复地址、验证不通过等）时后续阶段不再执行
+    """
+    try:
+        data = request.get_json() or {}
+        stages = data.get('stages') or ['parse', 'dedupe', 'generate', 'validate']
+        unknown = [stage for stage in stages if stage not in PIPELINE_STAGES]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"未知的阶段: {', '.join(map(str, unknown))}（可用: {', '.join(PIPELINE_STAGES)}）"
+            }), 400
+        
+        if 'sites' in data:
+            document = PipelineDocument(sites=data.get('sites') or [], unparsed=data.get('unparsed') or [])
+        elif 'content' in data:
+            document = PipelineDocument(content=data.get('content') or '')
+        else:
+            return jsonify({
+                'success': False,
+                'error': '缺少content或sites字段'
+            }), 400
+        
+        started = time.perf_counter()
+        output = {}
+        results = []
+        failed_stage = None
+        for i, stage in enumerate(stages):
+            stage_started = time.perf_counter()
+            try:
+                result = run_pipeline_stage(stage, document, output, saving='save' in stages[i + 1:])
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)}
+            result['stage'] = stage
+            result['duration_ms'] = round((time.perf_counter() - stage_started) * 1000, 2)
+            results.append(result)
+            if not result['ok']:
+                failed_stage = stage
+                break
+        
+        return jsonify({
+            'success': failed_stage is None,
+            'failed_stage': failed_stage,
+            'stages': results,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            **output
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/templates', methods=['GET'])
+@cached_json_response()
 def get_templates():
     """获取配置模板"""
     templates = {
@@ -975,6 +3132,7 @@ def get_templates():
     })
 
 @app.route('/api/directives', methods=['GET'])
+@cached_json_response(directives_cache_version)
 def get_directives_config():
     """获取所有指令配置（合并后的）"""
     try:
@@ -996,6 +3154,7 @@ def get_directives_config():
         }), 500
 
 @app.route('/api/directives/<directive_name>', methods=['GET'])
+@cached_json_response(directives_cache_version)
 def get_directive_config_api(directive_name):
     """获取指定指令的配置"""
     try:
@@ -1020,6 +3179,7 @@ def get_directive_config_api(directive_name):
         }), 500
 
 @app.route('/api/directives/<directive_name>/options', methods=['GET'])
+@cached_json_response(directives_cache_version)
 def get_directive_options_api(directive_name):
     """获取指定指令的选项列表"""
     try:
@@ -1158,6 +3318,7 @@ def delete_custom_directive_option(directive_name, value):
         }), 500
 
 @app.route('/api/headers', methods=['GET'])
+@cached_json_response(directives_cache_version)
 def get_headers_config():
     """获取HTTP头配置（从配置文件读取）"""
     try:
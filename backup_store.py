@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caddyfile 备份存储
+按内容哈希去重，每个版本保存为相对上一版本的压缩增量，并定期保存完整快照
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl，只保证同一进程内互斥
+    fcntl = None
+
+# 中间变化部分超过该行数时不再做精细比较，直接整体替换
+DELTA_MATCH_MAX_LINES = 5000
+
+
+def make_delta(old: str, new: str) -> List[list]:
+    """
+    计算行级增量
+
+    返回操作列表：["c", start, count] 复制旧版本的行，["i", text] 插入新行
+    """
+    a = old.split('\n')
+    b = new.split('\n')
+
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+
+    ops = []
+    if prefix:
+        ops.append(["c", 0, prefix])
+
+    middle_a = a[prefix:len(a) - suffix]
+    middle_b = b[prefix:len(b) - suffix]
+    if middle_a and middle_b and max(len(middle_a), len(middle_b)) <= DELTA_MATCH_MAX_LINES:
+        matcher = SequenceMatcher(None, middle_a, middle_b, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                ops.append(["c", prefix + i1, i2 - i1])
+            elif j2 > j1:
+                ops.append(["i", '\n'.join(middle_b[j1:j2])])
+    elif middle_b:
+        ops.append(["i", '\n'.join(middle_b)])
+
+    if suffix:
+        ops.append(["c", len(a) - suffix, suffix])
+    return ops
+
+
+def apply_delta(old: str, ops: List[list]) -> str:
+    """将增量应用到旧版本，得到新版本"""
+    a = old.split('\n')
+    lines = []
+    for op in ops:
+        if op[0] == "c":
+            lines.extend(a[op[1]:op[1] + op[2]])
+        else:
+            lines.extend(op[1].split('\n'))
+    return '\n'.join(lines)
+
+
+def content_hash(content: str) -> str:
+    """计算内容哈希"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text: str) -> int:
+    """解析时长（如 30s、15m、1h、7d），返回秒数"""
+    text = text.strip().lower()
+    if text[-1:] in DURATION_UNITS:
+        return int(float(text[:-1]) * DURATION_UNITS[text[-1]])
+    return int(float(text))
+
+
+def parse_retention_policy(policy: str) -> List[Tuple[int, int]]:
+    """
+    解析分级保留策略
+
+    格式: "1h:all,1d:1h,30d:1d" 表示最近1小时全部保留，1天内每小时保留一个，30天内每天保留一个
+    返回: [(最大时间跨度秒数, 分桶秒数), ...]，分桶为 0 表示全部保留
+    """
+    tiers = []
+    for item in policy.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        max_age, _, bucket = item.partition(':')
+        bucket = bucket.strip().lower()
+        tiers.append((parse_duration(max_age), 0 if bucket in ('', 'all') else parse_duration(bucket)))
+    tiers.sort()
+    return tiers
+
+
+def select_retained(versions: List[Dict[str, Any]], tiers: List[Tuple[int, int]],
+                    now: Optional[float] = None, max_versions: Optional[int] = None) -> Set[int]:
+    """
+    按分级策略选出需要保留的版本序号
+
+    每个时间段内按分桶保留最新的一个版本；超出所有时间段的版本不保留，
+    最新的版本始终保留。max_versions 为可选的总数量上限（优先保留较新的版本），默认不限制。
+    """
+    now = time.time() if now is None else now
+    keep = []
+    seen_buckets = set()
+    for i, version in enumerate(reversed(versions)):
+        if i == 0:
+            keep.append(version['seq'])
+            continue
+        age = now - version['time']
+        for max_age, bucket in tiers:
+            if age <= max_age:
+                if not bucket:
+                    keep.append(version['seq'])
+                else:
+                    key = (max_age, int(version['time'] // bucket))
+                    if key not in seen_buckets:
+                        seen_buckets.add(key)
+                        keep.append(version['seq'])
+                break
+    if max_versions is not None:
+        keep = keep[:max_versions]
+    return set(keep)
+
+
+class BackupStore:
+    """
+    增量备份存储
+
+    目录结构:
+        objects/<hash>.full          完整快照（zlib压缩）
+        objects/<hash>.<base>.delta  相对 base 的增量（zlib压缩的JSON）
+        versions.jsonl               版本清单（只追加），每行一个版本：
+                                     seq、time、hash、size 及调用方附加的信息（如 site_count）
+    """
+
+    def __init__(self, root: str, snapshot_interval: int = 20, cache_size: int = 8):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.journal_path = os.path.join(root, 'versions.jsonl')
+        self.snapshot_interval = snapshot_interval
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._versions = None  # 版本列表（按时间从旧到新）
+        self._objects = None  # hash -> base hash（完整快照为 None）
+        self._cache = OrderedDict()  # hash -> content，最近访问的版本内容
+        self._journal_id = None  # 已加载的版本清单文件（inode），被其他进程重写后变化
+        self._journal_offset = 0  # 已读取到的位置，之后只读取其他进程追加的部分
+
+    def exists(self) -> bool:
+        """存储是否已创建"""
+        return os.path.exists(self.journal_path)
+
+    # 以下 _scan_objects ... _delete_blob 为底层存储操作，其他存储后端（如Redis）可以覆盖
+
+    def _scan_objects(self) -> Dict[str, Optional[str]]:
+        """列出所有对象: hash -> base hash（完整快照为 None）"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        objects = {}
+        for entry in os.scandir(self.objects_dir):
+            parts = entry.name.split('.')
+            if len(parts) == 2 and parts[1] == 'full':
+                objects[parts[0]] = None
+            elif len(parts) == 3 and parts[2] == 'delta':
+                objects[parts[0]] = parts[1]
+        return objects
+
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        """读取版本清单"""
+        return self._read_journal_from(0)
+
+    def _read_journal_from(self, offset: int) -> List[Dict[str, Any]]:
+        """从 offset 开始读取版本清单中完整的行，并记录读取到的位置"""
+        versions = []
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            self._journal_id, self._journal_offset = None, 0
+            return versions
+        with f:
+            self._journal_id = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # 其他进程正在追加的行，下次再读取
+                    break
+                offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    versions.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    # 跳过写入中断产生的不完整行
+                    continue
+        self._journal_offset = offset
+        return versions
+
+    @contextmanager
+    def _exclusive(self):
+        """跨进程互斥：分配序号并追加版本、重写版本清单期间持有（其他存储后端可以覆盖）"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_blob(self, obj_hash: str) -> bytes:
+        """读取对象的压缩数据"""
+        with open(self._object_path(obj_hash), 'rb') as f:
+            return f.read()
+
+    def _commit(self, obj: Optional[Tuple[str, Optional[str], bytes]], version: Dict[str, Any]):
+        """写入新对象（可选）并追加版本记录"""
+        if obj is not None:
+            self._write_object(*obj)
+        with open(self.journal_path, 'ab') as f:
+            f.write((json.dumps(version, ensure_ascii=False) + '\n').encode('utf-8'))
+            # 持有 _exclusive 时没有其他进程追加，自己写入的行不需要再读取
+            self._journal_id = os.fstat(f.fileno()).st_ino
+            self._journal_offset = f.tell()
+
+    def _rewrite_journal(self, versions: List[Dict[str, Any]]):
+        """原子地重写版本清单"""
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for version in versions:
+                f.write(json.dumps(version, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.journal_path)
+        stat = os.stat(self.journal_path)
+        self._journal_id, self._journal_offset = stat.st_ino, stat.st_size
+
+    def _delete_blob(self, obj_hash: str):
+        """删除对象"""
+        try:
+            os.remove(self._object_path(obj_hash))
+        except FileNotFoundError:
+            pass
+
+    def _load(self):
+        """
+        首次使用时加载版本日志和对象列表；之后每次访问只读取其他进程追加的版本，
+        版本清单被其他进程重写（清理）后重新加载
+        """
+        try:
+            stat = os.stat(self.journal_path)
+            journal_id, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            journal_id, size = None, 0
+        if self._versions is not None and journal_id == self._journal_id and size == self._journal_offset:
+            return
+        if self._versions is None or journal_id != self._journal_id or size < self._journal_offset:
+            self._objects = self._scan_objects()
+            self._versions = [v for v in self._read_journal_from(0) if v.get('hash') in self._objects]
+            return
+        new_versions = self._read_journal_from(self._journal_offset)
+        if any(v.get('hash') not in self._objects for v in new_versions):
+            self._objects = self._scan_objects()
+        self._versions.extend(v for v in new_versions if v.get('hash') in self._objects)
+
+    def _depth(self, obj_hash: str) -> int:
+        """对象到最近完整快照的增量层数"""
+        depth = 0
+        base = self._objects.get(obj_hash)
+        while base is not None:
+            depth += 1
+            base = self._objects.get(base)
+        return depth
+
+    def _object_path(self, obj_hash: str) -> str:
+        base = self._objects.get(obj_hash)
+        if base is None:
+            return os.path.join(self.objects_dir, f"{obj_hash}.full")
+        return os.path.join(self.objects_dir, f"{obj_hash}.{base}.delta")
+
+    def _write_object(self, obj_hash: str, base: Optional[str], data: bytes):
+        """原子写入对象文件"""
+        name = f"{obj_hash}.full" if base is None else f"{obj_hash}.{base}.delta"
+        path = os.path.join(self.objects_dir, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remember(self, obj_hash: str, content: str):
+        self._cache[obj_hash] = content
+        self._cache.move_to_end(obj_hash)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def read_object(self, obj_hash: str) -> str:
+        """读取对象内容（沿增量链回溯到完整快照再依次应用）"""
+        with self._lock:
+            self._load()
+            chain = []
+            current = obj_hash
+            content = None
+            while current is not None:
+                if current in self._cache:
+                    content = self._cache[current]
+                    break
+                data = zlib.decompress(self._read_blob(current))
+                base = self._objects.get(current)
+                if base is None:
+                    content = data.decode('utf-8')
+                    break
+                chain.append(json.loads(data.decode('utf-8')))
+                current = base
+
+            for ops in reversed(chain):
+                content = apply_delta(content, ops)
+            self._remember(obj_hash, content)
+            return content
+
+    def add(self, content: str, timestamp: Optional[float] = None, **meta) -> Dict[str, Any]:
+        """
+        添加一个版本
+
+        内容已存在时只记录版本，不重复保存；否则保存为相对上一版本的增量，
+        增量链达到 snapshot_interval 或增量不比完整内容小时保存完整快照。
+        """
+        obj_hash = content_hash(content)
+        with self._lock, self._exclusive():
+            # 持有跨进程锁后重新读取其他进程追加的版本，再分配序号
+            self._load()
+            obj = None
+            if obj_hash not in self._objects:
+                base = self._versions[-1]['hash'] if self._versions else None
+                full = zlib.compress(content.encode('utf-8'))
+                obj = (obj_hash, None, full)
+                if base is not None and self._depth(base) + 1 < self.snapshot_interval:
+                    ops = make_delta(self.read_object(base), content)
+                    delta = zlib.compress(json.dumps(ops, ensure_ascii=False).encode('utf-8'))
+                    if len(delta) < len(full):
+                        obj = (obj_hash, base, delta)
+
+            version = {
+                'seq': self._next_seq(),
+                'time': timestamp if timestamp is not None else time.time(),
+                'hash': obj_hash,
+                'size': len(content.encode('utf-8')),
+                **meta
+            }
+            self._commit(obj, version)
+            if obj is not None:
+                self._objects[obj_hash] = obj[1]
+            self._remember(obj_hash, content)
+            self._versions.append(version)
+            return version
+
+    def _next_seq(self) -> int:
+        """下一个版本序号"""
+        return self._versions[-1]['seq'] + 1 if self._versions else 1
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """所有版本（从旧到新）"""
+        with self._lock:
+            self._load()
+            return list(self._versions)
+
+    def count(self) -> int:
+        """版本数量"""
+        with self._lock:
+            self._load()
+            return len(self._versions)
+
+    def page(self, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """分页获取版本（从新到旧）"""
+        with self._lock:
+            self._load()
+            end = len(self._versions) - offset
+            if end <= 0:
+                return []
+            start = max(end - limit, 0)
+            return self._versions[start:end][::-1]
+
+    def get(self, seq: int) -> Optional[Dict[str, Any]]:
+        """按序号获取版本"""
+        with self._lock:
+            self._load()
+            for version in reversed(self._versions):
+                if version['seq'] == seq:
+                    return version
+            return None
+
+    def read(self, seq: int) -> Optional[str]:
+        """读取指定版本的内容"""
+        version = self.get(seq)
+        if version is None:
+            return None
+        return self.read_object(version['hash'])
+
+    def prune(self, keep_seqs, max_seq: Optional[int] = None) -> int:
+        """
+        只保留指定序号的版本，并删除不再被引用的对象
+
+        Args:
+            keep_seqs: 要保留的版本序号
+            max_seq: 只清理序号不超过该值的版本（计算 keep_seqs 之后其他线程或副本新增的版本总是保留）
+
+        返回: 删除的版本数量
+        """
+        keep_seqs = set(keep_seqs)
+        with self._lock, self._exclusive():
+            self._load()
+            kept = [v for v in self._versions
+                    if v['seq'] in keep_seqs or (max_seq is not None and v['seq'] > max_seq)]
+            removed = len(self._versions) - len(kept)
+            if not removed:
+                return 0
+
+            # 重写版本日志
+            self._rewrite_journal(kept)
+            self._versions = kept
+
+            # 保留的版本及其增量链上的对象都需要保留
+            live = set()
+            for version in kept:
+                current = version['hash']
+                while current is not None and current not in live:
+                    live.add(current)
+                    current = self._objects.get(current)
+
+            for obj_hash in [h for h in self._objects if h not in live]:
+                self._delete_blob(obj_hash)
+                del self._objects[obj_hash]
+                self._cache.pop(obj_hash, None)
+            return removed
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动性能测试
+测量 app 模块的导入时间，以及从启动进程到第一个请求返回的时间
+
+用法: python bench_startup.py [次数]
+"""
+
+import os
+import sys
+import time
+import socket
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = 'import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def bench_env(port: int = 0) -> dict:
+    env = dict(os.environ)
+    env.setdefault('WATCH_CADDYFILE', 'false')
+    env.setdefault('CADDYFILE_PATH', os.path.join(ROOT, 'Caddyfile'))
+    env['PORT'] = str(port)
+    env['HOST'] = '127.0.0.1'
+    return env
+
+
+def measure_import() -> float:
+    """在新进程中导入 app 模块，返回耗时（秒）"""
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, env=bench_env())
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def measure_first_response(path: str = '/api/caddyfile', timeout: float = 30) -> float:
+    """启动服务进程并轮询，返回从启动到第一个成功响应的耗时（秒）"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=bench_env(port),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=1) as response:
+                    response.read()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError('服务未能在超时时间内响应')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name: str, samples):
+    samples_ms = [s * 1000 for s in samples]
+    print(f'{name}: 中位数 {statistics.median(samples_ms):.1f}ms，'
+          f'最小 {min(samples_ms):.1f}ms，最大 {max(samples_ms):.1f}ms（{len(samples_ms)} 次）')
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    # 预热一次，生成 .pyc
+    measure_import()
+    report('导入时间', [measure_import() for _ in range(runs)])
+    report('首个响应时间', [measure_first_response() for _ in range(runs)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量修改站点
+按站点地址通配符、指令名和参数匹配指令，执行 set / replace / insert / delete 操作。
+所有操作在一次遍历中完成，只复制被修改的站点，未修改的站点与原文档共享。
+
+操作格式:
+    {
+        "match": {
+            "site": "*.example.com",       # 站点地址通配符（匹配整个地址或其中任意一个地址），默认 *
+            "directive": "tls",            # 指令名（set/replace/delete 必填）
+            "args": ["/data/ssl/*.pem"],   # 参数通配符，按位置只比较给出的前几个参数
+            "args_regex": "uvp\\.cc",       # 参数（空格连接）的正则表达式
+            "recursive": true              # 是否匹配嵌套的指令，默认 true
+        },
+        "action": "set",                   # set | replace | insert | delete
+        "args": [...],                     # set: 新参数
+        "name": "...",                     # set: 新指令名（可选）
+        "pattern": "...",                  # replace: 对每个参数执行的正则替换
+        "replacement": "...",
+        "directive": {"name", "args", "directives"},  # insert: 要插入的指令
+        "position": "last",                # insert: first | last
+        "unless_exists": true              # insert: 目标位置已有相同指令时跳过，默认 true
+    }
+
+insert 未指定 match.directive 时插入到站点顶层，否则插入到匹配指令的块中
+"""
+
+import re
+import copy
+from fnmatch import fnmatchcase
+from typing import List, Dict, Any, Optional, Tuple
+
+from caddyfile_diff import directive_text
+
+ACTIONS = ('set', 'replace', 'insert', 'delete')
+
+ADDRESS_SPLIT_RE = re.compile(r'[,\s]+')
+
+
+def _string_list(value, field: str) -> List[str]:
+    if not isinstance(value, list) or not all(isinstance(item, (str, int, float)) for item in value):
+        raise ValueError(f'{field} 必须是字符串列表')
+    return [str(item) for item in value]
+
+
+def _normalize_directive(value) -> Dict[str, Any]:
+    """校验并规范化要插入的指令"""
+    if not isinstance(value, dict) or not str(value.get('name') or '').strip():
+        raise ValueError('insert 操作需要 directive.name')
+    return {
+        'name': str(value['name']).strip(),
+        'args': _string_list(value.get('args', []), 'directive.args'),
+        'directives': [_normalize_directive(child) for child in value.get('directives', [])]
+    }
+
+
+class Operation:
+    """编译后的单个批量操作"""
+
+    def __init__(self, spec: Dict[str, Any], index: int):
+        if not isinstance(spec, dict):
+            raise ValueError(f'第 {index + 1} 个操作格式错误')
+        self.index = index
+        self.action = spec.get('action')
+        if self.action not in ACTIONS:
+            raise ValueError(f'第 {index + 1} 个操作的 action 必须是 {"/".join(ACTIONS)} 之一')
+
+        match = spec.get('match') or {}
+        if not isinstance(match, dict):
+            raise ValueError(f'第 {index + 1} 个操作的 match 格式错误')
+        self.site_pattern = str(match.get('site') or '*')
+        self.name = match.get('directive')
+        self.arg_patterns = _string_list(match['args'], 'match.args') if 'args' in match else None
+        try:
+            self.args_regex = re.compile(match['args_regex']) if match.get('args_regex') else None
+        except re.error as e:
+            raise ValueError(f'第 {index + 1} 个操作的 args_regex 无效: {e}')
+        self.recursive = match.get('recursive', True)
+        if self.action != 'insert' and not self.name:
+            raise ValueError(f'第 {index + 1} 个操作（{self.action}）需要 match.directive')
+
+        if self.action == 'set':
+            self.new_args = _string_list(spec.get('args'), 'args') if 'args' in spec else None
+            self.new_name = str(spec['name']).strip() if spec.get('name') else None
+            if self.new_args is None and self.new_name is None:
+                raise ValueError(f'第 {index + 1} 个操作（set）需要 args 或 name')
+        elif self.action == 'replace':
+            try:
+                self.pattern = re.compile(spec.get('pattern') or '')
+            except re.error as e:
+                raise ValueError(f'第 {index + 1} 个操作的 pattern 无效: {e}')
+            if not self.pattern.pattern:
+                raise ValueError(f'第 {index + 1} 个操作（replace）需要 pattern')
+            self.replacement = str(spec.get('replacement', ''))
+        elif self.action == 'insert':
+            self.directive = _normalize_directive(spec.get('directive'))
+            self.position = spec.get('position', 'last')
+            if self.position not in ('first', 'last'):
+                raise ValueError(f'第 {index + 1} 个操作的 position 必须是 first 或 last')
+            self.unless_exists = spec.get('unless_exists', True)
+
+        self.matched_sites = 0
+        self.changes = 0
+
+    def match_site(self, site: Dict[str, Any]) -> bool:
+        address = (site.get('address') or '').strip()
+        if fnmatchcase(address, self.site_pattern):
+            return True
+        return any(fnmatchcase(part, self.site_pattern) for part in ADDRESS_SPLIT_RE.split(address) if part)
+
+    def match_directive(self, directive: Dict[str, Any]) -> bool:
+        if self.name and directive.get('name') != self.name:
+            return False
+        args = [str(arg) for arg in directive.get('args', [])]
+        if self.arg_patterns is not None:
+            if len(args) < len(self.arg_patterns):
+                return False
+            if not all(fnmatchcase(arg, pattern) for arg, pattern in zip(args, self.arg_patterns)):
+                return False
+        if self.args_regex is not None and not self.args_regex.search(' '.join(args)):
+            return False
+        return True
+
+    def apply(self, site: Dict[str, Any], changes: List[Dict[str, Any]]):
+        """对站点（已复制）执行操作，变更记录追加到 changes"""
+        address = (site.get('address') or '').strip()
+        before = len(changes)
+        if self.action == 'insert' and not self.name:
+            self._insert(site.setdefault('directives', []), address, [], changes)
+        else:
+            self._apply_list(site.setdefault('directives', []), address, [], changes)
+        self.changes += len(changes) - before
+
+    def _change(self, address: str, path: List[str], before: Optional[str], after: Optional[str]) -> Dict[str, Any]:
+        return {'site': address, 'path': path, 'operation': self.index, 'action': self.action,
+                'before': before, 'after': after}
+
+    def _insert(self, directives: List[Dict[str, Any]], address: str, path: List[str], changes: List[Dict[str, Any]]):
+        new_directive = copy.deepcopy(self.directive)
+        if self.unless_exists and any(
+                d.get('name') == new_directive['name'] and [str(a) for a in d.get('args', [])] == new_directive['args']
+                for d in directives):
+            return
+        if self.position == 'first':
+            directives.insert(0, new_directive)
+        else:
+            directives.append(new_directive)
+        changes.append(self._change(address, path, None, directive_text(new_directive)))
+
+    def _apply_list(self, directives: List[Dict[str, Any]], address: str, path: List[str],
+                    changes: List[Dict[str, Any]]):
+        kept = []
+        for directive in directives:
+            text = directive_text(directive)
+            matched = self.match_directive(directive)
+            if matched and self.action == 'delete':
+                changes.append(self._change(address, path, text, None))
+                continue
+            # 先处理子指令，新插入的指令不会再被本操作匹配
+            if self.recursive and directive.get('directives'):
+                self._apply_list(directive['directives'], address, path + [text], changes)
+            if matched:
+                if self.action == 'insert':
+                    self._insert(directive.setdefault('directives', []), address, path + [text], changes)
+                else:
+                    self._update(directive, address, path, text, changes)
+            kept.append(directive)
+        directives[:] = kept
+
+    def _update(self, directive: Dict[str, Any], address: str, path: List[str], text: str,
+                changes: List[Dict[str, Any]]):
+        args = [str(arg) for arg in directive.get('args', [])]
+        if self.action == 'set':
+            new_name = self.new_name or directive.get('name')
+            new_args = self.new_args if self.new_args is not None else args
+        else:
+            new_name = directive.get('name')
+            new_args = [self.pattern.sub(self.replacement, arg) for arg in args]
+        if new_name == directive.get('name') and new_args == args:
+            return
+        directive['name'] = new_name
+        directive['args'] = list(new_args)
+        changes.append(self._change(address, path, text, directive_text(directive)))
+
+
+def compile_operations(specs) -> List[Operation]:
+    """校验并编译操作列表，格式错误时抛出 ValueError"""
+    if not isinstance(specs, list) or not specs:
+        raise ValueError('operations 必须是非空列表')
+    return [Operation(spec, i) for i, spec in enumerate(specs)]
+
+
+def apply_operations(sites: List[Dict[str, Any]], operations: List[Operation]
+                     ) -> Tuple[List[Dict[str, Any]], List[int], List[Dict[str, Any]]]:
+    """
+    一次遍历所有站点，依次执行匹配该站点的操作
+
+    返回: (新站点列表, 被修改的站点索引, 变更记录)；原站点不会被修改
+    """
+    new_sites = list(sites)
+    changed = []
+    changes = []
+    for i, site in enumerate(sites):
+        matching = [op for op in operations if op.match_site(site)]
+        if not matching:
+            continue
+        # 只复制匹配到的站点，没有实际变更时丢弃副本
+        new_site = copy.deepcopy(site)
+        site_changes = []
+        for op in matching:
+            op.matched_sites += 1
+            op.apply(new_site, site_changes)
+        if site_changes:
+            new_sites[i] = new_site
+            changed.append(i)
+            changes.extend(site_changes)
+    return new_sites, changed, changes
+
+
+def summarize(operations: List[Operation], changed: List[int], changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """变更摘要"""
+    return {
+        'sites_changed': len(changed),
+        'changes': len(changes),
+        'operations': [{'index': op.index, 'action': op.action, 'matched_sites': op.matched_sites,
+                        'changes': op.changes} for op in operations]
+    }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caddy 集群推送
+通过各节点的 admin API（POST /load）并发推送配置，每个节点复用长连接，
+支持单节点总超时（包括连接、发送和读取响应，不是单次socket操作的超时）
+和金丝雀顺序（先推送部分节点，成功后再推送其余节点）
+"""
+
+import time
+import queue
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit
+
+# 节点返回的错误信息最多保留的长度
+MAX_ERROR_LENGTH = 2000
+
+# 读取响应时每次最多读取的字节数（每次读取前按剩余时间重新设置socket超时）
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _remaining(deadline: float) -> float:
+    """距离截止时间的剩余秒数，已超时时抛出 TimeoutError"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError('请求超时')
+    return remaining
+
+
+class FleetNode:
+    """一个 Caddy admin 端点，维护一组可复用的 HTTP 连接"""
+
+    def __init__(self, url: str, pool_size: int = 2):
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url if '://' in self.url else f'http://{self.url}')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self, timeout: float) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout: float) -> http.client.HTTPConnection:
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect(timeout)
+        self._set_timeout(connection, timeout)
+        return connection
+
+    @staticmethod
+    def _set_timeout(connection: http.client.HTTPConnection, timeout: float):
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+    def _read(self, connection: http.client.HTTPConnection, response: http.client.HTTPResponse,
+              deadline: float) -> bytes:
+        """分块读取响应，每块之前按剩余时间设置超时，持续缓慢返回数据的节点也不会超过截止时间"""
+        chunks = []
+        while True:
+            self._set_timeout(connection, _remaining(deadline))
+            chunk = response.read1(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        # 内容读完后 read() 返回空内容并结束本次响应，连接才能继续复用
+        response.read()
+        return b''.join(chunks)
+
+    def _release(self, connection: http.client.HTTPConnection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method: str, path: str, body: bytes, headers: Dict[str, str], timeout: float):
+        """
+        发送请求，返回 (状态码, 响应内容)；复用的连接已被对方关闭时重新连接一次
+
+        timeout 为整个请求（包括重新连接、发送和读取响应）的总时间，超过时抛出 TimeoutError
+        """
+        deadline = time.monotonic() + timeout
+        for attempt in range(2):
+            connection = self._acquire(_remaining(deadline))
+            reused = connection.sock is not None
+            try:
+                connection.request(method, self.base_path + path, body=body, headers=headers)
+                self._set_timeout(connection, _remaining(deadline))
+                response = connection.getresponse()
+                data = self._read(connection, response, deadline)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            return response.status, data
+        raise ConnectionError('连接已关闭')
+
+    def load(self, content: str, timeout: float, adapter: str = 'caddyfile') -> Dict[str, Any]:
+        """推送配置（POST /load），返回该节点的结果"""
+        started = time.perf_counter()
+        result = {'node': self.url, 'ok': False, 'status': None, 'error': None}
+        try:
+            status, data = self.request('POST', '/load', content.encode('utf-8'),
+                                        {'Content-Type': f'text/{adapter}'}, timeout)
+            result['status'] = status
+            result['ok'] = 200 <= status < 300
+            if not result['ok']:
+                result['error'] = data.decode('utf-8', errors='replace')[:MAX_ERROR_LENGTH] or f'HTTP {status}'
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+        result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+
+class Fleet:
+    """
+    Caddy 节点集群
+
+    push() 使用有界线程池并发推送，总耗时约等于最慢节点的耗时
+    """
+
+    def __init__(self, urls: List[str], max_workers: int = 8, timeout: float = 10):
+        self.nodes = [FleetNode(url) for url in urls]
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.nodes) or 1)),
+                                            thread_name_prefix='caddy-fleet')
+        self._lock = threading.Lock()
+        self.last_result = None
+
+    def _push_nodes(self, nodes: List[FleetNode], content: str) -> List[Dict[str, Any]]:
+        futures = [self._executor.submit(node.load, content, self.timeout) for node in nodes]
+        return [future.result() for future in futures]
+
+    def push(self, content: str, canary: int = 0, nodes: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        推送配置到所有（或指定的）节点
+
+        Args:
+            content: Caddyfile 内容
+            canary: 先推送的金丝雀节点数量；金丝雀节点有失败时不再推送其余节点
+            nodes: 只推送这些节点（为 None 时推送全部）
+
+        返回: {"success", "duration_ms", "ok", "failed", "skipped", "results": [...]}
+        """
+        targets = self.nodes if nodes is None else [node for node in self.nodes if node.url in nodes]
+        started = time.perf_counter()
+        # 同一时间只进行一次推送，避免两个版本交错到达各节点
+        with self._lock:
+            canary_nodes = targets[:canary] if canary > 0 else []
+            results = []
+            if canary_nodes:
+                results = self._push_nodes(canary_nodes, content)
+                for result in results:
+                    result['canary'] = True
+            remaining = targets[len(canary_nodes):]
+            if all(result['ok'] for result in results):
+                results.extend(self._push_nodes(remaining, content))
+            else:
+                results.extend({'node': node.url, 'ok': False, 'skipped': True,
+                                'error': '金丝雀节点推送失败，已跳过'} for node in remaining)
+
+            summary = {
+                'success': bool(results) and all(result['ok'] for result in results),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'ok': sum(1 for result in results if result['ok']),
+                'failed': sum(1 for result in results if not result['ok'] and not result.get('skipped')),
+                'skipped': sum(1 for result in results if result.get('skipped')),
+                'results': results
+            }
+            self.last_result = summary
+            return summary
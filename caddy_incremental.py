@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通过 Caddy admin API 增量应用配置
+比较正在运行的JSON配置（GET /config/）和新配置（caddy adapt 的输出），
+找出包含全部变更的最小公共子树，只用一个请求替换它：
+
+    PATCH /config/<公共祖先路径>   请求体为新配置中该路径的子树
+
+Caddy 对 /config 的每个写请求都会完整重载一次配置，逐个变更发送请求会导致多次重载，
+并且中途失败时留下只应用了一部分的配置，因此所有变更合并为一次 PATCH。
+公共祖先为根、子树大小超过阈值、正在运行的配置为空或 PATCH 失败时，退回完整的 POST /load
+"""
+
+import json
+import time
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional
+from urllib.parse import quote, unquote
+
+from caddy_fleet import FleetNode, MAX_ERROR_LENGTH
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# 结果中最多列出的变更路径数量
+MAX_REPORTED_PATHS = 20
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _child(path: str, key) -> str:
+    return f'{path}/{quote(str(key), safe="")}'
+
+
+def diff_config(old, new, path: str = '') -> List[Dict[str, Any]]:
+    """
+    计算把 old 修改为 new 的admin API操作列表，按顺序执行
+
+    每个操作为 {"method", "path", "value"?}，path 相对于 /config
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        # 键中含有 / 时无法用路径定位，整体替换该对象
+        if any('/' in key or not key for key in list(old) + list(new)):
+            return [{'method': 'PATCH', 'path': path, 'value': new}]
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({'method': 'DELETE', 'path': _child(path, key)})
+        for key, value in new.items():
+            if key not in old:
+                operations.append({'method': 'PUT', 'path': _child(path, key), 'value': value})
+            else:
+                operations.extend(diff_config(old[key], value, _child(path, key)))
+        return operations
+    if isinstance(old, list) and isinstance(new, list):
+        return _diff_list(old, new, path)
+    return [{'method': 'PATCH', 'path': path, 'value': new}]
+
+
+def _diff_list(old: list, new: list, path: str) -> List[Dict[str, Any]]:
+    """按元素对齐数组；从后往前生成操作，前面元素的索引在执行过程中保持不变"""
+    matcher = SequenceMatcher(None, [_dumps(item) for item in old], [_dumps(item) for item in new], autojunk=False)
+    operations = []
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        for k in range(i2 - 1, i1 + paired - 1, -1):
+            operations.append({'method': 'DELETE', 'path': _child(path, k)})
+        # PUT 到索引位置为插入，倒序插入后顺序正确
+        for j in range(j2 - 1, j1 + paired - 1, -1):
+            operations.append({'method': 'PUT', 'path': _child(path, i1 + paired), 'value': new[j]})
+        for k in range(paired - 1, -1, -1):
+            operations.extend(diff_config(old[i1 + k], new[j1 + k], _child(path, i1 + k)))
+    return operations
+
+
+def common_ancestor(operations: List[Dict[str, Any]]) -> str:
+    """
+    包含全部操作的最小公共子树路径（相对于 /config，根为空字符串）
+
+    PATCH 修改路径本身；PUT / DELETE 会改变所在的对象或数组（数组插入/删除会移动后面元素的索引），
+    因此取其父路径
+    """
+    prefix = None
+    for op in operations:
+        segments = op['path'].split('/')[1:]
+        if op['method'] != 'PATCH':
+            segments = segments[:-1]
+        if prefix is None:
+            prefix = segments
+        else:
+            size = 0
+            while size < min(len(prefix), len(segments)) and prefix[size] == segments[size]:
+                size += 1
+            prefix = prefix[:size]
+    return ''.join(f'/{segment}' for segment in prefix or [])
+
+
+def lookup(config, path: str):
+    """按 common_ancestor 返回的路径取出配置中的子树"""
+    value = config
+    for segment in path.split('/')[1:]:
+        key = unquote(segment)
+        value = value[int(key)] if isinstance(value, list) else value[key]
+    return value
+
+
+class IncrementalApplier:
+    """
+    向一个 Caddy admin 端点增量应用JSON配置
+
+    max_ratio: 要替换的子树超过完整配置大小的该比例时退回完整加载
+    """
+
+    def __init__(self, url: str, timeout: float = 10, max_ratio: float = 0.5):
+        self.node = FleetNode(url)
+        self.timeout = timeout
+        self.max_ratio = max_ratio
+        self.last_result = None
+
+    def _error(self, status: int, data: bytes) -> str:
+        return data.decode('utf-8', errors='replace')[:MAX_ERROR_LENGTH] or f'HTTP {status}'
+
+    def running_config(self):
+        """正在运行的配置（没有配置时返回 None）"""
+        status, data = self.node.request('GET', '/config/', None, {}, self.timeout)
+        if status != 200:
+            raise RuntimeError(f'读取当前配置失败: {self._error(status, data)}')
+        return json.loads(data) if data.strip() else None
+
+    def load(self, body: bytes) -> Optional[str]:
+        """完整加载（POST /load），返回错误信息（成功时为 None）"""
+        status, data = self.node.request('POST', '/load', body, JSON_HEADERS, self.timeout)
+        return None if 200 <= status < 300 else self._error(status, data)
+
+    def patch(self, path: str, body: bytes) -> Optional[str]:
+        """用一个 PATCH 请求替换子树，返回错误信息（成功时为 None）"""
+        status, data = self.node.request('PATCH', f'/config{path}', body, JSON_HEADERS, self.timeout)
+        return None if 200 <= status < 300 else f'PATCH {path} 失败: {self._error(status, data)}'
+
+    def apply(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        应用新配置
+
+        返回: {"ok", "mode": unchanged|incremental|load, "operations", "paths", "patch_path", "bytes",
+               "full_bytes", "fallback_reason", "error", "duration_ms"}
+        """
+        started = time.perf_counter()
+        body = _dumps(config).encode('utf-8')
+        result = {'ok': False, 'mode': None, 'operations': 0, 'paths': [], 'patch_path': None, 'bytes': 0,
+                  'full_bytes': len(body), 'fallback_reason': None, 'error': None}
+        try:
+            current = self.running_config()
+            operations = diff_config(current, config) if isinstance(current, dict) else None
+            if operations is None:
+                result['fallback_reason'] = '当前没有运行中的配置'
+            elif not operations:
+                result['ok'] = True
+                result['mode'] = 'unchanged'
+            else:
+                result['operations'] = len(operations)
+                result['paths'] = [f"{op['method']} {op['path'] or '/'}" for op in operations[:MAX_REPORTED_PATHS]]
+                path = common_ancestor(operations)
+                patch_body = _dumps(lookup(config, path)).encode('utf-8')
+                result['bytes'] = len(patch_body)
+                if not path:
+                    result['fallback_reason'] = '变更分布在配置的顶层'
+                elif len(patch_body) > len(body) * self.max_ratio:
+                    result['fallback_reason'] = f'变更的子树超过完整配置的 {int(self.max_ratio * 100)}%'
+                else:
+                    result['patch_path'] = path
+                    result['fallback_reason'] = self.patch(path, patch_body)
+                    if result['fallback_reason'] is None:
+                        result['ok'] = True
+                        result['mode'] = 'incremental'
+
+            if not result['ok']:
+                # 完整加载；PATCH 失败时 Caddy 保留原配置，完整加载同样是一次原子的替换
+                result['mode'] = 'load'
+                result['error'] = self.load(body)
+                result['ok'] = result['error'] is None
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+        result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self.last_result = {key: value for key, value in result.items() if key != 'paths'}
+        return result
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caddyfile 结构化差异比较
+为每个站点和指令子树计算哈希，哈希相同的子树直接跳过，只比较真正变化的部分
+"""
+
+import hashlib
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple
+
+# 哈希树节点: (digest, directive, children)
+Node = Tuple[bytes, Dict[str, Any], list]
+
+
+def _digest(*parts) -> bytes:
+    return hashlib.sha1(b'\0'.join(part.encode('utf-8') if isinstance(part, str) else part for part in parts)).digest()
+
+
+def build_directive_tree(directives: List[Dict[str, Any]]) -> List[Node]:
+    """递归计算指令子树哈希"""
+    nodes = []
+    for directive in directives:
+        children = build_directive_tree(directive.get("directives", []))
+        digest = _digest(
+            directive.get("name", ""),
+            *[str(arg) for arg in directive.get("args", [])],
+            b'{',
+            *[child[0] for child in children]
+        )
+        nodes.append((digest, directive, children))
+    return nodes
+
+
+def build_tree(sites: List[Dict[str, Any]]) -> Dict[str, Tuple[bytes, Dict[str, Any], List[Node]]]:
+    """
+    计算文档的哈希树
+
+    返回: {address: (site_digest, site, directive_nodes)}
+    站点哈希包含地址、备注和所有指令，不包含行号
+    """
+    tree = {}
+    for site in sites:
+        address = (site.get("address") or "").strip()
+        children = build_directive_tree(site.get("directives", []))
+        digest = _digest(address, site.get("notes", "") or "", b'{', *[child[0] for child in children])
+        tree.setdefault(address, (digest, site, children))
+    return tree
+
+
+def directive_text(directive: Dict[str, Any]) -> str:
+    """指令的单行文本表示"""
+    return " ".join([directive.get("name", "")] + [str(arg) for arg in directive.get("args", [])])
+
+
+def _diff_directives(old_nodes: List[Node], new_nodes: List[Node], path: List[str], changes: List[Dict[str, Any]]):
+    """比较两个指令列表，哈希相同的指令按顺序对齐后跳过"""
+    a = [node[0] for node in old_nodes]
+    b = [node[0] for node in new_nodes]
+    if a == b:
+        return
+
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        olds = list(old_nodes[i1:i2])
+        news = list(new_nodes[j1:j2])
+
+        # 同名指令视为修改，其余为新增或删除
+        for new_node in list(news):
+            name = new_node[1].get("name", "")
+            old_node = next((node for node in olds if node[1].get("name", "") == name), None)
+            if old_node is None:
+                continue
+            olds.remove(old_node)
+            news.remove(new_node)
+
+            old_text = directive_text(old_node[1])
+            new_text = directive_text(new_node[1])
+            if old_text != new_text:
+                changes.append({"op": "modified", "path": path + [name], "old": old_text, "new": new_text})
+            _diff_directives(old_node[2], new_node[2], path + [name], changes)
+
+        for node in olds:
+            changes.append({"op": "removed", "path": path + [node[1].get("name", "")], "old": directive_text(node[1])})
+        for node in news:
+            changes.append({"op": "added", "path": path + [node[1].get("name", "")], "new": directive_text(node[1])})
+
+
+def diff_documents(old: Dict[str, Any], new: Dict[str, Any], old_tree: Optional[dict] = None,
+                   new_tree: Optional[dict] = None) -> Dict[str, Any]:
+    """
+    按站点比较两个解析后的文档
+
+    Args:
+        old, new: {"sites": [...], "unparsed": [...]}
+        old_tree, new_tree: 预先计算好的哈希树（可选，用于复用缓存）
+
+    返回:
+    {
+        "summary": {"added": 0, "removed": 0, "modified": 0, "unchanged": 0},
+        "sites": [{"address", "status", "old_line", "new_line", "notes", "changes": [...]}],
+        "unparsed_changed": False
+    }
+    """
+    old_tree = old_tree if old_tree is not None else build_tree(old.get("sites", []))
+    new_tree = new_tree if new_tree is not None else build_tree(new.get("sites", []))
+
+    summary = {"added": 0, "removed": 0, "modified": 0, "unchanged": 0}
+    sites = []
+    for address, (digest, site, children) in new_tree.items():
+        old_entry = old_tree.get(address)
+        if old_entry is None:
+            summary["added"] += 1
+            sites.append({"address": address, "status": "added", "new_line": site.get("line_number")})
+            continue
+        if old_entry[0] == digest:
+            summary["unchanged"] += 1
+            continue
+
+        summary["modified"] += 1
+        changes = []
+        _diff_directives(old_entry[2], children, [], changes)
+        item = {
+            "address": address,
+            "status": "modified",
+            "old_line": old_entry[1].get("line_number"),
+            "new_line": site.get("line_number"),
+            "changes": changes
+        }
+        old_notes = old_entry[1].get("notes", "") or ""
+        new_notes = site.get("notes", "") or ""
+        if old_notes != new_notes:
+            item["notes"] = {"old": old_notes, "new": new_notes}
+        sites.append(item)
+
+    for address, (_, site, _) in old_tree.items():
+        if address not in new_tree:
+            summary["removed"] += 1
+            sites.append({"address": address, "status": "removed", "old_line": site.get("line_number")})
+
+    return {
+        "summary": summary,
+        "sites": sites,
+        "unparsed_changed": old.get("unparsed", []) != new.get("unparsed", [])
+    }
@@ -10,11 +10,31 @@ import re
 from typing import List, Dict, Any, Optional, Tuple
 
 
+def parse_notes_comment(line: str) -> Optional[str]:
+    """
+    解析站点备注注释（# 备注：xxx 或 # NOTE: xxx）
+    
+    返回: 备注内容；如果不是备注注释则返回 None
+    """
+    stripped = line.strip()
+    if not stripped.startswith('#'):
+        return None
+    if '备注：' in stripped:
+        return stripped.split('备注：', 1)[1].strip()
+    if '备注:' in stripped:
+        return stripped.split('备注:', 1)[1].strip()
+    if stripped.upper().startswith('# NOTE:'):
+        return stripped.split(':', 1)[1].strip()
+    return None
+
+
 class CaddyfileParser:
     """Caddyfile解析器"""
     
-    def __init__(self):
+    def __init__(self, track_spans: bool = False):
         self.sites = []
+        # 记录每个指令在原文中的行范围（span、block），用于按行范围修改原文（见 caddyfile_patch.py）
+        self.track_spans = track_spans
     
     def parse(self, content: str, preserve_unparsed: bool = True) -> Dict[str, Any]:
         """
@@ -114,24 +134,17 @@ class CaddyfileParser:
                     if site:
                         # 记录站点在原始文件中的行号（从1开始）
                         site["line_number"] = i + 1
+                        # 记录站点块最后一行（含结束的 }）的行号，用于按块替换
+                        site["end_line"] = i + consumed_lines
                         
                         # 检查站点前的注释，提取备注
                         if unparsed_before_site:
                             for comment_line in reversed(unparsed_before_site):
-                                comment_stripped = comment_line.strip()
-                                if comment_stripped.startswith('#'):
-                                    if '备注：' in comment_stripped or '备注:' in comment_stripped:
-                                        if '备注：' in comment_stripped:
-                                            notes = comment_stripped.split('备注：', 1)[1].strip()
-                                        else:
-                                            notes = comment_stripped.split('备注:', 1)[1].strip()
+                                notes = parse_notes_comment(comment_line)
+                                if notes is not None:
+                                    if notes:
                                         site["notes"] = notes
-                                        break
-                                    elif comment_stripped.upper().startswith('# NOTE:'):
-                                        notes = comment_stripped.split(':', 1)[1].strip() if ':' in comment_stripped else ''
-                                        if notes:
-                                            site["notes"] = notes
-                                        break
+                                    break
                             
                             # 将站点前的未解析内容添加到unparsed（过滤空行和备注注释）
                             if preserve_unparsed:
@@ -228,6 +241,8 @@ class CaddyfileParser:
         directives, consumed_in_block = self._parse_directives_block(lines, i, block_indent, preserve_unparsed)
         site["directives"] = directives
         consumed += consumed_in_block
+        if self.track_spans:
+            site["block"] = (i, start_idx + consumed - 1)
         
         return site, consumed
     
@@ -387,6 +402,8 @@ class CaddyfileParser:
             "args": args,
             "directives": []
         }
+        if self.track_spans:
+            directive["span"] = (start_idx, start_idx + 1)
         
         consumed = 1
         
@@ -416,6 +433,10 @@ class CaddyfileParser:
         sub_directives, consumed_in_block = self._parse_directives_block(lines, block_start, None, preserve_unparsed)
         directive["directives"] = sub_directives
         consumed += consumed_in_block
+        if self.track_spans:
+            # span: 指令占用的行 [起始, 结束)；block: 块内容的行 [起始, 结束的 } 所在行)
+            directive["span"] = (start_idx, start_idx + consumed)
+            directive["block"] = (block_start, start_idx + consumed - 1)
         
         # _parse_directives_block 在遇到 } 且 brace_count == 0 时会停止并消费该行
         # 所以这里不需要再检查 }，因为已经被消费了
@@ -524,7 +545,7 @@ class CaddyfileGenerator:
             
             # 生成指令（递归）
             directives = site.get("directives", [])
-            self._generate_directives(lines, directives, indent, indent_str)
+            self._generate_directives(lines, directives, 1, indent_str)
             
             # 结束块
             lines.append("}")
@@ -542,45 +563,25 @@ class CaddyfileGenerator:
         
         return "\n".join(lines)
     
-    def _generate_directives(self, lines: List[str], directives: List[Dict[str, Any]], base_indent: int, indent_str: str):
-        """递归生成指令"""
+    def _generate_directives(self, lines: List[str], directives: List[Dict[str, Any]], depth: int, indent_str: str):
+        """递归生成指令，每层嵌套增加一级缩进"""
+        prefix = indent_str * depth
         for directive in directives:
-            name = directive.get("name", "").strip()
-            
             # 跳过空指令名
-            if not name:
+            if not directive.get("name", "").strip():
                 continue
             
-            # 格式化指令
-            directive_line = indent_str + name
-            args = directive.get("args", [])
-            
-            if args:
-                # 过滤空参数
-                valid_args = [arg for arg in args if arg and str(arg).strip()]
-                if valid_args:
-                    # 格式化参数
-                    formatted_args = []
-                    for arg in valid_args:
-                        arg_str = str(arg).strip()
-                        # 如果参数包含空格或特殊字符，加引号
-                        if ' ' in arg_str or '\t' in arg_str or not arg_str:
-                            formatted_args.append(f'"{arg_str}"')
-                        else:
-                            formatted_args.append(arg_str)
-                    directive_line += " " + " ".join(formatted_args)
+            directive_line = prefix + format_directive_line(directive)
             
             # 检查是否有子指令
             sub_directives = directive.get("directives", [])
             if sub_directives:
                 # 有子指令，在同一行添加 {
-                directive_line += " {"
-                lines.append(directive_line)
+                lines.append(directive_line + " {")
                 # 递归生成子指令（增加缩进）
-                # 计算子指令的缩进：使用与当前指令相同的缩进（Caddyfile 允许块内指令与块本身同缩进）
-                self._generate_directives(lines, sub_directives, base_indent, indent_str)
+                self._generate_directives(lines, sub_directives, depth + 1, indent_str)
                 # 结束块
-                lines.append(indent_str + "}")
+                lines.append(prefix + "}")
             else:
                 # 没有子指令，直接添加
                 lines.append(directive_line)
@@ -595,9 +596,27 @@ class CaddyfileGenerator:
         return self.generate(result["sites"], result["unparsed"])
 
 
-def parse_caddyfile(content: str, preserve_unparsed: bool = True) -> Dict[str, Any]:
-    """解析Caddyfile的便捷函数"""
-    parser = CaddyfileParser()
+def format_directive_line(directive: Dict[str, Any]) -> str:
+    """指令名和参数（不含缩进和块），包含空白的参数加引号"""
+    directive_line = directive.get("name", "").strip()
+    # 过滤空参数
+    valid_args = [arg for arg in directive.get("args", []) if arg and str(arg).strip()]
+    if valid_args:
+        formatted_args = []
+        for arg in valid_args:
+            arg_str = str(arg).strip()
+            # 如果参数包含空格或特殊字符，加引号
+            if ' ' in arg_str or '\t' in arg_str or not arg_str:
+                formatted_args.append(f'"{arg_str}"')
+            else:
+                formatted_args.append(arg_str)
+        directive_line += " " + " ".join(formatted_args)
+    return directive_line
+
+
+def parse_caddyfile(content: str, preserve_unparsed: bool = True, track_spans: bool = False) -> Dict[str, Any]:
+    """解析Caddyfile的便捷函数（track_spans 为 True 时记录指令的行范围）"""
+    parser = CaddyfileParser(track_spans)
     return parser.parse(content, preserve_unparsed)
 
 
@@ -613,3 +632,41 @@ def format_caddyfile(content: str, indent: int = 4) -> str:
     generator = CaddyfileGenerator()
     result = parser.parse(content, preserve_unparsed=True)
     return generator.generate(result["sites"], result["unparsed"], indent)
+
+
+def splice_site_block(content: str, site: Dict[str, Any], replacement: Optional[str]) -> str:
+    """
+    在原始文本中替换（或删除）单个站点块，其余内容保持不变
+    
+    Args:
+        content: 原始Caddyfile内容
+        site: 解析得到的站点（需要包含 line_number 和 end_line）
+        replacement: 新的站点文本（包含备注行）；为 None 时删除该站点
+    """
+    lines = content.split('\n')
+    start = site["line_number"] - 1
+    end = site["end_line"]
+    
+    # 站点前紧邻的注释中的备注行属于该站点，一并替换
+    notes_idx = None
+    j = start - 1
+    while j >= 0 and (not lines[j].strip() or lines[j].strip().startswith('#')):
+        if parse_notes_comment(lines[j]) is not None:
+            notes_idx = j
+            break
+        j -= 1
+    
+    new_block = replacement.split('\n') if replacement is not None else []
+    if replacement is None and end < len(lines) and not lines[end].strip():
+        # 删除站点时顺带去掉其后的一个空行，避免空行累积
+        end += 1
+    
+    if notes_idx is not None and all(not line.strip() for line in lines[notes_idx + 1:start]):
+        # 备注行与站点之间只有空行，整体替换
+        lines[notes_idx:end] = new_block
+    else:
+        lines[start:end] = new_block
+        if notes_idx is not None:
+            del lines[notes_idx]
+    
+    return '\n'.join(lines)
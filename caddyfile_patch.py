@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按行范围修改Caddyfile原文
+用带行范围的解析结果（parse_caddyfile(track_spans=True)）作为原文的具体语法树，
+把新的站点列表与原站点逐层对齐，只改写发生变化的行：
+
+    参数/名称变化     只改写指令所在行（保留缩进和行尾的 {）
+    新增/删除指令     在相邻指令之后插入 / 删除指令占用的行
+    块的有无变化      重新生成该指令占用的行
+    新增/删除站点     在相邻站点之后插入 / 与 splice_site_block 相同的方式删除
+
+未修改的行（包括注释、空行、大括号位置和全局配置）原样保留，写入和备份增量与修改的大小成正比。
+修改后重新解析并与新的站点列表比较，不一致时返回 None，由调用方退回完整生成
+"""
+
+import json
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple
+
+from caddyfile_parser import parse_caddyfile, parse_notes_comment, format_directive_line
+
+# 一次编辑: (起始行, 结束行(不含), 新的行, 序号)
+Edit = Tuple[int, int, List[str], int]
+
+
+def normalize_directives(directives: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """去掉行号等附加字段，只保留名称、参数和子指令（与生成器一样跳过空指令名和空参数）"""
+    result = []
+    for directive in directives or []:
+        name = str(directive.get('name') or '').strip()
+        if not name:
+            continue
+        result.append({
+            'name': name,
+            'args': [str(arg).strip() for arg in directive.get('args', []) if arg and str(arg).strip()],
+            'directives': normalize_directives(directive.get('directives', []))
+        })
+    return result
+
+
+def normalize_sites(sites: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """站点的结构化内容（跳过没有地址的站点，与生成器一致）"""
+    return [{
+        'address': str(site.get('address') or '').strip(),
+        'notes': str(site.get('notes') or '').strip(),
+        'directives': normalize_directives(site.get('directives', []))
+    } for site in sites if str(site.get('address') or '').strip()]
+
+
+def _key(directive: Dict[str, Any]) -> str:
+    return json.dumps(directive, ensure_ascii=False, sort_keys=True)
+
+
+def _leading_whitespace(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def render_directive(directive: Dict[str, Any], prefix: str, indent_str: str) -> List[str]:
+    """按生成器的格式生成单个指令（prefix 为该指令的缩进）"""
+    line = prefix + format_directive_line(directive)
+    children = directive.get('directives', [])
+    if not children:
+        return [line]
+    lines = [line + ' {']
+    for child in children:
+        lines.extend(render_directive(child, prefix + indent_str, indent_str))
+    lines.append(prefix + '}')
+    return lines
+
+
+class _Patcher:
+    def __init__(self, lines: List[str], indent: int):
+        self.lines = lines
+        self.indent = indent
+        self.edits: List[Edit] = []
+
+    def edit(self, start: int, end: int, new_lines: List[str]):
+        self.edits.append((start, end, new_lines, len(self.edits)))
+
+    def indent_unit(self, prefix: str) -> str:
+        return '\t' if prefix.startswith('\t') else ' ' * self.indent
+
+    def apply(self) -> List[str]:
+        lines = list(self.lines)
+        # 从后往前应用，前面的行号保持不变；同一位置的插入按添加顺序排列
+        for start, end, new_lines, _ in sorted(self.edits, key=lambda e: (e[0], e[1], e[3]), reverse=True):
+            lines[start:end] = new_lines
+        return lines
+
+    # ---- 指令 ----
+
+    def header(self, old: Dict[str, Any], old_norm: Dict[str, Any], new: Dict[str, Any]):
+        """名称或参数变化时只改写指令行"""
+        if old_norm['name'] == new['name'] and old_norm['args'] == new['args']:
+            return
+        start = old['span'][0]
+        line = self.lines[start]
+        text = _leading_whitespace(line) + format_directive_line(new)
+        block = old.get('block')
+        if block and block[0] == start + 1:
+            # { 与指令在同一行
+            text += ' {'
+        self.edit(start, start + 1, [text])
+
+    def directive(self, old: Dict[str, Any], old_norm: Dict[str, Any], new: Dict[str, Any], prefix: str):
+        if old.get('block'):
+            self.header(old, old_norm, new)
+            self.block(old['directives'], old_norm['directives'], new['directives'], old['block'], prefix)
+        elif new['directives']:
+            # 原来没有块，重新生成整个指令
+            start, end = old['span']
+            self.edit(start, end, render_directive(new, prefix, self.indent_unit(prefix)))
+        else:
+            self.header(old, old_norm, new)
+
+    def block(self, old_list: List[Dict[str, Any]], old_norm: List[Dict[str, Any]],
+              new_list: List[Dict[str, Any]], block: Tuple[int, int], parent_prefix: str):
+        """对齐块内的指令（old_list 为带行范围的原指令，old_norm 为其规范化结果）"""
+        if old_list:
+            prefix = _leading_whitespace(self.lines[old_list[0]['span'][0]])
+        else:
+            prefix = parent_prefix + self.indent_unit(parent_prefix)
+        unit = self.indent_unit(prefix)
+        matcher = SequenceMatcher(None, [_key(d) for d in old_norm], [_key(d) for d in new_list], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+            for k in range(paired):
+                self.directive(old_list[i1 + k], old_norm[i1 + k], new_list[j1 + k],
+                               _leading_whitespace(self.lines[old_list[i1 + k]['span'][0]]))
+            for k in range(i1 + paired, i2):
+                start, end = old_list[k]['span']
+                self.edit(start, end, [])
+            if j1 + paired < j2:
+                if i1 + paired > 0:
+                    position = old_list[i1 + paired - 1]['span'][1]
+                else:
+                    position = block[0]
+                inserted = []
+                for directive in new_list[j1 + paired:j2]:
+                    inserted.extend(render_directive(directive, prefix, unit))
+                self.edit(position, position, inserted)
+
+    # ---- 站点 ----
+
+    def notes_line(self, site: Dict[str, Any]) -> Optional[int]:
+        """站点前紧邻的注释中备注行的位置（与 splice_site_block 的查找方式相同）"""
+        j = site['line_number'] - 2
+        while j >= 0 and (not self.lines[j].strip() or self.lines[j].strip().startswith('#')):
+            if parse_notes_comment(self.lines[j]) is not None:
+                return j
+            j -= 1
+        return None
+
+    def site(self, old: Dict[str, Any], old_norm: Dict[str, Any], new: Dict[str, Any]) -> bool:
+        start = old['line_number'] - 1
+        if old_norm['address'] != new['address']:
+            line = self.lines[start]
+            text = _leading_whitespace(line) + new['address']
+            if '{' in line:
+                text += ' {'
+            self.edit(start, start + 1, [text])
+        if old_norm['notes'] != new['notes']:
+            notes_idx = self.notes_line(old)
+            notes = [f'# 备注：{new["notes"]}'] if new['notes'] else []
+            if notes_idx is not None:
+                self.edit(notes_idx, notes_idx + 1, notes)
+            else:
+                self.edit(start, start, notes)
+        if 'block' not in old:
+            # 站点没有块（格式无法识别），只能处理指令不变的情况
+            return old_norm['directives'] == new['directives']
+        self.block(old['directives'], old_norm['directives'], new['directives'], old['block'], '')
+        return True
+
+    def site_range(self, site: Dict[str, Any]) -> Tuple[int, int]:
+        """站点占用的行（含紧邻的备注行）"""
+        start = site['line_number'] - 1
+        notes_idx = self.notes_line(site)
+        if notes_idx is not None and all(not line.strip() for line in self.lines[notes_idx + 1:start]):
+            start = notes_idx
+        return start, site['end_line']
+
+
+def patch_caddyfile(content: str, sites: List[Dict[str, Any]], unparsed: Optional[List[str]] = None,
+                    indent: int = 4) -> Optional[str]:
+    """
+    把原文修改为新的站点列表，只改写变化的行
+
+    Args:
+        content: 原始Caddyfile内容
+        sites: 新的站点列表
+        unparsed: 新的未解析内容（None 表示保持不变）；与原文不同时无法按行修改
+        indent: 新生成的行使用的缩进空格数（原文使用制表符缩进时沿用制表符）
+
+    返回修改后的内容；无法按行修改（未解析内容变化、原文格式无法识别等）时返回 None
+    """
+    old = parse_caddyfile(content, track_spans=True)
+    if unparsed is not None and [l.strip() for l in unparsed if l.strip()] != [l.strip() for l in old['unparsed'] if l.strip()]:
+        return None
+
+    old_sites = old['sites']
+    old_norm = normalize_sites(old_sites)
+    if len(old_norm) != len(old_sites):
+        return None
+    new_norm = normalize_sites(sites)
+
+    lines = content.split('\n')
+    patcher = _Patcher(lines, indent)
+    matcher = SequenceMatcher(None, [s['address'] for s in old_norm], [s['address'] for s in new_norm], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        paired = i2 - i1 if tag == 'equal' else (min(i2 - i1, j2 - j1) if tag == 'replace' else 0)
+        for k in range(paired):
+            if old_norm[i1 + k] != new_norm[j1 + k]:
+                if not patcher.site(old_sites[i1 + k], old_norm[i1 + k], new_norm[j1 + k]):
+                    return None
+        for k in range(i1 + paired, i2):
+            start, end = patcher.site_range(old_sites[k])
+            if end < len(lines) and not lines[end].strip():
+                # 删除站点时顺带去掉其后的一个空行，避免空行累积
+                end += 1
+            patcher.edit(start, end, [])
+        if j1 + paired < j2:
+            inserted = []
+            for site in new_norm[j1 + paired:j2]:
+                inserted.append('')
+                if site['notes']:
+                    inserted.append(f'# 备注：{site["notes"]}')
+                inserted.extend([site['address'], '{'])
+                for directive in site['directives']:
+                    inserted.extend(render_directive(directive, ' ' * indent, ' ' * indent))
+                inserted.append('}')
+            if i1 + paired > 0:
+                position = old_sites[i1 + paired - 1]['end_line']
+            elif old_sites:
+                # 插入到第一个站点之前
+                position = patcher.site_range(old_sites[0])[0]
+                inserted = inserted[1:] + ['']
+            else:
+                # 原文没有站点，追加到末尾
+                while lines and not lines[-1].strip():
+                    lines.pop()
+                position = len(lines)
+                if not lines:
+                    inserted = inserted[1:]
+            patcher.edit(position, position, inserted)
+
+    if not patcher.edits:
+        return content
+    patched = '\n'.join(patcher.apply())
+    if content.endswith('\n') and not patched.endswith('\n'):
+        patched += '\n'
+
+    # 校验：重新解析的结果必须与新的站点列表一致，否则由调用方退回完整生成
+    reparsed = parse_caddyfile(patched)
+    if normalize_sites(reparsed['sites']) != new_norm:
+        return None
+    if [l.strip() for l in reparsed['unparsed'] if l.strip()] != [l.strip() for l in old['unparsed'] if l.strip()]:
+        return None
+    return patched
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caddy 重载协调
+- 语义哈希：由规范化的站点树（忽略注释、备注、空行和缩进）、未解析内容和 import 的文件内容计算，
+  与上次成功加载的哈希相同时跳过重载
+- 合并：时间窗口内的多个重载请求合并为一次，所有请求得到同一个结果
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from caddyfile_patch import normalize_sites
+from file_watcher import expand_paths, has_glob_magic
+
+IMPORT_RE = re.compile(r'^\s*import\s+(\S+)', re.MULTILINE)
+MAX_IMPORT_DEPTH = 10
+
+
+def normalize_text(content: str) -> List[str]:
+    """去掉空行、注释行和首尾空白"""
+    lines = []
+    for line in content.split('\n'):
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#'):
+            lines.append(stripped)
+    return lines
+
+
+def resolve_imports(content: str, base_dir: str) -> List[Tuple[str, List[str]]]:
+    """
+    递归读取 import 的文件（支持通配符），返回 [(路径, 规范化内容)]
+    import 的目标也可能是代码片段名称，不存在的文件忽略（片段名称本身已包含在站点树中）
+    """
+    imports = []
+    seen = set()
+    pending = [(content, base_dir, 0)]
+    while pending:
+        text, directory, depth = pending.pop()
+        if depth >= MAX_IMPORT_DEPTH:
+            continue
+        for target in IMPORT_RE.findall(text):
+            for path in expand_paths([os.path.join(directory, target)]):
+                path = os.path.abspath(path)
+                if path in seen or not os.path.isfile(path):
+                    continue
+                seen.add(path)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        imported = f.read()
+                except (OSError, UnicodeDecodeError):
+                    continue
+                imports.append((path, normalize_text(imported)))
+                pending.append((imported, os.path.dirname(path), depth + 1))
+    imports.sort()
+    return imports
+
+
+def absolutize_imports(content: str, base_dir: str) -> str:
+    """
+    把 import 的相对文件路径改为基于 base_dir 的绝对路径，内容写到其他目录（如临时文件）时 import 仍指向原来的文件；
+    代码片段名称和不存在的文件保持不变
+    """
+    def replace(match):
+        target = match.group(1)
+        path = os.path.join(base_dir, target)
+        if os.path.isabs(target) or not (has_glob_magic(target) or os.path.exists(path)):
+            return match.group(0)
+        return match.group(0)[:match.start(1) - match.start(0)] + os.path.abspath(path)
+    return IMPORT_RE.sub(replace, content)
+
+
+def semantic_hash(sites: List[Dict[str, Any]], unparsed: List[str], imports: List[Tuple[str, List[str]]]) -> str:
+    """配置的语义哈希（备注不影响Caddy的行为，不参与计算）"""
+    tree = {
+        'sites': [{'address': site['address'], 'directives': site['directives']} for site in normalize_sites(sites)],
+        'unparsed': normalize_text('\n'.join(unparsed or [])),
+        'imports': imports
+    }
+    data = json.dumps(tree, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+class _Batch:
+    """一组被合并的重载请求"""
+
+    def __init__(self):
+        self.requests = 0
+        self.force = False
+        self.done = threading.Event()
+        self.result = None
+
+
+class ReloadCoordinator:
+    """
+    单个文档的重载协调器
+
+    第一个请求等待 window 秒收集同一时间窗口内的其他请求，然后只执行一次重载，
+    窗口内的其他请求等待并返回同一个结果；执行前比较语义哈希，与上次成功加载的相同时直接返回
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.last_hash = None    # 上次成功加载的语义哈希
+        self.last_result = None  # 上次执行的结果摘要
+        self._lock = threading.Lock()      # 保护 _batch
+        self._run_lock = threading.Lock()  # 同一时间只执行一次重载
+        self._batch = None
+
+    def request(self, compute_hash: Callable[[], Optional[str]],
+                reload: Callable[[], Tuple[Dict[str, Any], int]], force: bool = False) -> Tuple[Dict[str, Any], int]:
+        """
+        请求重载
+
+        Args:
+            compute_hash: 计算当前配置的语义哈希（失败时返回 None，总是重载）
+            reload: 执行重载，返回 (结果, HTTP状态码)，状态码为 200 表示成功
+            force: 忽略语义哈希，总是重载
+
+        返回 (结果, 状态码)，结果中包含 reloaded、duration_ms、semantic_hash、requests、coalesced
+        """
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.requests += 1
+            batch.force = batch.force or force
+
+        if not leader:
+            batch.done.wait()
+            payload, status = batch.result
+            return dict(payload, coalesced=True), status
+
+        try:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                # 之后的请求组成新的一批，等待本次重载完成后执行
+                self._batch = None
+            with self._run_lock:
+                batch.result = self._run(compute_hash, reload, batch.force, batch.requests)
+        except Exception as e:
+            batch.result = ({'success': False, 'reloaded': False, 'error': f'重新加载时发生错误: {str(e)}'}, 500)
+        finally:
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            batch.done.set()
+        payload, status = batch.result
+        return dict(payload, coalesced=False), status
+
+    def _run(self, compute_hash, reload, force: bool, requests: int) -> Tuple[Dict[str, Any], int]:
+        started = time.perf_counter()
+        try:
+            current = compute_hash()
+        except Exception:
+            current = None
+
+        if not force and current is not None and current == self.last_hash:
+            payload, status = {'success': True, 'message': '配置没有变化，跳过重新加载'}, 200
+            reloaded = False
+        else:
+            payload, status = reload()
+            reloaded = True
+            if status == 200:
+                self.last_hash = current
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        payload = dict(payload, reloaded=reloaded and status == 200, duration_ms=duration_ms,
+                       semantic_hash=current, requests=requests)
+        self.last_result = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'reloaded': payload['reloaded'],
+            'success': status == 200,
+            'duration_ms': duration_ms,
+            'semantic_hash': current,
+            'requests': requests
+        }
+        return payload, status
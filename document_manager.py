@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多文档管理
+每个命名文档（如每个租户一个Caddyfile）有自己的路径、备份目录和解析/索引/搜索缓存，
+所有文档的缓存共享一个内存预算，超出时清除最久未使用的文档的缓存
+"""
+
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+# 文档名称只允许字母、数字、点、下划线和连字符（名称会用于目录和Redis键）
+DOCUMENT_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+
+def is_valid_document_name(name: str) -> bool:
+    return bool(name) and bool(DOCUMENT_NAME_RE.match(name))
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """估算对象及其引用的对象占用的内存（同一对象只计算一次）"""
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__dict__'):
+            stack.append(vars(current))
+    return size
+
+
+class ManagedDocument:
+    """一个命名文档：路径、备份目录和它的缓存"""
+
+    def __init__(self, name: str, path: str, backup_dir: str):
+        self.name = name
+        self.path = path
+        self.backup_dir = backup_dir
+        self.lock = threading.Lock()        # 保护下面的缓存字段
+        self.write_lock = threading.Lock()  # 保存/恢复时串行化读取-修改-写入
+        self.write_lease = None  # 持有 write_lock 期间的多副本租约锁（RedisLease），写入前确认仍然持有
+        self.cache_key = None
+        self.document = None                # 解析结果（在请求间共享，不能修改）
+        self.derived = {}                   # 由 document 派生的缓存：站点索引、哈希树
+        self.search_index = None            # 全文索引（首次搜索时创建）
+        self.search_revision = None
+        self.search_lock = threading.Lock()
+        self.materialized_revision = None   # 使用Redis存储时已写出到 path 的版本
+        self.size = 0                       # 缓存占用的估算字节数
+
+    def clear(self):
+        """清除缓存（调用方持有 lock）"""
+        self.cache_key = None
+        self.document = None
+        self.derived = {}
+        self.search_index = None
+        self.search_revision = None
+        self.size = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'path': self.path,
+            'backup_dir': self.backup_dir,
+            'cached': self.document is not None,
+            'revision': self.document['revision'] if self.document else None,
+            'cache_bytes': self.size
+        }
+
+
+class DocumentManager:
+    """
+    命名文档注册表和缓存内存预算
+
+    account() 在文档的缓存被填充或扩展后调用，重新估算其大小，
+    总量超过预算时按最近使用顺序清除其他文档的缓存（正在使用的文档不会被清除）
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._documents = {}
+        self._lru = OrderedDict()  # 有缓存的文档名称，最近使用的在末尾
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def register(self, name: str, path: str, backup_dir: str) -> ManagedDocument:
+        """注册文档（同名文档已存在时直接返回）"""
+        with self._lock:
+            entry = self._documents.get(name)
+            if entry is None:
+                entry = ManagedDocument(name, path, backup_dir)
+                self._documents[name] = entry
+            return entry
+
+    def get(self, name: str) -> Optional[ManagedDocument]:
+        return self._documents.get(name)
+
+    def documents(self) -> List[ManagedDocument]:
+        return list(self._documents.values())
+
+    def touch(self, entry: ManagedDocument):
+        """标记文档最近被使用"""
+        with self._lock:
+            if entry.name in self._lru:
+                self._lru.move_to_end(entry.name)
+
+    def account(self, entry: ManagedDocument):
+        """重新估算文档缓存的大小，超出预算时清除最久未使用的其他文档"""
+        with entry.lock:
+            document, derived, search_index = entry.document, dict(entry.derived), entry.search_index
+        # 估算在锁外进行，不阻塞其他请求读取缓存
+        size = deep_sizeof((document, derived, search_index)) if document is not None else 0
+        with self._lock:
+            with entry.lock:
+                if entry.document is not document:
+                    # 估算期间缓存已被替换，由替换它的调用方重新计算
+                    return
+                entry.size = size
+            if document is not None:
+                self._lru[entry.name] = None
+                self._lru.move_to_end(entry.name)
+            else:
+                self._lru.pop(entry.name, None)
+            total = self._total_size()
+            for name in list(self._lru):
+                if total <= self.budget_bytes:
+                    break
+                if name == entry.name:
+                    continue
+                victim = self._documents[name]
+                with victim.lock:
+                    total -= victim.size
+                    victim.clear()
+                del self._lru[name]
+                self.evictions += 1
+
+    def forget(self, entry: ManagedDocument):
+        """文档缓存已清除，不再计入预算"""
+        with self._lock:
+            self._lru.pop(entry.name, None)
+
+    def _total_size(self) -> int:
+        return sum(self._documents[name].size for name in self._lru)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'documents': len(self._documents),
+                'cached': len(self._lru),
+                'cache_bytes': self._total_size(),
+                'budget_bytes': self.budget_bytes,
+                'evictions': self.evictions
+            }
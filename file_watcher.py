@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件变化监听
+Linux 下使用 inotify 监听文件所在目录，其他平台按间隔比较 mtime/大小
+"""
+
+import os
+import glob
+import time
+import errno
+import select
+import threading
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    INOTIFY_AVAILABLE = hasattr(_libc, 'inotify_init1')
+except Exception:
+    _libc = None
+    INOTIFY_AVAILABLE = False
+
+# inotify 事件掩码
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """文件签名 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def has_glob_magic(path: str) -> bool:
+    """路径是否包含通配符（* ? [）"""
+    return glob.has_magic(path)
+
+
+def expand_paths(patterns: List[str]) -> List[str]:
+    """展开路径（支持 import 中的通配符）"""
+    paths = []
+    for pattern in patterns:
+        if has_glob_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+class FileWatcher:
+    """
+    监听一组文件的变化
+
+    get_patterns: 返回需要监听的文件路径（可包含通配符），每次变化后重新获取
+    on_change: 文件发生变化时调用，参数为变化的文件列表
+    """
+
+    def __init__(self, get_patterns: Callable[[], List[str]], on_change: Callable[[List[str]], None],
+                 poll_interval: float = 2.0, debounce: float = 0.2):
+        self.get_patterns = get_patterns
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.backend = 'inotify' if INOTIFY_AVAILABLE else 'poll'
+        self._patterns = []
+        self._signatures = {}
+        self._inotify_fd = None
+        self._watched_dirs = {}
+        self._thread = None
+
+    def start(self):
+        """在后台线程中开始监听"""
+        if self._thread is not None:
+            return
+        self._refresh()
+        if self.backend == 'inotify':
+            try:
+                fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd < 0:
+                    raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+                self._inotify_fd = fd
+                self._update_watches()
+            except Exception as e:
+                print(f'inotify 不可用，改为轮询: {e}')
+                self.backend = 'poll'
+        self._thread = threading.Thread(target=self._run, name='file-watcher', daemon=True)
+        self._thread.start()
+
+    def _refresh(self):
+        """重新获取监听列表，新加入的文件记录当前签名"""
+        self._patterns = self.get_patterns()
+        self._signatures = {
+            path: self._signatures[path] if path in self._signatures else file_signature(path)
+            for path in expand_paths(self._patterns)
+        }
+
+    def _update_watches(self):
+        """监听文件所在的目录（可以捕获原子替换和新建文件）"""
+        dirs = {os.path.dirname(os.path.abspath(pattern)) for pattern in self._patterns}
+        for directory in dirs - set(self._watched_dirs):
+            wd = _libc.inotify_add_watch(self._inotify_fd, directory.encode('utf-8'), WATCH_MASK)
+            if wd >= 0:
+                self._watched_dirs[directory] = wd
+        for directory in set(self._watched_dirs) - dirs:
+            _libc.inotify_rm_watch(self._inotify_fd, self._watched_dirs.pop(directory))
+
+    def _wait(self):
+        """等待下一次检查：inotify 等待事件，轮询模式等待固定间隔"""
+        if self.backend != 'inotify':
+            time.sleep(self.poll_interval)
+            return
+        # 同时设置超时，以便目录被删除后重新创建时仍能恢复监听
+        readable, _, _ = select.select([self._inotify_fd], [], [], max(self.poll_interval, 30))
+        if readable:
+            time.sleep(self.debounce)
+            self._drain_events()
+
+    def _drain_events(self):
+        """读取并丢弃所有待处理的 inotify 事件（只用于唤醒，变化以签名比较为准）"""
+        while True:
+            try:
+                if not os.read(self._inotify_fd, 64 * 1024):
+                    return
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+    def check(self) -> List[str]:
+        """比较文件签名，返回发生变化的文件"""
+        current = {path: file_signature(path) for path in expand_paths(self._patterns)}
+        changed = [path for path in set(current) | set(self._signatures)
+                   if current.get(path) != self._signatures.get(path)]
+        self._signatures = current
+        return sorted(changed)
+
+    def _run(self):
+        while True:
+            try:
+                self._wait()
+                changed = self.check()
+                if changed:
+                    self.on_change(changed)
+                    # 内容变化后 import 列表可能变化
+                    self._refresh()
+                if self.backend == 'inotify':
+                    # 之前不存在的目录创建后补充监听
+                    self._update_watches()
+            except Exception as e:
+                print(f'文件监听出错: {e}')
+                time.sleep(self.poll_interval)
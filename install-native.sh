@@ -152,6 +152,51 @@ else
     if [ -f "$SCRIPT_DIR/caddyfile_parser.py" ]; then
         cp -f "$SCRIPT_DIR/caddyfile_parser.py" "$INSTALL_DIR/" 2>/dev/null || true
     fi
+    if [ -f "$SCRIPT_DIR/site_index.py" ]; then
+        cp -f "$SCRIPT_DIR/site_index.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/backup_store.py" ]; then
+        cp -f "$SCRIPT_DIR/backup_store.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/caddyfile_diff.py" ]; then
+        cp -f "$SCRIPT_DIR/caddyfile_diff.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/file_watcher.py" ]; then
+        cp -f "$SCRIPT_DIR/file_watcher.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/metrics.py" ]; then
+        cp -f "$SCRIPT_DIR/metrics.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/static_assets.py" ]; then
+        cp -f "$SCRIPT_DIR/static_assets.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/caddy_fleet.py" ]; then
+        cp -f "$SCRIPT_DIR/caddy_fleet.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/redis_coordination.py" ]; then
+        cp -f "$SCRIPT_DIR/redis_coordination.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/redis_storage.py" ]; then
+        cp -f "$SCRIPT_DIR/redis_storage.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/document_manager.py" ]; then
+        cp -f "$SCRIPT_DIR/document_manager.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/bulk_edit.py" ]; then
+        cp -f "$SCRIPT_DIR/bulk_edit.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/selector.py" ]; then
+        cp -f "$SCRIPT_DIR/selector.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/caddyfile_patch.py" ]; then
+        cp -f "$SCRIPT_DIR/caddyfile_patch.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/config_reload.py" ]; then
+        cp -f "$SCRIPT_DIR/config_reload.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
+    if [ -f "$SCRIPT_DIR/caddy_incremental.py" ]; then
+        cp -f "$SCRIPT_DIR/caddy_incremental.py" "$INSTALL_DIR/" 2>/dev/null || true
+    fi
     if [ -f "$SCRIPT_DIR/requirements.txt" ]; then
         cp -f "$SCRIPT_DIR/requirements.txt" "$INSTALL_DIR/" 2>/dev/null || true
     fi
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus 指标
+不依赖 prometheus_client，输出文本格式（text/plain; version=0.0.4）。
+每个指标只有一份数据，记录时短暂加锁（开发服务器每个请求一个线程，按线程分片反而需要不断注册和合并分片）。
+"""
+
+import math
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 文档大小分级（字节），用于将耗时按文档大小分组
+SIZE_CLASSES = ((10 * 1024, '10KB'), (100 * 1024, '100KB'), (1024 * 1024, '1MB'), (10 * 1024 * 1024, '10MB'))
+
+
+def size_class(size: int) -> str:
+    """文档大小所在的分级（上限），用作标签值"""
+    for limit, label in SIZE_CLASSES:
+        if size <= limit:
+            return label
+    return '+Inf'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """带标签的指标基类"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # labels -> value
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _copy(value):
+        """抓取时复制单个值（可变的值需要覆盖）"""
+        return value
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {labels: self._copy(value) for labels, value in self._values.items()}
+
+    @abstractmethod
+    def collect(self) -> List[str]:
+        """输出指标的样本行"""
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in sorted(self._snapshot().items())]
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+
+    kind = 'histogram'
+    _copy = staticmethod(list)  # [各分桶计数..., 总和, 总数]
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        # 第一个不小于 value 的分桶（超过所有分桶时只计入 +Inf）
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [各分桶计数..., 总和, 总数]
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if bucket < len(self.buckets):
+                state[bucket] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """记录代码块的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self) -> List[str]:
+        lines = []
+        for labels, state in sorted(self._snapshot().items()):
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", _format_value(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", "+Inf"))} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+
+class CallbackMetric:
+    """抓取时通过回调获取当前值（用于已有统计信息，如 lru_cache 的命中数）"""
+
+    def __init__(self, name: str, documentation: str, labelnames, callback: Callable[[], Dict[tuple, float]],
+                 kind: str = 'counter'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in sorted(self.callback().items())]
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, labelnames, callback, kind: str = 'counter') -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, kind))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                print(f'收集指标 {metric.name} 失败: {e}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
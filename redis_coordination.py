@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多副本协调（基于Redis）
+- RedisLease: 带过期时间的租约锁，持有期间后台线程定期续约，释放时通过发布消息唤醒等待者（无需轮询）
+- RevisionChannel: 单调递增的版本计数器，新版本通过发布/订阅立即通知其他副本
+"""
+
+import json
+import time
+import uuid
+import threading
+from typing import Callable, Optional
+
+
+class LockTimeout(Exception):
+    """等待锁超时"""
+
+
+class LockLost(LockTimeout):
+    """锁已过期并被其他副本获取（写入前检查）"""
+
+
+def _text(value) -> Optional[str]:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class RedisLease:
+    """
+    Redis 租约锁
+
+    使用 SET NX PX 获取，持有者异常退出时锁在 ttl 后自动过期；
+    auto_renew 时持有期间每 ttl/3 续约一次，持有时间不受 ttl 限制；
+    写入前调用 ensure() 确认锁仍属于自己（同时续约）；
+    释放时只删除自己持有的锁（WATCH 事务比较令牌），并发布释放消息
+    """
+
+    def __init__(self, client, name: str, ttl_ms: int = 30000, auto_renew: bool = True):
+        self.client = client
+        self.name = name
+        self.channel = f'{name}:released'
+        self.ttl_ms = ttl_ms
+        self.auto_renew = auto_renew
+        self.token = None
+        self.lost = False  # 续约时发现锁已不属于自己
+        self._stop_renewal = None
+
+    def acquire(self, timeout: float = 10) -> bool:
+        """获取锁，超时返回 False"""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        pubsub = None
+        try:
+            while True:
+                if self.client.set(self.name, token, nx=True, px=self.ttl_ms):
+                    self.token = token
+                    self.lost = False
+                    if self.auto_renew:
+                        self._start_renewal()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if pubsub is None:
+                    # 先订阅再重试一次，避免错过订阅前发出的释放消息
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    continue
+                # 等待释放消息；持有者异常退出时按锁的剩余时间醒来重试
+                ttl = self.client.pttl(self.name)
+                wait = min(remaining, ttl / 1000 if ttl and ttl > 0 else 0.05)
+                pubsub.get_message(timeout=max(wait, 0.001))
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def _start_renewal(self):
+        stop = self._stop_renewal = threading.Event()
+        threading.Thread(target=self._renew, args=(stop, self.token), name=f'lease-{self.name}', daemon=True).start()
+
+    def _renew(self, stop: threading.Event, token: str):
+        """后台续约，直到释放或发现锁已不属于自己"""
+        interval = self.ttl_ms / 3000
+        while not stop.wait(interval):
+            if self.token != token:
+                return
+            try:
+                if not self.extend():
+                    self.lost = True
+                    return
+            except Exception as e:
+                # 暂时的连接错误，下次继续续约
+                print(f'续约锁 {self.name} 失败: {e}')
+
+    def extend(self) -> bool:
+        """把锁的过期时间重置为 ttl；锁已不属于自己时返回 False"""
+        token = self.token
+        if token is None:
+            return False
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.name)
+                if _text(pipe.get(self.name)) != token:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.pexpire(self.name, self.ttl_ms)
+                pipe.execute()
+                return True
+            except Exception as e:
+                if type(e).__name__ == 'WatchError':
+                    # 检查和续约之间锁被修改，说明已不属于自己
+                    return False
+                raise
+
+    def ensure(self):
+        """写入前确认锁仍属于自己并续约，否则抛出 LockLost"""
+        if self.lost or not self.extend():
+            self.lost = True
+            raise LockLost(f'锁 {self.name} 已过期并被其他副本获取，已取消写入')
+
+    def release(self):
+        """释放锁（锁已过期并被他人获取时不做任何操作）"""
+        if self.token is None:
+            return
+        token, self.token = self.token, None
+        if self._stop_renewal is not None:
+            self._stop_renewal.set()
+            self._stop_renewal = None
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.name)
+                if _text(pipe.get(self.name)) != token:
+                    pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.delete(self.name)
+                pipe.publish(self.channel, token)
+                pipe.execute()
+            except Exception as e:
+                # WatchError 等：锁已被修改，说明已不属于自己
+                print(f'释放锁 {self.name} 失败: {e}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RevisionChannel:
+    """
+    版本计数器和变更通知
+
+    publish() 原子地递增版本号并发布 {"seq", "revision", "replica"}；
+    start() 在后台线程订阅，收到其他副本发布的版本时调用 on_revision(message)
+    """
+
+    def __init__(self, client, prefix: str, replica_id: Optional[str] = None,
+                 on_revision: Optional[Callable[[dict], None]] = None):
+        self.client = client
+        self.counter_key = f'{prefix}revision'
+        self.channel = f'{prefix}revisions'
+        self.replica_id = replica_id or uuid.uuid4().hex[:12]
+        self.on_revision = on_revision
+        self.latest = None  # 已知的最新版本消息
+        self._thread = None
+
+    def current(self) -> int:
+        """当前版本号"""
+        value = self.client.get(self.counter_key)
+        return int(value) if value else 0
+
+    def publish(self, revision: str) -> int:
+        """递增版本号并通知其他副本，返回新的版本号"""
+        seq = self.client.incr(self.counter_key)
+        message = {'seq': seq, 'revision': revision, 'replica': self.replica_id}
+        self.client.publish(self.channel, json.dumps(message))
+        self.latest = message
+        return seq
+
+    def start(self):
+        """开始在后台订阅版本通知"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='revision-channel', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for item in pubsub.listen():
+                    if item.get('type') != 'message':
+                        continue
+                    message = json.loads(item['data'])
+                    if self.latest is None or message['seq'] > self.latest['seq']:
+                        self.latest = message
+                    if message.get('replica') != self.replica_id and self.on_revision:
+                        self.on_revision(message)
+            except Exception as e:
+                print(f'订阅版本通知失败: {e}')
+                time.sleep(1)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis 存储后端
+当前Caddyfile（连同解析结果）和备份版本以zlib压缩数据保存在Redis中，
+多个无状态副本可以共享，不依赖共享文件系统
+"""
+
+import json
+import zlib
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+from backup_store import BackupStore
+from redis_coordination import RedisLease, LockTimeout
+
+
+class RedisDocumentStore:
+    """
+    当前Caddyfile
+
+    键 {prefix}document 为哈希：revision、content（压缩）、parsed（压缩的JSON: {sites, unparsed}）
+    三个字段通过一条 HSET 同时写入
+    """
+
+    def __init__(self, client, prefix: str):
+        self.client = client  # 需要 decode_responses=False 的客户端
+        self.key = f'{prefix}document'
+
+    def revision(self) -> Optional[str]:
+        """当前版本号（文档不存在时返回 None）"""
+        value = self.client.hget(self.key, 'revision')
+        return value.decode('utf-8') if value else None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """读取文档，返回 {content, revision, sites?, unparsed?}（没有解析结果时不含 sites）"""
+        content, parsed, revision = self.client.hmget(self.key, 'content', 'parsed', 'revision')
+        if content is None or revision is None:
+            return None
+        document = {
+            'content': zlib.decompress(content).decode('utf-8'),
+            'revision': revision.decode('utf-8')
+        }
+        if parsed:
+            document.update(json.loads(zlib.decompress(parsed)))
+        return document
+
+    def save(self, content: str, revision: str, sites: Optional[list] = None, unparsed: Optional[list] = None):
+        """保存文档和解析结果"""
+        mapping = {
+            'revision': revision,
+            'content': zlib.compress(content.encode('utf-8'))
+        }
+        if sites is not None:
+            parsed = {'sites': sites, 'unparsed': unparsed or []}
+            mapping['parsed'] = zlib.compress(json.dumps(parsed, ensure_ascii=False).encode('utf-8'))
+        self.client.hset(self.key, mapping=mapping)
+
+
+class RedisBackupStore(BackupStore):
+    """
+    保存在Redis中的增量备份存储（增量、去重和保留策略与 BackupStore 相同）
+
+    键:
+        {prefix}objects     哈希 hash -> 压缩数据
+        {prefix}bases       哈希 hash -> base hash（完整快照为空字符串）
+        {prefix}versions    列表，每项为一个版本的JSON
+        {prefix}seq         版本序号计数器
+        {prefix}generation  清理后递增，其他副本据此重新加载版本列表
+        {prefix}lock        追加版本和清理时持有的租约锁
+    """
+
+    def __init__(self, client, prefix: str, snapshot_interval: int = 20, cache_size: int = 8,
+                 lock_ttl: float = 30, lock_timeout: float = 10):
+        super().__init__(prefix, snapshot_interval, cache_size)
+        self.client = client  # 需要 decode_responses=False 的客户端
+        self.objects_key = f'{prefix}objects'
+        self.bases_key = f'{prefix}bases'
+        self.versions_key = f'{prefix}versions'
+        self.seq_key = f'{prefix}seq'
+        self.generation_key = f'{prefix}generation'
+        self._journal_length = 0  # 已加载的版本列表长度
+        self._generation = None
+        self.lock_key = f'{prefix}lock'
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self._lease = None  # 当前持有的租约（只在 _lock 内访问）
+
+    def exists(self) -> bool:
+        return bool(self.client.exists(self.versions_key))
+
+    def _scan_objects(self) -> Dict[str, Optional[str]]:
+        return {k.decode('utf-8'): (v.decode('utf-8') or None) for k, v in self.client.hgetall(self.bases_key).items()}
+
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        return [json.loads(item) for item in self.client.lrange(self.versions_key, 0, -1)]
+
+    def _read_blob(self, obj_hash: str) -> bytes:
+        data = self.client.hget(self.objects_key, obj_hash)
+        if data is None:
+            raise FileNotFoundError(f'备份对象不存在: {obj_hash}')
+        return data
+
+    def _commit(self, obj: Optional[Tuple[str, Optional[str], bytes]], version: Dict[str, Any]):
+        # 对象和版本记录在同一个事务中写入
+        with self.client.pipeline() as pipe:
+            if obj is not None:
+                obj_hash, base, data = obj
+                pipe.hset(self.objects_key, obj_hash, data)
+                pipe.hset(self.bases_key, obj_hash, base or '')
+            pipe.rpush(self.versions_key, json.dumps(version, ensure_ascii=False))
+            length = pipe.execute()[-1]
+        if length != self._journal_length + 1:
+            # 其他副本同时写入了版本，下次访问时重新加载
+            self._generation = None
+        self._journal_length = length
+
+    def _rewrite_journal(self, versions: List[Dict[str, Any]]):
+        if self._lease is not None:
+            # 删除并重写版本列表前确认租约仍然有效，否则可能丢弃其他副本刚追加的版本
+            self._lease.ensure()
+        with self.client.pipeline() as pipe:
+            pipe.delete(self.versions_key)
+            if versions:
+                pipe.rpush(self.versions_key, *[json.dumps(v, ensure_ascii=False) for v in versions])
+            pipe.incr(self.generation_key)
+            results = pipe.execute()
+        self._generation = results[-1]
+        self._journal_length = len(versions)
+
+    def _delete_blob(self, obj_hash: str):
+        with self.client.pipeline() as pipe:
+            pipe.hdel(self.objects_key, obj_hash)
+            pipe.hdel(self.bases_key, obj_hash)
+            pipe.execute()
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        多个副本之间互斥：追加版本（选择增量基准、复用已有对象）和清理（重写版本列表、删除对象）
+        不能交错执行，否则清理可能丢弃刚追加的版本或删除新版本引用的对象
+        """
+        lease = RedisLease(self.client, self.lock_key, int(self.lock_ttl * 1000))
+        if not lease.acquire(self.lock_timeout):
+            raise LockTimeout('其他副本正在写入备份，请稍后重试')
+        self._lease = lease
+        try:
+            yield
+        finally:
+            self._lease = None
+            lease.release()
+
+    def _next_seq(self) -> int:
+        # 多个副本共享同一个计数器，序号全局唯一
+        return int(self.client.incr(self.seq_key))
+
+    def _load(self):
+        """每次访问时检查Redis中的版本列表：有新版本时只加载新增部分，被清理过时全部重新加载"""
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(self.generation_key)
+            pipe.llen(self.versions_key)
+            generation, length = pipe.execute()
+        generation = int(generation or 0)
+
+        if self._versions is None or generation != self._generation or length < self._journal_length:
+            self._objects = self._scan_objects()
+            self._versions = [v for v in self._read_journal() if v.get('hash') in self._objects]
+            self._generation = generation
+            self._journal_length = length
+            return
+
+        if length > self._journal_length:
+            new_versions = [json.loads(item) for item in self.client.lrange(self.versions_key, self._journal_length, -1)]
+            self._journal_length += len(new_versions)
+            missing = [v['hash'] for v in new_versions if v.get('hash') not in self._objects]
+            if missing:
+                bases = self.client.hmget(self.bases_key, missing)
+                for obj_hash, base in zip(missing, bases):
+                    if base is not None:
+                        self._objects[obj_hash] = base.decode('utf-8') or None
+            self._versions.extend(v for v in new_versions if v.get('hash') in self._objects)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caddyfile 选择器查询
+在 sites -> directives -> directives 树上使用类似CSS选择器的语法查询，例如:
+
+    handle_path reverse_proxy                       handle_path 下（任意层级）的 reverse_proxy
+    handle_path > reverse_proxy                     handle_path 的直接子指令 reverse_proxy
+    site:has(encode[arg=gzip]):not(:has(file_server))   有 encode gzip 但没有 file_server 的站点
+    tls[arg0^=/data/ssl/]                           第一个参数以 /data/ssl/ 开头的 tls
+    site[address$=.uvp.cc] header                   *.uvp.cc 站点中的 header
+
+语法:
+    query     := selector (',' selector)*
+    selector  := compound (('>' | 空白) compound)*
+    compound  := (site | * | 指令名)? ('[' 属性 运算符 值 ']' | ':has(' 相对选择器 ')' | ':not(' compound ')')*
+    属性      := arg（任意参数）| arg0, arg1 ...（按位置）| name | address | notes（站点）
+    运算符    := = | != | ^= | $= | *= | ~=（正则）
+    相对选择器 := ('>')? selector
+
+编译结果按查询文本缓存；查询时先用站点索引（指令名 -> 站点）筛选候选站点，只遍历可能匹配的站点
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from caddyfile_diff import directive_text
+
+NAME_RE = re.compile(r'[A-Za-z0-9_.\-@/]+')
+ATTR_RE = re.compile(r'\[\s*(arg\d*|name|address|notes)\s*(=|!=|\^=|\$=|\*=|~=)\s*')
+OPERATORS = {
+    '=': lambda value, target: value == target,
+    '!=': lambda value, target: value != target,
+    '^=': lambda value, target: value.startswith(target),
+    '$=': lambda value, target: value.endswith(target),
+    '*=': lambda value, target: target in value,
+}
+
+
+class SelectorError(ValueError):
+    """选择器语法错误"""
+
+
+class Compound:
+    """复合选择器：节点类型/名称 + 属性条件 + 伪类"""
+
+    __slots__ = ('name', 'attrs', 'has', 'nots')
+
+    def __init__(self):
+        self.name = None  # 'site' 匹配站点，'*' 匹配任意指令，None 不限（如 :not(:has(...))）
+        self.attrs = []   # [(属性, 判断函数)]
+        self.has = []     # [Selector]（相对选择器）
+        self.nots = []    # [Compound]
+
+    def matches(self, node: Dict[str, Any], is_site: bool) -> bool:
+        if self.name == 'site':
+            if not is_site:
+                return False
+        elif self.name is not None:
+            if is_site or (self.name != '*' and node.get('name') != self.name):
+                return False
+        for attr, test in self.attrs:
+            if not _test_attr(node, attr, test):
+                return False
+        for compound in self.nots:
+            if compound.matches(node, is_site):
+                return False
+        for selector in self.has:
+            if not selector.matches_within(node):
+                return False
+        return True
+
+
+def _test_attr(node: Dict[str, Any], attr: str, test) -> bool:
+    if attr == 'arg':
+        return any(test(str(arg)) for arg in node.get('args', []))
+    if attr.startswith('arg'):
+        args = node.get('args', [])
+        position = int(attr[3:])
+        return position < len(args) and test(str(args[position]))
+    return test(str(node.get(attr) or '').strip())
+
+
+class Selector:
+    """由组合符连接的复合选择器序列，从右往左匹配"""
+
+    __slots__ = ('compounds', 'combinators', 'child_anchor')
+
+    def __init__(self, compounds: List[Compound], combinators: List[str], child_anchor: bool = False):
+        self.compounds = compounds
+        self.combinators = combinators  # combinators[i] 连接 compounds[i] 和 compounds[i + 1]
+        self.child_anchor = child_anchor  # :has(> ...) 时最左边的节点必须是直接子节点
+
+    @property
+    def subject(self) -> Compound:
+        return self.compounds[-1]
+
+    def matches(self, node: Dict[str, Any], is_site: bool, ancestors: List[Tuple[Dict[str, Any], bool]]) -> bool:
+        """node 是否匹配，ancestors 为从根到父节点的 [(节点, 是否站点)]"""
+        return self._match(len(self.compounds) - 1, node, is_site, ancestors)
+
+    def _match(self, i: int, node, is_site: bool, ancestors) -> bool:
+        if not self.compounds[i].matches(node, is_site):
+            return False
+        if i == 0:
+            return not self.child_anchor or not ancestors
+        if not ancestors:
+            return False
+        if self.combinators[i - 1] == '>':
+            parent, parent_is_site = ancestors[-1]
+            return self._match(i - 1, parent, parent_is_site, ancestors[:-1])
+        for k in range(len(ancestors) - 1, -1, -1):
+            ancestor, ancestor_is_site = ancestors[k]
+            if self._match(i - 1, ancestor, ancestor_is_site, ancestors[:k]):
+                return True
+        return False
+
+    def matches_within(self, node: Dict[str, Any]) -> bool:
+        """node 的子树中是否有节点匹配（:has），祖先只计算到 node 之下"""
+        stack = [(child, []) for child in reversed(node.get('directives', []))]
+        while stack:
+            current, ancestors = stack.pop()
+            if self.matches(current, False, ancestors):
+                return True
+            children = current.get('directives', [])
+            if children:
+                path = ancestors + [(current, False)]
+                stack.extend((child, path) for child in reversed(children))
+        return False
+
+    def required_names(self) -> Set[str]:
+        """匹配的站点中一定出现的指令名（用于站点索引预筛选）"""
+        names = set()
+        for compound in self.compounds:
+            names |= _compound_required_names(compound)
+        return names
+
+
+def _compound_required_names(compound: Compound) -> Set[str]:
+    names = set()
+    if compound.name not in (None, '*', 'site'):
+        names.add(compound.name)
+    for selector in compound.has:
+        names |= selector.required_names()
+    return names
+
+
+class Query:
+    """编译后的查询（逗号分隔的多个选择器，任意一个匹配即可）"""
+
+    def __init__(self, text: str, selectors: List[Selector]):
+        self.text = text
+        self.selectors = selectors
+        self.targets_sites = any(s.subject.name == 'site' for s in selectors)
+        self.targets_directives = any(s.subject.name != 'site' for s in selectors)
+
+    def candidate_sites(self, sites: List[Dict[str, Any]], by_directive: Optional[Dict[str, List[int]]]) -> List[int]:
+        """可能匹配的站点索引：每个选择器所需的指令名都出现在站点中"""
+        if by_directive is None:
+            return list(range(len(sites)))
+        candidates = set()
+        for selector in self.selectors:
+            names = selector.required_names()
+            if not names:
+                return list(range(len(sites)))
+            sets = [set(by_directive.get(name, ())) for name in names]
+            candidates |= set.intersection(*sets)
+        return sorted(candidates)
+
+    def run(self, sites: List[Dict[str, Any]], by_directive: Optional[Dict[str, List[int]]] = None,
+            limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        执行查询
+
+        Args:
+            sites: 站点列表
+            by_directive: 站点索引中的 指令名 -> 站点索引列表（可选，用于预筛选）
+            limit: 最多返回的匹配数量
+
+        返回: {"matches": [...], "total", "sites_scanned"}
+        """
+        candidates = self.candidate_sites(sites, by_directive)
+        matches = []
+        total = 0
+        for i in candidates:
+            site = sites[i]
+            address = (site.get('address') or '').strip()
+            if self.targets_sites and any(s.subject.name == 'site' and s.matches(site, True, []) for s in self.selectors):
+                total += 1
+                if limit is None or len(matches) < limit:
+                    matches.append({'site': address, 'site_index': i, 'path': [], 'directive': None})
+            if not self.targets_directives:
+                continue
+            root = [(site, True)]
+            stack = [(d, root, []) for d in reversed(site.get('directives', []))]
+            while stack:
+                directive, ancestors, path = stack.pop()
+                if any(s.subject.name != 'site' and s.matches(directive, False, ancestors) for s in self.selectors):
+                    total += 1
+                    if limit is None or len(matches) < limit:
+                        matches.append({
+                            'site': address,
+                            'site_index': i,
+                            'path': path,
+                            'directive': {'name': directive.get('name', ''), 'args': directive.get('args', [])}
+                        })
+                children = directive.get('directives', [])
+                if children:
+                    child_ancestors = ancestors + [(directive, False)]
+                    child_path = path + [directive_text(directive)]
+                    stack.extend((child, child_ancestors, child_path) for child in reversed(children))
+        return {'matches': matches, 'total': total, 'sites_scanned': len(candidates)}
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message: str):
+        raise SelectorError(f'{message}（位置 {self.pos}）: {self.text}')
+
+    def skip_space(self) -> bool:
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+        return self.pos > start
+
+    def peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def parse_query(self) -> List[Selector]:
+        selectors = [self.parse_selector()]
+        while self.peek() == ',':
+            self.pos += 1
+            selectors.append(self.parse_selector())
+        if self.pos != len(self.text):
+            self.error('无法解析')
+        return selectors
+
+    def parse_selector(self, relative: bool = False) -> Selector:
+        self.skip_space()
+        child_anchor = False
+        if relative and self.peek() == '>':
+            self.pos += 1
+            child_anchor = True
+            self.skip_space()
+        compounds = [self.parse_compound()]
+        combinators = []
+        while True:
+            had_space = self.skip_space()
+            ch = self.peek()
+            if ch == '>':
+                self.pos += 1
+                self.skip_space()
+                combinators.append('>')
+            elif had_space and ch and ch not in ',)':
+                combinators.append(' ')
+            else:
+                break
+            compounds.append(self.parse_compound())
+        return Selector(compounds, combinators, child_anchor)
+
+    def parse_compound(self) -> Compound:
+        compound = Compound()
+        start = self.pos
+        if self.peek() == '*':
+            self.pos += 1
+            compound.name = '*'
+        else:
+            match = NAME_RE.match(self.text, self.pos)
+            if match:
+                compound.name = match.group(0)
+                self.pos = match.end()
+        while True:
+            ch = self.peek()
+            if ch == '[':
+                self.parse_attr(compound)
+            elif self.text.startswith(':has(', self.pos):
+                self.pos += len(':has(')
+                compound.has.append(self.parse_selector(relative=True))
+                self.expect(')')
+            elif self.text.startswith(':not(', self.pos):
+                self.pos += len(':not(')
+                self.skip_space()
+                compound.nots.append(self.parse_compound())
+                self.skip_space()
+                self.expect(')')
+            else:
+                break
+        if self.pos == start:
+            self.error('缺少选择器')
+        return compound
+
+    def parse_attr(self, compound: Compound):
+        match = ATTR_RE.match(self.text, self.pos)
+        if not match:
+            self.error('属性条件格式错误')
+        attr, operator = match.group(1), match.group(2)
+        self.pos = match.end()
+        value = self.parse_value()
+        self.skip_space()
+        self.expect(']')
+        if operator == '~=':
+            try:
+                pattern = re.compile(value)
+            except re.error as e:
+                self.error(f'正则表达式无效: {e}')
+            test = pattern.search
+        else:
+            compare = OPERATORS[operator]
+            test = lambda v, target=value, compare=compare: compare(v, target)
+        compound.attrs.append((attr, test))
+
+    def parse_value(self) -> str:
+        ch = self.peek()
+        if ch in ('"', "'"):
+            end = self.text.find(ch, self.pos + 1)
+            if end < 0:
+                self.error('引号未闭合')
+            value = self.text[self.pos + 1:end]
+            self.pos = end + 1
+            return value
+        end = self.text.find(']', self.pos)
+        if end < 0:
+            self.error('缺少 ]')
+        value = self.text[self.pos:end].strip()
+        self.pos = end
+        return value
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            self.error(f'缺少 {ch}')
+        self.pos += 1
+
+
+@lru_cache(maxsize=256)
+def compile_query(text: str) -> Query:
+    """编译查询（按文本缓存），语法错误时抛出 SelectorError"""
+    text = (text or '').strip()
+    if not text:
+        raise SelectorError('查询不能为空')
+    return Query(text, _Parser(text).parse_query())
+
+
+def select(sites: List[Dict[str, Any]], query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """在站点列表上执行查询，返回匹配列表（供Python代码直接调用）"""
+    return compile_query(query).run(sites, limit=limit)['matches']
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+站点索引
+基于解析后的站点列表构建索引，支持分页、按关键字和指令过滤，
+以及基于倒排索引的全文搜索
+"""
+
+import re
+import json
+import heapq
+import hashlib
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r'[\w\-]+')
+
+# 不同类型匹配的权重：地址 > 指令 > 备注
+KIND_WEIGHTS = {"address": 3, "directive": 2, "notes": 1}
+
+
+class SiteIndex:
+    """站点索引（只读，文档变化后重新构建）"""
+
+    def __init__(self, sites: List[Dict[str, Any]]):
+        self.sites = sites
+        self.summaries = []
+        self.by_address = {}
+        self.by_directive = {}      # 指令名 -> 任意层级包含该指令的站点
+        self.by_top_directive = {}  # 指令名 -> 顶层包含该指令的站点
+        self._search_keys = []
+
+        for i, site in enumerate(sites):
+            address = (site.get("address") or "").strip()
+            notes = site.get("notes", "") or ""
+            directives = site.get("directives", [])
+
+            self.summaries.append({
+                "address": address,
+                "notes": notes,
+                "line_number": site.get("line_number"),
+                "end_line": site.get("end_line"),
+                "directives": [d.get("name", "") for d in directives]
+            })
+            self.by_address.setdefault(address, i)
+            self._search_keys.append(f"{address}\n{notes}".lower())
+
+            # 记录站点中任意层级出现过的指令
+            for name in self._collect_directive_names(directives):
+                self.by_directive.setdefault(name, []).append(i)
+            for name in dict.fromkeys(d.get("name", "") for d in directives):
+                if name:
+                    self.by_top_directive.setdefault(name, []).append(i)
+
+    def _collect_directive_names(self, directives: List[Dict[str, Any]]) -> Set[str]:
+        """递归收集指令名"""
+        names = set()
+        stack = list(directives)
+        while stack:
+            directive = stack.pop()
+            name = directive.get("name", "")
+            if name:
+                names.add(name)
+            stack.extend(directive.get("directives", []))
+        return names
+
+    def get(self, address: str) -> Optional[Dict[str, Any]]:
+        """按地址获取完整站点"""
+        i = self.by_address.get(address)
+        return self.sites[i] if i is not None else None
+
+    def query(self, q: str = "", directive: str = "", offset: int = 0, limit: int = 50,
+              nested: bool = False) -> Dict[str, Any]:
+        """
+        查询站点摘要
+
+        Args:
+            q: 地址或备注中包含的关键字（不区分大小写）
+            directive: 站点中必须包含的顶层指令名
+            offset: 起始位置
+            limit: 返回数量
+            nested: 为 True 时 directive 也匹配嵌套在块中的指令
+
+        返回: {"sites": [...], "total": 匹配总数}
+        """
+        if directive:
+            candidates = (self.by_directive if nested else self.by_top_directive).get(directive, [])
+        else:
+            candidates = range(len(self.sites))
+
+        if q:
+            q = q.lower()
+            candidates = [i for i in candidates if q in self._search_keys[i]]
+
+        total = len(candidates)
+        page = candidates[offset:offset + limit]
+        return {
+            "sites": [self.summaries[i] for i in page],
+            "total": total
+        }
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本拆分为小写词元（按非单词字符分割）"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def site_key(site: Dict[str, Any]) -> str:
+    """计算站点内容哈希（不含行号），内容不变的站点哈希不变"""
+    data = {k: v for k, v in site.items() if k not in ("line_number", "end_line")}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class SearchIndex:
+    """
+    倒排索引：词元 -> 站点 -> 条目
+
+    每个条目是站点地址、备注或一条指令（指令名 + 参数）。
+    索引按站点内容哈希（加上相同内容中的序号）增量更新，只有内容变化的站点需要重新建立索引。
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> {site_key: [entry_id, ...]}
+        self.site_entries = {}  # site_key -> [(path, kind, text), ...]
+        self.site_tokens = {}  # site_key -> set(token)
+        self.positions = {}  # site_key -> 当前文档中的站点索引
+        self.sites = []
+
+    def update(self, sites: List[Dict[str, Any]]):
+        """用新的站点列表更新索引（只重新索引变化的站点）"""
+        # 内容相同的站点（如重复的站点块）按出现顺序加序号区分，每个站点都有唯一的键
+        keys = []
+        occurrences = {}
+        for site in sites:
+            key = site_key(site)
+            n = occurrences.get(key, 0)
+            occurrences[key] = n + 1
+            keys.append(f"{key}:{n}")
+        current = set(keys)
+
+        for key in [k for k in self.site_tokens if k not in current]:
+            self._remove_site(key)
+        for site, key in zip(sites, keys):
+            if key not in self.site_tokens:
+                self._add_site(key, site)
+
+        self.positions = {key: i for i, key in enumerate(keys)}
+        self.sites = sites
+
+    def _add_site(self, key: str, site: Dict[str, Any]):
+        """为单个站点建立索引"""
+        entries = []
+        entries.append(((), "address", site.get("address", "") or ""))
+        notes = site.get("notes", "") or ""
+        if notes:
+            entries.append(((), "notes", notes))
+
+        stack = [((i,), d) for i, d in enumerate(site.get("directives", []))]
+        while stack:
+            path, directive = stack.pop()
+            text = " ".join([directive.get("name", "")] + [str(arg) for arg in directive.get("args", [])])
+            entries.append((path, "directive", text))
+            for i, sub in enumerate(directive.get("directives", [])):
+                stack.append((path + (i,), sub))
+
+        tokens = set()
+        for entry_id, (_, _, text) in enumerate(entries):
+            for token in set(tokenize(text)):
+                self.postings.setdefault(token, {}).setdefault(key, []).append(entry_id)
+                tokens.add(token)
+
+        self.site_entries[key] = entries
+        self.site_tokens[key] = tokens
+
+    def _remove_site(self, key: str):
+        """从索引中移除站点"""
+        for token in self.site_tokens.pop(key, ()):
+            sites = self.postings.get(token)
+            if sites is None:
+                continue
+            sites.pop(key, None)
+            if not sites:
+                del self.postings[token]
+        self.site_entries.pop(key, None)
+
+    def _match_tokens(self, token: str) -> List[Tuple[str, int]]:
+        """查找匹配的词元：优先精确匹配，否则按前缀匹配"""
+        if token in self.postings:
+            return [(token, 2)]
+        return [(t, 1) for t in self.postings if t.startswith(token)]
+
+    def search(self, q: str, limit: int = 50) -> Dict[str, Any]:
+        """
+        搜索（多个词元之间为 AND 关系）
+
+        返回: {"results": [...], "total": 匹配总数}
+        每个结果包含站点地址、指令路径、匹配文本、得分和高亮位置 [[start, end], ...]
+        """
+        q_tokens = tokenize(q)
+        if not q_tokens:
+            return {"results": [], "total": 0}
+
+        # 每个查询词元匹配到的 [(token, weight), ...]
+        token_matches = []
+        matched_tokens = set()
+        for q_token in dict.fromkeys(q_tokens):
+            matches = self._match_tokens(q_token)
+            if not matches:
+                return {"results": [], "total": 0}
+            token_matches.append(matches)
+            matched_tokens.update(token for token, _ in matches)
+
+        # 先按站点求交集（从匹配站点最少的词元开始）
+        site_sets = []
+        for matches in token_matches:
+            if len(matches) == 1:
+                site_sets.append(self.postings[matches[0][0]].keys())
+            else:
+                site_sets.append(set().union(*(self.postings[token] for token, _ in matches)))
+        order = sorted(range(len(site_sets)), key=lambda i: len(site_sets[i]))
+        candidate_sites = set(site_sets[order[0]])
+        for i in order[1:]:
+            candidate_sites.intersection_update(site_sets[i])
+
+        phrase = q.strip().lower()
+        check_phrase = len(token_matches) > 1 or phrase not in matched_tokens
+        total = 0
+        ranked = []
+        exact_only = all(len(matches) == 1 and matches[0][1] == 2 for matches in token_matches)
+        for key in candidate_sites:
+            if exact_only:
+                # 全部为精确匹配时直接对条目列表求交集
+                entry_ids = self.postings[token_matches[0][0][0]][key]
+                for matches in token_matches[1:]:
+                    entry_ids = set(entry_ids).intersection(self.postings[matches[0][0]][key])
+                scores = dict.fromkeys(entry_ids, 2 * len(token_matches))
+                if not scores:
+                    continue
+                self._rank_site(key, scores, phrase, check_phrase, ranked)
+                total += len(scores)
+                continue
+
+            # 站点内按条目求交集，并累加每个词元的权重
+            scores = None
+            for matches in token_matches:
+                weights = {}
+                for token, weight in matches:
+                    for entry_id in self.postings[token].get(key, ()):
+                        if weights.get(entry_id, 0) < weight:
+                            weights[entry_id] = weight
+                if scores is None:
+                    scores = weights
+                else:
+                    scores = {entry_id: score + weights[entry_id] for entry_id, score in scores.items() if entry_id in weights}
+                if not scores:
+                    break
+            if not scores:
+                continue
+
+            self._rank_site(key, scores, phrase, check_phrase, ranked)
+            total += len(scores)
+
+        results = []
+        for score, neg_position, path, key, entry_id in heapq.nlargest(limit, ranked, key=lambda r: (r[0], r[1])):
+            _, kind, text = self.site_entries[key][entry_id]
+            site = self.sites[-neg_position]
+            results.append({
+                "address": site.get("address", ""),
+                "line_number": site.get("line_number"),
+                "path": list(path),
+                "names": self._path_names(site, path),
+                "kind": kind,
+                "text": text,
+                "score": score,
+                "highlights": self._highlights(text, matched_tokens, phrase)
+            })
+        return {"results": results, "total": total}
+
+    def _rank_site(self, key: str, scores: Dict[int, int], phrase: str, check_phrase: bool, ranked: List[tuple]):
+        """计算站点内命中条目的最终得分"""
+        entries = self.site_entries[key]
+        position = self.positions[key]
+        for entry_id, score in scores.items():
+            path, kind, text = entries[entry_id]
+            score *= KIND_WEIGHTS[kind]
+            if not check_phrase or phrase in text.lower():
+                score += 3
+            ranked.append((score, -position, path, key, entry_id))
+
+    def _path_names(self, site: Dict[str, Any], path: Tuple[int, ...]) -> List[str]:
+        """将指令路径转换为指令名列表"""
+        names = []
+        directives = site.get("directives", [])
+        for i in path:
+            directive = directives[i]
+            names.append(directive.get("name", ""))
+            directives = directive.get("directives", [])
+        return names
+
+    def _highlights(self, text: str, tokens: Set[str], phrase: str) -> List[List[int]]:
+        """计算匹配位置（合并重叠区间）"""
+        lower = text.lower()
+        spans = [[m.start(), m.end()] for m in TOKEN_RE.finditer(lower) if m.group() in tokens]
+        start = lower.find(phrase) if phrase else -1
+        while start >= 0:
+            spans.append([start, start + len(phrase)])
+            start = lower.find(phrase, start + 1)
+
+        spans.sort()
+        merged = []
+        for span in spans:
+            if merged and span[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], span[1])
+            else:
+                merged.append(span)
+        return merged
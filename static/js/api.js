@@ -74,6 +74,10 @@ async function handleLogin() {
             if (typeof loadCaddyfile === 'function') {
                 loadCaddyfile();
             }
+            // 重新订阅服务器推送
+            if (typeof subscribeEvents === 'function') {
+                subscribeEvents();
+            }
         } else {
             errorEl.textContent = data.error || '登录失败';
             errorEl.classList.remove('d-none');
@@ -326,6 +330,7 @@ async function loadCaddyfile() {
                 window.sitesData = data.sites || [];
                 window.unparsedData = data.unparsed || [];
                 window.codeContent = data.content || '';
+                window.currentRevision = data.revision || null;
                 
                 // 更新文件路径
                 if (data.path) {
@@ -421,6 +426,8 @@ async function loadCaddyfile() {
 // 保存Caddyfile
 async function saveCaddyfile() {
     showLoading('正在保存配置...');
+    // 保存期间忽略服务器推送的版本变化（由本次保存产生）
+    window.isSavingCaddyfile = true;
     
     try {
         // 先同步Build模式到Code模式，确保数据一致
@@ -456,6 +463,9 @@ async function saveCaddyfile() {
             if (data.content) {
                 window.codeContent = data.content;
             }
+            if (data.revision) {
+                window.currentRevision = data.revision;
+            }
             
             // 标记为已保存
             if (typeof markAsSaved === 'function') {
@@ -476,7 +486,75 @@ async function saveCaddyfile() {
     } catch (error) {
         hideLoading();
         showMessage(error.message || '保存配置失败', 'error');
+    } finally {
+        window.isSavingCaddyfile = false;
+    }
+}
+
+// 订阅服务器推送事件（配置版本变化、外部修改、验证和重载结果）
+async function subscribeEvents() {
+    if (typeof EventSource === 'undefined' || window.eventSource) {
+        return;
     }
+    window.eventSource = true;  // 获取票据期间防止重复订阅
+    
+    // EventSource 无法设置请求头，先用 token 换取短期连接票据，URL中不包含 token
+    let url = '/api/events';
+    try {
+        const response = await fetchWithAuth('/api/events/ticket', { method: 'POST' });
+        const data = await response.json();
+        const params = new URLSearchParams();
+        if (data.ticket) {
+            params.set('ticket', data.ticket);
+        }
+        if (window.lastEventId) {
+            params.set('since', window.lastEventId);
+        }
+        if (params.toString()) {
+            url += '?' + params.toString();
+        }
+    } catch (error) {
+        // 未登录或网络错误，重新登录后再订阅
+        window.eventSource = null;
+        return;
+    }
+    
+    const source = new EventSource(url);
+    window.eventSource = source;
+    const trackId = (event) => {
+        if (event.lastEventId) {
+            window.lastEventId = event.lastEventId;
+        }
+    };
+    
+    source.addEventListener('revision', (event) => {
+        trackId(event);
+        const data = JSON.parse(event.data);
+        if (window.isSavingCaddyfile || !data.revision || data.revision === window.currentRevision) {
+            return;
+        }
+        if (window.isSaved) {
+            // 没有未保存的修改，直接加载最新版本
+            loadCaddyfile();
+        } else {
+            const addresses = (data.sites || []).map(site => site.address).join(', ');
+            showMessage(`配置已被其他会话修改${addresses ? '（' + addresses + '）' : ''}，当前有未保存的修改，请注意合并`, 'warning');
+        }
+    });
+    
+    source.addEventListener('external_change', (event) => {
+        trackId(event);
+        const data = JSON.parse(event.data);
+        showMessage(`检测到配置文件被外部修改: ${(data.paths || []).join(', ')}`, 'info');
+    });
+    
+    source.onerror = () => {
+        // 票据过期后自动重连会被拒绝（连接关闭），重新获取票据后订阅；token 失效时获取票据失败，停止订阅
+        if (source.readyState === EventSource.CLOSED) {
+            window.eventSource = null;
+            setTimeout(subscribeEvents, 3000);
+        }
+    };
 }
 
 // 验证Caddyfile
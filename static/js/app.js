@@ -428,6 +428,11 @@ function init() {
     // 加载Caddyfile
     loadCaddyfile();
     
+    // 订阅服务器推送，配置变化时自动刷新
+    if (typeof subscribeEvents === 'function') {
+        subscribeEvents();
+    }
+    
     // 加载模板列表
     if (typeof loadTemplates === 'function') {
         loadTemplates();
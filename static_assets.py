@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态资源指纹
+第一次使用时为静态文件计算内容哈希并生成带哈希的文件名（如 js/api.3f2a9c1b0d.js），
+每个文件第一次按某种编码请求时生成 gzip/brotli 压缩版本并缓存，启动时不做压缩；
+文件内容变化时 URL 随之变化，因此可以永久缓存。
+CSS 中引用的相对路径（字体等）同样替换为带哈希的文件名。
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import posixpath
+import threading
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 需要预压缩的文本类型（字体、图片等已压缩的格式不再压缩）
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map'}
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+URL_SUFFIX_RE = re.compile(r'([^?#]*)(.*)', re.S)
+
+HASH_LENGTH = 10
+
+# 请求时压缩使用中等级别：每个文件只压缩一次，最高级别（gzip 9 / brotli 11）耗时高出数倍而体积相差很小
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def fingerprint_name(path: str, digest: str) -> str:
+    """在扩展名前插入哈希: js/api.js -> js/api.<hash>.js"""
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{digest[:HASH_LENGTH]}{ext}'
+
+
+class Asset:
+    """一个带指纹的静态文件及其压缩版本（按需生成）"""
+
+    __slots__ = ('path', 'url_path', 'mimetype', 'etag', 'data', 'compressible', 'variants')
+
+    def __init__(self, path: str, url_path: str, data: bytes, compressible: bool):
+        self.path = path
+        self.url_path = url_path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = url_path.rsplit('.', 2)[-2]
+        self.data = data
+        self.compressible = compressible and bool(data)
+        self.variants = {}  # 编码 -> 压缩后的内容（压缩后没有变小时为 None）
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """指定编码的内容的 ETag：原始内容为指纹，压缩版本加上编码后缀（如 3f2a9c1b0d-br）"""
+        return f'{self.etag}-{encoding}' if encoding else self.etag
+
+    def encoded(self, encoding: str) -> Optional[bytes]:
+        """
+        指定编码（gzip、br）的内容，第一次请求时压缩并缓存；
+        不支持该编码、文件类型不需要压缩或压缩后没有变小时返回 None
+        """
+        if not self.compressible:
+            return None
+        if encoding in self.variants:
+            return self.variants[encoding]
+        if encoding == 'gzip':
+            compressed = gzip.compress(self.data, compresslevel=GZIP_LEVEL, mtime=0)
+        elif encoding == 'br' and brotli is not None:
+            compressed = brotli.compress(self.data, quality=BROTLI_QUALITY)
+        else:
+            return None
+        # 并发请求可能重复压缩同一个文件，结果相同，不需要加锁
+        result = self.variants[encoding] = compressed if len(compressed) < len(self.data) else None
+        return result
+
+
+class AssetManifest:
+    """
+    静态资源清单
+
+    urls: 原始路径 -> 带哈希的路径
+    assets: 带哈希的路径 -> Asset
+    """
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self.urls = {}
+        self.assets = {}
+        self._lock = threading.Lock()
+        self._built = False
+
+    def build(self):
+        """扫描静态目录并生成指纹（只执行一次）"""
+        with self._lock:
+            if self._built:
+                return
+            files = {}
+            for root, _, names in os.walk(self.static_folder):
+                for name in names:
+                    full_path = os.path.join(root, name)
+                    rel_path = os.path.relpath(full_path, self.static_folder).replace(os.sep, '/')
+                    with open(full_path, 'rb') as f:
+                        files[rel_path] = f.read()
+
+            # 先处理非CSS文件，CSS 中的引用需要用到它们的指纹
+            urls = {}
+            assets = {}
+            for rel_path in sorted(files, key=lambda p: p.endswith('.css')):
+                data = files[rel_path]
+                if rel_path.endswith('.css'):
+                    data = self._rewrite_css(rel_path, data, urls)
+                url_path = fingerprint_name(rel_path, hashlib.sha256(data).hexdigest())
+                ext = posixpath.splitext(rel_path)[1].lower()
+                urls[rel_path] = url_path
+                assets[url_path] = Asset(rel_path, url_path, data, ext in COMPRESSIBLE_EXTENSIONS)
+
+            self.urls = urls
+            self.assets = assets
+            self._built = True
+
+    def _rewrite_css(self, css_path: str, data: bytes, urls: Dict[str, str]) -> bytes:
+        """将 CSS 中 url() 引用的本地文件替换为带指纹的文件名（保留查询参数和锚点）"""
+        base = posixpath.dirname(css_path)
+        text = data.decode('utf-8')
+
+        def replace(match):
+            quote, target = match.group(1), match.group(2).strip()
+            if target.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                return match.group(0)
+            path, suffix = URL_SUFFIX_RE.match(target).groups()
+            resolved = posixpath.normpath(posixpath.join(base, path))
+            if resolved not in urls:
+                return match.group(0)
+            new_path = posixpath.relpath(urls[resolved], base)
+            return f'url({quote}{new_path}{suffix}{quote})'
+
+        return CSS_URL_RE.sub(replace, text).encode('utf-8')
+
+    def url_for(self, path: str) -> Optional[str]:
+        """原始路径对应的带指纹路径，不存在时返回 None"""
+        self.build()
+        return self.urls.get(path)
+
+    def get(self, url_path: str) -> Optional[Asset]:
+        self.build()
+        return self.assets.get(url_path)
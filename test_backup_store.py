@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试备份存储和分级保留策略"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from backup_store import BackupStore, make_delta, apply_delta, select_retained, parse_retention_policy
+
+DAY = 86400
+
+
+class RetentionTest(unittest.TestCase):
+    def versions(self, now: float, days: int, interval: int):
+        """从 days 天前到 now 每隔 interval 秒保存一个版本"""
+        times = range(int(now - days * DAY), int(now) + 1, interval)
+        return [{'seq': i + 1, 'time': t} for i, t in enumerate(times)]
+
+    def test_default_policy_keeps_one_version_per_day_for_30_days(self):
+        now = 1000 * DAY
+        versions = self.versions(now, 40, 600)
+        keep = select_retained(versions, parse_retention_policy('1h:all,1d:1h,30d:1d'), now=now)
+        kept = [v for v in versions if v['seq'] in keep]
+        # 最近1小时全部保留
+        recent = [v for v in versions if now - v['time'] <= 3600]
+        self.assertTrue(all(v['seq'] in keep for v in recent))
+        # 1天内每小时一个
+        hours = {int(v['time'] // 3600) for v in kept if 3600 < now - v['time'] <= DAY}
+        self.assertEqual(len(hours), 23)
+        # 1到30天前每天正好一个，更早的版本全部删除
+        older = [v for v in kept if now - v['time'] > DAY]
+        days = [int(v['time'] // DAY) for v in older]
+        self.assertEqual(len(days), len(set(days)))
+        self.assertEqual(set(days), set(range(int((now - 30 * DAY) // DAY), int((now - DAY) // DAY))))
+        self.assertTrue(all(now - v['time'] <= 30 * DAY for v in kept))
+
+    def test_max_versions_is_opt_in(self):
+        now = 1000 * DAY
+        versions = self.versions(now, 10, 600)
+        tiers = parse_retention_policy('1h:all,1d:1h,30d:1d')
+        keep = select_retained(versions, tiers, now=now)
+        self.assertGreater(len(keep), 30)
+        # 上限优先保留较新的版本
+        capped = select_retained(versions, tiers, now=now, max_versions=30)
+        self.assertEqual(capped, set(sorted(keep)[-30:]))
+
+
+def caddyfile(version: int) -> str:
+    """第 version 个版本的内容：每个版本修改一个站点并追加一个站点"""
+    sites = [f'site{i}.com {{\n    reverse_proxy localhost:{8000 + i}\n}}\n' for i in range(20)]
+    sites[version % 20] = f'site{version % 20}.com {{\n    respond "v{version}"\n}}\n'
+    sites.extend(f'new{i}.com {{\n    file_server\n}}\n' for i in range(version))
+    return '# 版本 %d\n' % version + '\n'.join(sites)
+
+
+class DeltaTest(unittest.TestCase):
+    def test_round_trip(self):
+        cases = [('', 'a'), ('a\nb\nc', 'a\nc'), ('a\nb', 'x\na\nb\ny'), ('a\n', 'a\n\n'),
+                 (caddyfile(1), caddyfile(7)), (caddyfile(7), '')]
+        for old, new in cases:
+            self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+
+class BackupStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def store(self, **kwargs) -> BackupStore:
+        return BackupStore(self.root, **kwargs)
+
+    def objects(self):
+        return sorted(os.listdir(os.path.join(self.root, 'objects')))
+
+    def test_delta_chain_longer_than_snapshot_interval(self):
+        store = self.store(snapshot_interval=4)
+        for version in range(1, 15):
+            store.add(caddyfile(version))
+        names = self.objects()
+        self.assertEqual(len(names), 14)
+        # 每4个版本保存一次完整快照，其余为增量
+        self.assertEqual(len([name for name in names if name.endswith('.full')]), 4)
+        # 新的实例没有缓存，每个版本都沿增量链从快照恢复
+        reopened = self.store(snapshot_interval=4)
+        for version in reopened.versions():
+            self.assertEqual(reopened.read(version['seq']), caddyfile(version['seq']))
+
+    def test_duplicate_content_reuses_object(self):
+        store = self.store()
+        first = store.add(caddyfile(1))
+        store.add(caddyfile(2))
+        third = store.add(caddyfile(1))
+        self.assertEqual(third['seq'], 3)
+        self.assertEqual(third['hash'], first['hash'])
+        self.assertEqual(len(self.objects()), 2)
+        self.assertEqual(self.store().read(3), caddyfile(1))
+
+    def test_prune_keeps_bases_of_retained_deltas(self):
+        store = self.store(snapshot_interval=20)
+        for version in range(1, 8):
+            store.add(caddyfile(version))
+        self.assertEqual(store.prune({2, 7}), 5)
+        self.assertEqual([v['seq'] for v in store.versions()], [2, 7])
+        # 版本7是以版本1的快照为起点的增量，链上被删除版本的对象仍然保留
+        self.assertEqual(len(self.objects()), 7)
+        reopened = self.store()
+        self.assertEqual(reopened.read(2), caddyfile(2))
+        self.assertEqual(reopened.read(7), caddyfile(7))
+        self.assertIsNone(reopened.read(3))
+
+    def test_prune_deletes_unreferenced_objects(self):
+        store = self.store(snapshot_interval=3)
+        for version in range(1, 8):
+            store.add(caddyfile(version))
+        store.prune({7})
+        # 每3个版本一个快照，版本7本身是快照，之前的对象都不再被引用
+        self.assertEqual(len(self.objects()), 1)
+        self.assertEqual(self.store().read(7), caddyfile(7))
+
+    def test_prune_keeps_versions_added_after_max_seq(self):
+        store = self.store()
+        for version in range(1, 4):
+            store.add(caddyfile(version))
+        store.prune({3}, max_seq=2)
+        self.assertEqual([v['seq'] for v in store.versions()], [3])
+        store.add(caddyfile(4))
+        self.assertEqual(store.prune(set(), max_seq=3), 1)
+        self.assertEqual([v['seq'] for v in store.versions()], [4])
+
+    def test_second_instance_sees_appended_versions(self):
+        first, second = self.store(), self.store()
+        self.assertEqual(first.add(caddyfile(1))['seq'], 1)
+        self.assertEqual(second.count(), 1)
+        # 第二个实例在第一个实例追加的版本之后分配序号，并以其为增量的基础
+        self.assertEqual(second.add(caddyfile(2))['seq'], 2)
+        self.assertEqual(first.add(caddyfile(3))['seq'], 3)
+        self.assertEqual([v['seq'] for v in second.versions()], [1, 2, 3])
+        self.assertEqual(second.read(3), caddyfile(3))
+        self.assertEqual(first.read(2), caddyfile(2))
+        # 另一个实例重写版本清单（清理）后重新加载
+        second.prune({3})
+        self.assertEqual([v['seq'] for v in first.versions()], [3])
+        self.assertEqual(first.add(caddyfile(4))['seq'], 4)
+        self.assertEqual([v['seq'] for v in second.versions()], [3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
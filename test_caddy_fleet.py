@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试 Caddy 集群推送（使用本地的模拟 admin API）"""
+
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from caddy_fleet import Fleet, FleetNode
+
+
+class StubAdmin:
+    """模拟一个 Caddy admin 端点，mode: ok / error / drip（持续缓慢返回数据）"""
+
+    def __init__(self, mode: str = 'ok'):
+        self.mode = mode
+        self.loads = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.loads.append(body.decode('utf-8'))
+                if stub.mode == 'error':
+                    data = b'adapting config: invalid directive'
+                    self.send_response(400)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                elif stub.mode == 'drip':
+                    # 每次只返回一个字节，单次读取不会超时，但总时间远超过超时时间
+                    self.send_response(200)
+                    self.send_header('Content-Length', '40')
+                    self.end_headers()
+                    for _ in range(40):
+                        try:
+                            self.wfile.write(b'.')
+                            self.wfile.flush()
+                        except OSError:
+                            return
+                        time.sleep(0.05)
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FleetTest(unittest.TestCase):
+    def start(self, *modes):
+        stubs = [StubAdmin(mode) for mode in modes]
+        for stub in stubs:
+            self.addCleanup(stub.close)
+        return stubs
+
+    def test_push_all_nodes(self):
+        stubs = self.start('ok', 'ok', 'ok')
+        result = Fleet([stub.url for stub in stubs], timeout=2).push('a.com {\n}\n')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['ok'], 3)
+        self.assertEqual([len(stub.loads) for stub in stubs], [1, 1, 1])
+
+    def test_failed_canary_skips_remaining_nodes(self):
+        stubs = self.start('error', 'ok', 'ok')
+        result = Fleet([stub.url for stub in stubs], timeout=2).push('a.com {\n}\n', canary=1)
+        self.assertFalse(result['success'])
+        self.assertEqual((result['ok'], result['failed'], result['skipped']), (0, 1, 2))
+        self.assertTrue(result['results'][0]['canary'])
+        self.assertIn('invalid directive', result['results'][0]['error'])
+        # 其余节点没有收到配置
+        self.assertEqual([len(stub.loads) for stub in stubs], [1, 0, 0])
+
+    def test_partial_failure_after_canary(self):
+        stubs = self.start('ok', 'error', 'ok')
+        result = Fleet([stub.url for stub in stubs], timeout=2).push('a.com {\n}\n', canary=1)
+        self.assertFalse(result['success'])
+        self.assertEqual((result['ok'], result['failed'], result['skipped']), (2, 1, 0))
+        self.assertEqual([r['ok'] for r in result['results']], [True, False, True])
+        self.assertEqual(result['results'][1]['status'], 400)
+
+    def test_push_selected_nodes(self):
+        stubs = self.start('ok', 'ok')
+        result = Fleet([stub.url for stub in stubs], timeout=2).push('a.com {\n}\n', nodes=[stubs[1].url])
+        self.assertEqual(result['ok'], 1)
+        self.assertEqual([len(stub.loads) for stub in stubs], [0, 1])
+
+    def test_timeout_is_total_per_node(self):
+        stubs = self.start('drip', 'ok')
+        started = time.monotonic()
+        result = Fleet([stub.url for stub in stubs], timeout=0.5).push('a.com {\n}\n')
+        elapsed = time.monotonic() - started
+        # 模拟节点需要约2秒才返回完整响应，总超时在约0.5秒后生效
+        self.assertLess(elapsed, 1.5)
+        self.assertFalse(result['results'][0]['ok'])
+        self.assertIn('TimeoutError', result['results'][0]['error'])
+        self.assertTrue(result['results'][1]['ok'])
+
+    def test_connection_is_reused(self):
+        stub, = self.start('ok')
+        node = FleetNode(stub.url)
+        self.assertEqual(node.request('POST', '/load', b'{}', {}, 2)[0], 200)
+        connection = node._pool.get_nowait()
+        node._release(connection)
+        self.assertEqual(node.request('POST', '/load', b'{}', {}, 2)[0], 200)
+        self.assertIs(node._pool.get_nowait(), connection)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试通过 admin API 增量应用配置（使用本地的模拟 admin API）"""
+
+import copy
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from caddy_incremental import IncrementalApplier, diff_config, common_ancestor
+
+
+def _resolve(config, path: str):
+    """返回路径的父节点和最后一段键（数组为整数索引）"""
+    segments = [unquote(segment) for segment in path.split('/')[1:]]
+    parent = config
+    for segment in segments[:-1]:
+        parent = parent[int(segment)] if isinstance(parent, list) else parent[segment]
+    key = segments[-1]
+    return parent, int(key) if isinstance(parent, list) else key
+
+
+def apply_operation(config, op):
+    """按 Caddy admin API 的语义在本地执行一个操作（PUT 到数组索引为插入）"""
+    if not op['path']:
+        return copy.deepcopy(op['value'])
+    parent, key = _resolve(config, op['path'])
+    if op['method'] == 'DELETE':
+        del parent[key]
+    elif op['method'] == 'PUT' and isinstance(parent, list):
+        parent.insert(key, copy.deepcopy(op['value']))
+    else:
+        parent[key] = copy.deepcopy(op['value'])
+    return config
+
+
+class StubAdmin:
+    """模拟 Caddy admin API：GET /config/、POST /load 和 PATCH /config/<路径>"""
+
+    def __init__(self, config=None, fail_patch: bool = False):
+        self.config = config
+        self.fail_patch = fail_patch
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status: int, data: bytes = b''):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def body(self):
+                return json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+            def do_GET(self):
+                stub.requests.append(('GET', self.path))
+                self.reply(200, b'' if stub.config is None else json.dumps(stub.config).encode('utf-8'))
+
+            def do_POST(self):
+                stub.requests.append(('POST', self.path))
+                stub.config = self.body()
+                self.reply(200)
+
+            def do_PATCH(self):
+                stub.requests.append(('PATCH', self.path))
+                value = self.body()
+                if stub.fail_patch:
+                    self.reply(400, b'loading new config: invalid')
+                    return
+                stub.config = apply_operation(stub.config, {
+                    'method': 'PATCH', 'path': self.path[len('/config'):], 'value': value})
+                self.reply(200)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def route(host: str, upstream: str = 'localhost:8080'):
+    return {'match': [{'host': [host]}],
+            'handle': [{'handler': 'reverse_proxy', 'upstreams': [{'dial': upstream}]}]}
+
+
+def server_config(*routes, listen=':443'):
+    # srv1 不参与变更，使变更的子树只占完整配置的一小部分
+    static = [route(f'static{i}.com') for i in range(5)]
+    return {'apps': {'http': {'servers': {'srv0': {'listen': [listen], 'routes': list(routes)},
+                                          'srv1': {'listen': [':8443'], 'routes': static}}},
+                     'tls': {'automation': {'policies': [{'subjects': ['a.com']}]}}}}
+
+
+class DiffConfigTest(unittest.TestCase):
+    def assertApplies(self, old, new):
+        operations = diff_config(old, new)
+        result = copy.deepcopy(old)
+        for op in operations:
+            result = apply_operation(result, op)
+        self.assertEqual(result, new)
+        return operations
+
+    def test_list_insert_and_delete_keep_order(self):
+        old = [route(f'{name}.com') for name in 'abcdef']
+        new = [route('x.com'), route('a.com'), route('c.com'), route('y.com'), route('z.com'),
+               route('d.com'), route('f.com', 'localhost:9090')]
+        operations = self.assertApplies(old, new)
+        # 对齐后不会重写未变化的路由
+        self.assertNotIn('/0', [op['path'] for op in operations if op['method'] == 'PATCH'])
+
+    def test_list_replace_and_shrink(self):
+        self.assertApplies([1, 2, 3, 4, 5], [2, 9, 5])
+        self.assertApplies([1, 2], [3, 4, 5, 1, 2, 6])
+        self.assertApplies([{'a': 1}], [])
+
+    def test_nested_keys(self):
+        self.assertApplies({'a': {'b': 1, 'c': [1, 2]}, 'd/e': 1}, {'a': {'c': [2, 3], 'f': 1}, 'd/e': 2})
+
+    def test_common_ancestor(self):
+        old = server_config(route('a.com'), route('b.com'))
+        new = server_config(route('a.com', 'localhost:9090'), route('c.com'), route('b.com'))
+        self.assertEqual(common_ancestor(diff_config(old, new)), '/apps/http/servers/srv0/routes')
+        new = server_config(route('a.com', 'localhost:9090'), route('b.com'))
+        self.assertEqual(common_ancestor(diff_config(old, new)),
+                         '/apps/http/servers/srv0/routes/0/handle/0/upstreams/0/dial')
+
+
+class IncrementalApplierTest(unittest.TestCase):
+    def start(self, config=None, **kwargs):
+        stub = StubAdmin(copy.deepcopy(config), **kwargs)
+        self.addCleanup(stub.close)
+        return stub
+
+    def test_single_patch_of_common_ancestor(self):
+        old = server_config(route('a.com'), route('b.com'), route('c.com'))
+        new = server_config(route('x.com'), route('a.com'), route('c.com', 'localhost:9090'))
+        stub = self.start(old)
+        result = IncrementalApplier(stub.url, timeout=2).apply(new)
+        self.assertTrue(result['ok'], result)
+        self.assertEqual(result['mode'], 'incremental')
+        self.assertGreater(result['operations'], 1)
+        self.assertEqual(result['patch_path'], '/apps/http/servers/srv0/routes')
+        # 多处变更只发送一个写请求，Caddy 只重载一次
+        self.assertEqual(stub.requests, [('GET', '/config/'), ('PATCH', '/config/apps/http/servers/srv0/routes')])
+        self.assertEqual(stub.config, new)
+
+    def test_unchanged(self):
+        config = server_config(route('a.com'))
+        stub = self.start(config)
+        result = IncrementalApplier(stub.url, timeout=2).apply(config)
+        self.assertEqual((result['ok'], result['mode']), (True, 'unchanged'))
+        self.assertEqual(stub.requests, [('GET', '/config/')])
+
+    def test_load_without_running_config(self):
+        stub = self.start(None)
+        config = server_config(route('a.com'))
+        result = IncrementalApplier(stub.url, timeout=2).apply(config)
+        self.assertEqual((result['ok'], result['mode']), (True, 'load'))
+        self.assertEqual(stub.requests, [('GET', '/config/'), ('POST', '/load')])
+        self.assertEqual(stub.config, config)
+
+    def test_load_when_changes_span_top_level(self):
+        old = server_config(route('a.com'))
+        new = copy.deepcopy(old)
+        new['admin'] = {'listen': 'localhost:2019'}
+        new['apps']['http']['servers']['srv0']['listen'] = [':9443']
+        stub = self.start(old)
+        result = IncrementalApplier(stub.url, timeout=2).apply(new)
+        self.assertEqual((result['ok'], result['mode']), (True, 'load'))
+        self.assertIsNone(result['patch_path'])
+        self.assertEqual([method for method, _ in stub.requests], ['GET', 'POST'])
+        self.assertEqual(stub.config, new)
+
+    def test_load_when_subtree_exceeds_ratio(self):
+        old = server_config(route('a.com'))
+        new = server_config(*[route(f'{i}.com') for i in range(20)])
+        stub = self.start(old)
+        result = IncrementalApplier(stub.url, timeout=2, max_ratio=0.5).apply(new)
+        self.assertEqual((result['ok'], result['mode']), (True, 'load'))
+        self.assertIn('50%', result['fallback_reason'])
+        self.assertEqual([method for method, _ in stub.requests], ['GET', 'POST'])
+        self.assertEqual(stub.config, new)
+
+    def test_load_when_patch_fails(self):
+        old = server_config(route('a.com'), route('b.com'))
+        new = server_config(route('a.com'), route('c.com'))
+        stub = self.start(old, fail_patch=True)
+        result = IncrementalApplier(stub.url, timeout=2).apply(new)
+        self.assertEqual((result['ok'], result['mode']), (True, 'load'))
+        self.assertIn('invalid', result['fallback_reason'])
+        self.assertEqual([method for method, _ in stub.requests], ['GET', 'PATCH', 'POST'])
+        self.assertEqual(stub.config, new)
+
+
+if __name__ == '__main__':
+    unittest.main()
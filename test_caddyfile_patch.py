@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试按行范围修改Caddyfile原文"""
+
+import copy
+import unittest
+
+from caddyfile_parser import parse_caddyfile
+from caddyfile_patch import patch_caddyfile, normalize_sites
+
+CONTENT = """# keep me
+{
+    email admin@example.com
+}
+
+# 备注：主站
+a.com {
+    # 反向代理
+    reverse_proxy localhost:8080
+    encode gzip
+}
+
+b.com
+{
+\troot * /var/www
+\tfile_server
+}
+
+c.com {
+    respond "hello world"
+}
+"""
+
+
+class PatchCaddyfileTest(unittest.TestCase):
+    def sites(self, content: str = CONTENT):
+        return copy.deepcopy(parse_caddyfile(content)['sites'])
+
+    def changed_lines(self, old: str, new: str):
+        """按行比较，返回 (删除的行, 新增的行)"""
+        old_lines, new_lines = old.split('\n'), new.split('\n')
+        return ([line for line in old_lines if line not in new_lines],
+                [line for line in new_lines if line not in old_lines])
+
+    def assertPatched(self, sites) -> str:
+        patched = patch_caddyfile(CONTENT, sites)
+        self.assertIsNotNone(patched)
+        self.assertEqual(normalize_sites(parse_caddyfile(patched)['sites']), normalize_sites(sites))
+        return patched
+
+    def test_unchanged(self):
+        self.assertEqual(patch_caddyfile(CONTENT, self.sites()), CONTENT)
+
+    def test_edit_one_site_changes_only_its_lines(self):
+        sites = self.sites()
+        sites[0]['directives'][0]['args'] = ['localhost:9090']
+        patched = self.assertPatched(sites)
+        self.assertEqual(self.changed_lines(CONTENT, patched),
+                         (['    reverse_proxy localhost:8080'], ['    reverse_proxy localhost:9090']))
+
+    def test_edit_keeps_brace_placement_and_tabs(self):
+        sites = self.sites()
+        sites[1]['directives'].append({'name': 'encode', 'args': ['zstd'], 'directives': []})
+        sites[1]['directives'][0]['args'] = ['*', '/srv/www']
+        patched = self.assertPatched(sites)
+        self.assertEqual(self.changed_lines(CONTENT, patched),
+                         (['\troot * /var/www'], ['\troot * /srv/www', '\tencode zstd']))
+        self.assertIn('b.com\n{\n', patched)
+
+    def test_add_site(self):
+        sites = self.sites()
+        sites.insert(2, {'address': 'd.com', 'notes': '新站点',
+                         'directives': [{'name': 'respond', 'args': ['ok'], 'directives': []}]})
+        patched = self.assertPatched(sites)
+        removed, added = self.changed_lines(CONTENT, patched)
+        self.assertEqual(removed, [])
+        self.assertEqual(added, ['# 备注：新站点', 'd.com', '    respond ok'])
+        # 原文的所有行按原顺序保留
+        self.assertTrue(patched.startswith(CONTENT.split('c.com')[0]))
+
+    def test_delete_site(self):
+        sites = self.sites()
+        del sites[0]
+        patched = self.assertPatched(sites)
+        self.assertNotIn('a.com', patched)
+        self.assertNotIn('主站', patched)
+        self.assertNotIn('反向代理', patched)
+        self.assertIn('# keep me', patched)
+        self.assertIn('b.com\n{\n\troot * /var/www', patched)
+        self.assertNotIn('\n\n\n', patched)
+
+    def test_add_and_delete_sites(self):
+        sites = self.sites()
+        sites[1:2] = [{'address': 'e.com', 'directives': [{'name': 'file_server', 'args': [], 'directives': []}]}]
+        sites.append({'address': 'f.com', 'directives': []})
+        patched = self.assertPatched(sites)
+        lines = patched.split('\n')
+        self.assertNotIn('b.com', lines)
+        addresses = [line.split(' ')[0] for line in lines if line.split(' ')[0].endswith('.com')]
+        self.assertEqual(addresses, ['a.com', 'e.com', 'c.com', 'f.com'])
+        self.assertIn('# keep me', patched)
+
+    def test_reparse_mismatch_returns_none(self):
+        # 以 # 开头的参数写入后会被解析为注释，校验不一致时由调用方完整生成
+        sites = self.sites()
+        sites[2]['directives'][0]['args'] = ['#x']
+        self.assertIsNone(patch_caddyfile(CONTENT, sites))
+
+    def test_changed_unparsed_returns_none(self):
+        self.assertIsNone(patch_caddyfile(CONTENT, self.sites(), ['{', 'debug', '}']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试多副本协调（使用 fakeredis 模拟Redis）"""
+
+import time
+import threading
+import unittest
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from redis_coordination import RedisLease, RevisionChannel, LockLost
+
+
+@unittest.skipIf(fakeredis is None, '未安装 fakeredis')
+class RedisLeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def client(self):
+        return fakeredis.FakeRedis(server=self.server, decode_responses=True)
+
+    def test_acquire_and_release(self):
+        lease = RedisLease(self.client(), 'lock')
+        self.assertTrue(lease.acquire(1))
+        self.assertFalse(RedisLease(self.client(), 'lock').acquire(0.1))
+        lease.release()
+        self.assertIsNone(self.client().get('lock'))
+        self.assertTrue(RedisLease(self.client(), 'lock').acquire(0.1))
+
+    def test_waiter_wakes_up_on_release(self):
+        holder = RedisLease(self.client(), 'lock')
+        self.assertTrue(holder.acquire(1))
+        threading.Timer(0.2, holder.release).start()
+        started = time.monotonic()
+        waiter = RedisLease(self.client(), 'lock')
+        self.assertTrue(waiter.acquire(5))
+        self.assertLess(time.monotonic() - started, 2)
+        waiter.release()
+
+    def test_lease_is_renewed_while_held(self):
+        lease = RedisLease(self.client(), 'lock', ttl_ms=300)
+        self.assertTrue(lease.acquire(1))
+        # 持有时间超过 ttl 数倍，锁仍然属于持有者
+        time.sleep(1)
+        self.assertEqual(self.client().get('lock'), lease.token)
+        self.assertFalse(RedisLease(self.client(), 'lock').acquire(0.1))
+        lease.ensure()
+        lease.release()
+        self.assertIsNone(self.client().get('lock'))
+
+    def test_renewal_stops_after_release(self):
+        lease = RedisLease(self.client(), 'lock', ttl_ms=300)
+        self.assertTrue(lease.acquire(1))
+        lease.release()
+        other = RedisLease(self.client(), 'lock', ttl_ms=300, auto_renew=False)
+        self.assertTrue(other.acquire(1))
+        time.sleep(0.5)
+        # 已释放的租约不会再续约（或删除）其他持有者的锁
+        self.assertIsNone(self.client().get('lock'))
+
+    def test_ensure_fails_after_lock_is_taken_over(self):
+        lease = RedisLease(self.client(), 'lock', ttl_ms=200, auto_renew=False)
+        self.assertTrue(lease.acquire(1))
+        time.sleep(0.3)
+        other = RedisLease(self.client(), 'lock')
+        self.assertTrue(other.acquire(1))
+        with self.assertRaises(LockLost):
+            lease.ensure()
+        # 释放过期的租约不影响新的持有者
+        lease.release()
+        self.assertEqual(self.client().get('lock'), other.token)
+        other.release()
+
+    def test_renewal_detects_lost_lock(self):
+        lease = RedisLease(self.client(), 'lock', ttl_ms=300)
+        self.assertTrue(lease.acquire(1))
+        self.client().set('lock', 'someone-else')
+        time.sleep(0.4)
+        self.assertTrue(lease.lost)
+        with self.assertRaises(LockLost):
+            lease.ensure()
+        lease.release()
+        self.assertEqual(self.client().get('lock'), 'someone-else')
+
+
+@unittest.skipIf(fakeredis is None, '未安装 fakeredis')
+class RevisionChannelTest(unittest.TestCase):
+    def test_publish_notifies_other_replicas(self):
+        server = fakeredis.FakeServer()
+        received = []
+        event = threading.Event()
+
+        def on_revision(message):
+            received.append(message)
+            event.set()
+
+        listener = RevisionChannel(fakeredis.FakeRedis(server=server, decode_responses=True), 'test:',
+                                   on_revision=on_revision)
+        listener.start()
+        publisher = RevisionChannel(fakeredis.FakeRedis(server=server, decode_responses=True), 'test:')
+        time.sleep(0.2)  # 等待订阅建立
+        self.assertEqual(publisher.publish('abc'), 1)
+        self.assertTrue(event.wait(2))
+        self.assertEqual(received[0]['revision'], 'abc')
+        self.assertEqual(received[0]['seq'], 1)
+        self.assertEqual(listener.current(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()